@@ -0,0 +1,355 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Optional
+
+from Controller.controller import CareBotController, \
+    MESSAGE_ASSISTANCE_REQUEST_SENT, MESSAGE_GOODBYE, MESSAGE_READY
+from Models.model import CareBotModel
+from Models.telemetry import telemetry
+from View.view import CareBotView
+
+# Threads running blocking work, enough for listening, both
+# classifications, the reply and an alert at the same time
+BLOCKING_WORKERS = 6
+
+
+class AsyncCareBotController(CareBotController):
+    """
+    A controller driven by an asyncio event loop.
+
+    Blocking work, i.e. audio capture and recognition, LLM calls, speech
+    synthesis, playback and MMS, runs on a thread pool so it can overlap.
+    For each input the urgency and end of conversation checks run
+    concurrently with the generation and playback of the reply, which is
+    cancelled, stopping its playback, as soon as the input turns out to need
+    urgent assistance or to end the conversation.
+
+    Messages are displayed from the event loop thread only, since the
+    Streamlit UI can not be updated from other threads.
+    """
+
+    def __init__(self, model: CareBotModel, view: CareBotView,
+                 is_stream_response: bool = False,
+                 is_combined_turn: bool = False,
+                 is_barge_in: bool = False):
+        super().__init__(model, view, is_stream_response=is_stream_response,
+                         is_combined_turn=is_combined_turn,
+                         is_barge_in=is_barge_in)
+        self.__executor = ThreadPoolExecutor(
+            max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+    async def run_blocking(self, function: Callable[..., Any],
+                           *args: Any) -> Any:
+        """
+        Runs a blocking function on the thread pool.
+
+        Args:
+            function (Callable): The function to run.
+            *args: The arguments of the function.
+
+        Returns:
+            Any: The return value of the function.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.__executor, functools.partial(function, *args))
+
+    async def play_response_async(self, response_text: str,
+                                  is_cache: bool = False) -> None:
+        """
+        Synthesizes and plays a message. Cancelling the call stops the
+        playback.
+
+        Args:
+            response_text (str): The message to play.
+            is_cache (bool, optional): Store the synthesized audio in the
+            cache. Defaults to False.
+        """
+        stop_event = threading.Event()
+        try:
+            await self.run_blocking(
+                self.get_model().process_and_play_response, response_text,
+                is_cache, stop_event)
+        except asyncio.CancelledError:
+            stop_event.set()
+            raise
+
+    async def play_reply_async(self, response_text: str) -> None:
+        """
+        Plays a reply, which the Resident may interrupt if barge-in is
+        enabled. Cancelling the call stops the playback.
+
+        Args:
+            response_text (str): The reply to play.
+        """
+        stop_event = threading.Event()
+        self.start_barge_in(stop_event, response_text)
+        try:
+            await self.run_blocking(
+                self.get_model().process_and_play_response, response_text,
+                False, stop_event)
+        except asyncio.CancelledError:
+            stop_event.set()
+            self.finish_barge_in(is_interrupted=False)
+            raise
+
+        await self.run_blocking(self.finish_barge_in)
+
+    @telemetry.traced("controller.respond_async")
+    async def respond_async(self, input_text: str) -> str:
+        """
+        Generates a reply to the input text, displays it and plays it,
+        without saving it to the conversation history. Cancelling the call
+        stops the playback.
+
+        Args:
+            input_text (str): The Resident's input text to respond to.
+
+        Returns:
+            str: The reply.
+        """
+        if not self.get_is_stream_response():
+            response_text = await self.run_blocking(
+                self.get_model().generate_response, input_text,
+                self.get_conversation_history(), False)
+            self.display_message(response_text, False)
+            await self.play_reply_async(response_text)
+            return response_text
+
+        start_time = time.perf_counter()
+        sentences: List[str] = []
+        stop_event = threading.Event()
+
+        def collect_sentences() -> Iterator[str]:
+            for sentence in self.get_model().generate_response_stream(
+                    input_text, self.get_conversation_history(), False):
+                sentences.append(sentence)
+                if self.get_is_barge_in():
+                    self.get_model().add_barge_in_spoken_text(sentence)
+                yield sentence
+
+        self.start_barge_in(stop_event)
+        try:
+            time_to_first_audio: Optional[float] = await self.run_blocking(
+                self.get_model().process_and_play_stream,
+                collect_sentences(), start_time, stop_event)
+        except asyncio.CancelledError:
+            stop_event.set()
+            self.finish_barge_in(is_interrupted=False)
+            raise
+
+        await self.run_blocking(self.finish_barge_in)
+
+        response_text = " ".join(sentences)
+        self.display_message(response_text, False)
+
+        if time_to_first_audio is not None:
+            self.record_time_to_first_audio(time_to_first_audio)
+
+        return response_text
+
+    @telemetry.traced("controller.alert_assistance_request_sent_async")
+    async def alert_assistance_request_sent_async(self,
+                                                  input_text: str) -> None:
+        """
+        Sends a short alert to the caregiver, alerts the Resident that an
+        assistance request has been sent and sends the summarized
+        conversation to the caregiver as a follow-up.
+
+        Args:
+            input_text (str): The Resident's input that needs assistance.
+        """
+        response_text = MESSAGE_ASSISTANCE_REQUEST_SENT
+
+        await self.run_blocking(self.send_urgent_alert, input_text)
+        summary_task = asyncio.ensure_future(
+            self.run_blocking(self.get_caregiver_summary))
+
+        await self.run_blocking(self.get_model().play_cue, "alert")
+        self.display_message(response_text, False)
+        await self.play_response_async(response_text, is_cache=True)
+
+        summarized_conversation = await summary_task
+        self.display_message("Summarized Conversation sent to caregiver:\n"
+                             + summarized_conversation + "\n", False)
+        await self.run_blocking(self.get_model().enqueue_mms,
+                                summarized_conversation)
+
+    @telemetry.traced("controller.say_goodbye_async")
+    async def say_goodbye_async(self) -> None:
+        """
+        Displays and plays a goodbye message.
+        """
+        self.display_message(MESSAGE_GOODBYE, False)
+        await self.play_response_async(MESSAGE_GOODBYE, is_cache=True)
+
+    @telemetry.traced("controller.get_voice_input_async")
+    async def get_voice_input_async(self,
+                                    is_listen_keywords: bool = False) -> str:
+        """
+        Gets voice input from the user, like get_voice_input.
+
+        Args:
+            is_listen_keywords (bool, optional): A flag indicating whether the
+            system should listen for keywords. Defaults to False.
+
+        Returns:
+            str: The voice input from the user.
+        """
+        if is_listen_keywords:
+            self.clear_conversation_history()
+            self.display_message(MESSAGE_READY, False)
+            if self.get_model().is_synthesis_ready(MESSAGE_READY):
+                await self.play_response_async(MESSAGE_READY, is_cache=True)
+            else:
+                await self.run_blocking(self.get_model().play_cue, "ready")
+            await self.run_blocking(self.get_model().play_cue, "listen")
+            self.notify_listening()
+            input_text = await self.run_blocking(
+                self.get_model().listen_for_keywords)
+        else:
+            # The Resident already spoke by interrupting the last reply
+            input_text = self.pop_barge_in_input()
+            if input_text is None:
+                await self.run_blocking(self.get_model().play_cue, "listen")
+                self.notify_listening()
+                input_text = await self.run_blocking(
+                    self.get_model().transcribe_audio)
+
+        self.record_input_time()
+        return input_text
+
+    @telemetry.traced("controller.handle_combined_turn_async")
+    async def handle_combined_turn_async(self, input_text: str) -> bool:
+        """
+        Handles a conversational turn with a single model call, like
+        handle_combined_turn.
+
+        Args:
+            input_text (str): The Resident's input text.
+
+        Returns:
+             true if the conversation ended.
+        """
+        turn_result = await self.run_blocking(
+            self.get_model().generate_turn, input_text,
+            self.get_conversation_history())
+
+        if turn_result["urgent"]:
+            await self.alert_assistance_request_sent_async(input_text)
+            return True
+
+        if turn_result["end_conversation"]:
+            await self.say_goodbye_async()
+            return True
+
+        self.display_message(turn_result["reply"], False)
+        await self.play_reply_async(turn_result["reply"])
+        self.get_model().update_caregiver_summary(
+            self.get_conversation_history())
+        self.checkpoint_conversation()
+        return False
+
+    @telemetry.traced("controller.handle_turn_async")
+    async def handle_turn_async(self, input_text: str) -> bool:
+        """
+        Handles a conversational turn, classifying the input while the reply
+        is generated and played.
+
+        The urgency check takes priority: as soon as it returns true the
+        reply is cancelled and the caregiver is alerted. The intent to end
+        the conversation is only acted upon once the input is known not to
+        be urgent. The reply is saved to the conversation history once it
+        has been played and neither case applies.
+
+        Args:
+            input_text (str): The Resident's input text.
+
+        Returns:
+             true if the conversation ended.
+        """
+        if self.get_is_combined_turn():
+            return await self.handle_combined_turn_async(input_text)
+
+        urgent_task = asyncio.ensure_future(self.run_blocking(
+            self.get_model().is_urgent_assistance_needed, input_text))
+        end_task = asyncio.ensure_future(self.run_blocking(
+            self.get_model().is_intent_to_end_conversation, input_text))
+        reply_task = asyncio.ensure_future(self.respond_async(input_text))
+
+        try:
+            if await urgent_task:
+                reply_task.cancel()
+                self.get_model().append_conversation_history(
+                    input_text, "", self.get_conversation_history())
+                await self.alert_assistance_request_sent_async(input_text)
+                return True
+
+            if await end_task:
+                reply_task.cancel()
+                self.get_model().append_conversation_history(
+                    input_text, "", self.get_conversation_history())
+                await self.say_goodbye_async()
+                return True
+
+            response_text = await reply_task
+        finally:
+            # Cancelling a finished task has no effect
+            for task in [urgent_task, end_task, reply_task]:
+                task.cancel()
+
+        self.get_model().append_conversation_history(
+            input_text, response_text, self.get_conversation_history())
+        self.get_model().update_caregiver_summary(
+            self.get_conversation_history())
+        self.checkpoint_conversation()
+        return False
+
+    @telemetry.traced("controller.handle_conversation_async")
+    async def handle_conversation_async(self, input_text: str) -> None:
+        """
+        Manages the conversation flow until the Resident needs urgent
+        assistance, intends to end the conversation or stops replying.
+
+        Args:
+            input_text (str): The Resident's first input text.
+        """
+        NO_REPLY_THRESH_HOLD: int = 2
+        no_replies_count: int = 0
+
+        while True:
+            self.display_message(input_text)
+
+            if await self.handle_turn_async(input_text):
+                break
+
+            input_text = await self.get_voice_input_async()
+
+            if len(input_text) == 0 or input_text is None:
+                no_replies_count += 1
+
+            if no_replies_count >= NO_REPLY_THRESH_HOLD:
+                await self.say_goodbye_async()
+                break
+
+    async def run(self, is_resume: bool = False) -> None:
+        """
+        Listens for keywords and handles the conversation each one starts,
+        forever. The keyword utterance is classified by the conversation's
+        first turn.
+
+        Args:
+            is_resume (bool, optional): First resume the conversation saved
+            before a restart, if any. Defaults to False.
+        """
+        if is_resume and self.resume_conversation():
+            input_text = await self.get_voice_input_async()
+            if len(input_text) != 0:
+                await self.handle_conversation_async(input_text)
+
+        while True:
+            input_text = await self.get_voice_input_async(
+                is_listen_keywords=True)
+            await self.handle_conversation_async(input_text)
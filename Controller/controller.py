@@ -1,16 +1,67 @@
 import os
 import sys
-from typing import List, Dict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
 
 from Models.model import CareBotModel
+from Models.telemetry import telemetry
 from View.view import CareBotView
 
+# Fixed messages spoken by Care-Bot, synthesized once and cached
+MESSAGE_ASSISTANCE_REQUEST_SENT = "It seems you require assistance. Your " \
+                                  "request for assistance has been sent to " \
+                                  "your caregiver."
+MESSAGE_GOODBYE = "Thank you. It seems you do not require further " \
+                  "assistance. " \
+                  "Feel free to chat with me anytime using my name " \
+                  "Care-Bot. " \
+                  "Goodbye for now.\n"
+MESSAGE_READY = "\nCare-Bot is ready and is listening.\n"
+MESSAGE_RESTARTING = "Care-Bot is restarting due to a fatal error.\n"
+
+SYSTEM_PHRASES: List[str] = [
+    MESSAGE_ASSISTANCE_REQUEST_SENT,
+    MESSAGE_GOODBYE,
+    MESSAGE_READY,
+    MESSAGE_RESTARTING,
+]
+
+time_to_first_audio_seconds = telemetry.histogram(
+    "carebot_time_to_first_audio_seconds",
+    "Time from the start of a streamed reply to its first audio.")
+alert_latency_seconds = telemetry.histogram(
+    "carebot_alert_latency_seconds",
+    "Time from an urgent input to the alert sent to the caregiver.")
+alerts_sent = telemetry.counter(
+    "carebot_alerts_total", "Urgent alerts sent to the caregiver.")
+restarts = telemetry.counter(
+    "carebot_restarts_total", "Restarts after a fatal error, by kind.")
+
 
 class CareBotController:
-    def __init__(self, model: CareBotModel, view: CareBotView):
+    def __init__(self, model: CareBotModel, view: CareBotView,
+                 is_stream_response: bool = False,
+                 is_combined_turn: bool = False,
+                 is_barge_in: bool = False):
         self.__model = model
         self.__view = view
         self.__conversation_history: List[Dict[str, str]] = []
+        self.__is_stream_response = is_stream_response
+        self.__is_combined_turn = is_combined_turn
+        self.__is_barge_in = is_barge_in
+        # Utterance in which the Resident interrupted the last reply
+        self.__barge_in_input: Optional[str] = None
+        self.__time_to_first_audio: List[float] = []
+        # Time the Resident's last input was recognized, and the time from
+        # each urgent input to the first message sent to the caregiver
+        self.__input_time: Optional[float] = None
+        self.__alert_latency: List[float] = []
+        # Called every time Care-Bot starts listening to the Resident
+        self.__on_listening: Optional[Callable[[], None]] = None
+        self.__classification_executor = ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="classification")
 
     def get_model(self) -> CareBotModel:
         """
@@ -41,35 +92,198 @@ class CareBotController:
         """
         return self.__conversation_history
 
-    def alert_assistance_request_sent(self):
+    def get_is_stream_response(self) -> bool:
+        """
+        Returns whether responses are streamed and played sentence by
+        sentence.
+
+        Returns:
+            bool: True if streaming mode is enabled.
+        """
+        return self.__is_stream_response
+
+    def get_is_combined_turn(self) -> bool:
+        """
+        Returns whether each turn uses a single model call for the reply,
+        urgency and intent to end the conversation.
+
+        Returns:
+            bool: True if combined turn mode is enabled.
+        """
+        return self.__is_combined_turn
+
+    def get_is_barge_in(self) -> bool:
+        """
+        Returns whether Care-Bot keeps listening while it speaks a reply, so
+        the Resident can interrupt it.
+
+        Returns:
+            bool: True if barge-in is enabled.
+        """
+        return self.__is_barge_in
+
+    def get_time_to_first_audio(self) -> List[float]:
+        """
+        Returns the time to first audio of every streamed turn.
+
+        Returns:
+            List[float]: The time in seconds between the start of each
+            streamed turn and the moment its first sentence started playing.
+        """
+        return self.__time_to_first_audio
+
+    def get_alert_latency(self) -> List[float]:
+        """
+        Returns the time from every urgent input to the first message sent
+        to the caregiver.
+
+        Returns:
+            List[float]: The times in seconds between the recognition of
+            each urgent input and the moment its short alert was sent.
+        """
+        return self.__alert_latency
+
+    def set_on_listening(self,
+                         on_listening: Optional[Callable[[], None]]) -> None:
+        """
+        Sets a function called every time Care-Bot starts listening to the
+        Resident, e.g. to measure the time a restart takes.
+
+        Args:
+            on_listening (Callable, optional): The function, or None.
+        """
+        self.__on_listening = on_listening
+
+    def notify_listening(self) -> None:
+        """
+        Calls the function set by set_on_listening, if any.
+        """
+        if self.__on_listening is not None:
+            self.__on_listening()
+
+    def checkpoint_conversation(self) -> None:
+        """
+        Saves the conversation history to disk, so the conversation can
+        resume if Care-Bot restarts.
+        """
+        self.get_model().save_conversation_checkpoint(
+            self.get_conversation_history())
+
+    def resume_conversation(self) -> bool:
+        """
+        Restores the conversation history saved before a restart, if the
+        conversation was still going on.
+
+        Returns:
+            bool: True if a conversation was restored.
+        """
+        conversation_history = self.get_model().load_conversation_checkpoint()
+        if not conversation_history:
+            return False
+
+        self.get_conversation_history()[:] = conversation_history
+        for message in conversation_history:
+            self.display_message(message["content"],
+                                 message["role"] == "user")
+        return True
+
+    def record_time_to_first_audio(self, time_to_first_audio: float) -> None:
+        """
+        Records the time from the start of a streamed reply to its first
+        audio.
+
+        Args:
+            time_to_first_audio (float): The time in seconds.
+        """
+        self.get_time_to_first_audio().append(time_to_first_audio)
+        time_to_first_audio_seconds.observe(time_to_first_audio)
+        print(f"Time to first audio: {time_to_first_audio:.2f} seconds")
+
+    def record_input_time(self) -> None:
+        """
+        Records that an input of the Resident has just been recognized.
+        """
+        self.__input_time = time.perf_counter()
+
+    def send_urgent_alert(self, input_text: str) -> None:
+        """
+        Sends a short alert to the caregiver right away, without waiting for
+        the summary of the conversation, and records the time from the input
+        to the moment the alert is sent.
+
+        Args:
+            input_text (str): The Resident's input that needs assistance.
+        """
+        input_time = self.__input_time
+
+        def on_sent() -> None:
+            alerts_sent.inc()
+            if input_time is None:
+                return
+            alert_latency = time.perf_counter() - input_time
+            self.get_alert_latency().append(alert_latency)
+            alert_latency_seconds.observe(alert_latency)
+            print(f"Time to caregiver alert: {alert_latency:.2f} seconds")
+
+        self.get_model().enqueue_mms(
+            self.get_model().build_urgent_alert(input_text), on_sent)
+
+    def get_caregiver_summary(self) -> str:
+        """
+        Returns the summary of the conversation for the caregiver, which is
+        kept up to date after every turn, or the transcript of the
+        conversation if no summary could be written.
+
+        Returns:
+            str: The summary.
+        """
+        summary = self.get_model().get_caregiver_summary(
+            self.get_conversation_history())
+        if summary:
+            return summary
+        return "Conversation:\n" + self.get_model().format_transcript(
+            self.get_conversation_history())
+
+    @telemetry.traced("controller.alert_assistance_request_sent")
+    def alert_assistance_request_sent(self, input_text: str = ""):
         """
         Alerts that an assistance request has been sent to the caregiver.
 
         This function performs several actions:
+        - Sends a short alert to the caregiver via MMS immediately.
+
         - Notifies the user through both a visual message in the Streamlit
           app and audio feedback that their request for assistance has been
           communicated to their caregiver.
 
-        - Summarizes the conversation history and sends it to the caregiver via
-          MMS
-        """
-        response_text = "It seems you require assistance. Your request for " \
-                        "assistance has been sent to your caregiver."
+        - Sends the summary of the conversation history to the caregiver via
+          MMS as a follow-up. The summary is updated after every turn, so
+          only the latest messages remain to be summarized.
 
-        self.display_message(response_text, False)
+        Messages are handed to the outbox, which sends them in the
+        background, so a slow network does not delay the Resident.
 
-        # Summarising conversation and sending MMS to resident
-        summarized_conversation = self.get_model(
-        ).summarize_conversation_history(
-            self.get_conversation_history())
+        Args:
+            input_text (str, optional): The Resident's input that needs
+            assistance.
+        """
+        response_text = MESSAGE_ASSISTANCE_REQUEST_SENT
 
-        summary = "Summarized Conversation sent to caregiver:\n" + \
-                  summarized_conversation + "\n"
+        self.send_urgent_alert(input_text)
+        summary_future = self.__classification_executor.submit(
+            self.get_caregiver_summary)
+
+        self.get_model().play_cue("alert")
+        self.display_message(response_text, False)
+        self.get_model().process_and_play_response(response_text,
+                                                   is_cache=True)
 
-        self.display_message(summary, False)
-        self.get_model().process_and_play_response(response_text)
-        self.get_model().send_mms(summarized_conversation)
+        summarized_conversation = summary_future.result()
+        self.display_message("Summarized Conversation sent to caregiver:\n"
+                             + summarized_conversation + "\n", False)
+        self.get_model().enqueue_mms(summarized_conversation)
 
+    @telemetry.traced("controller.handle_urgent_assistance")
     def handle_urgent_assistance(self, input_text: str):
         """
         Handles the scenario when urgent assistance is needed.
@@ -77,15 +291,23 @@ class CareBotController:
              true if urgent assistance case was handled.
         """
         if self.get_model().is_urgent_assistance_needed(input_text):
-            self.get_model()\
-                .append_conversation_history(
-                input_text, "", self.get_conversation_history())
-            self.display_message(input_text)
-            self.alert_assistance_request_sent()
+            self.on_urgent_assistance_needed(input_text)
             return True
         else:
             return False
 
+    def on_urgent_assistance_needed(self, input_text: str) -> None:
+        """
+        Records the input text that needs urgent assistance in the
+        conversation history, displays it and alerts the caregiver.
+        """
+        self.get_model()\
+            .append_conversation_history(
+            input_text, "", self.get_conversation_history())
+        self.display_message(input_text)
+        self.alert_assistance_request_sent(input_text)
+
+    @telemetry.traced("controller.handle_intent_to_end_conversation")
     def handle_intent_to_end_conversation(self, input_text: str):
         """
         Handles the scenario when the Resident displays the intent to end the
@@ -94,15 +316,87 @@ class CareBotController:
              true if urgent assistance case was handled.
         """
         if self.get_model().is_intent_to_end_conversation(input_text):
-            self.get_model()\
-                .append_conversation_history(
-                input_text, "", self.get_conversation_history())
-            self.display_message(input_text)
-            self.say_goodbye()
+            self.on_intent_to_end_conversation(input_text)
             return True
         else:
             return False
 
+    def on_intent_to_end_conversation(self, input_text: str) -> None:
+        """
+        Records the input text that ends the conversation in the
+        conversation history, displays it and says goodbye.
+        """
+        self.get_model()\
+            .append_conversation_history(
+            input_text, "", self.get_conversation_history())
+        self.display_message(input_text)
+        self.say_goodbye()
+
+    @telemetry.traced("controller.handle_classification")
+    def handle_classification(self, input_text: str) -> bool:
+        """
+        Checks whether the input text needs urgent assistance or ends the
+        conversation, running both checks concurrently.
+
+        The urgency check takes priority: as soon as it returns true the
+        caregiver is alerted, without waiting for the other check. The
+        intent to end the conversation is only acted upon once the input is
+        known not to be urgent.
+
+        Args:
+            input_text (str): The Resident's input text.
+
+        Returns:
+             true if either case was handled.
+        """
+        urgent_future = self.__classification_executor.submit(
+            self.get_model().is_urgent_assistance_needed, input_text)
+        end_future = self.__classification_executor.submit(
+            self.get_model().is_intent_to_end_conversation, input_text)
+
+        if urgent_future.result():
+            end_future.cancel()
+            self.on_urgent_assistance_needed(input_text)
+            return True
+
+        if end_future.result():
+            self.on_intent_to_end_conversation(input_text)
+            return True
+
+        return False
+
+    @telemetry.traced("controller.handle_combined_turn")
+    def handle_combined_turn(self, input_text: str) -> bool:
+        """
+        Handles a conversational turn with a single model call that returns
+        the reply together with the urgency and end of conversation flags.
+
+        If urgent assistance is needed the caregiver is alerted, if the
+        Resident intends to end the conversation Care-Bot says goodbye, and
+        otherwise the reply is displayed and played.
+
+        Args:
+            input_text (str): The Resident's input text.
+
+        Returns:
+             true if the conversation ended.
+        """
+        turn_result = self.get_model().generate_turn(
+            input_text, self.get_conversation_history())
+
+        if turn_result["urgent"]:
+            self.alert_assistance_request_sent(input_text)
+            return True
+
+        if turn_result["end_conversation"]:
+            self.say_goodbye()
+            return True
+
+        self.display_message(turn_result["reply"], False)
+        self.play_reply(turn_result["reply"])
+        return False
+
+    @telemetry.traced("controller.handle_conversation")
     def handle_conversation(self, input_text: str):
         """
         Manages the conversation flow, including generating responses and
@@ -122,12 +416,18 @@ class CareBotController:
                   replies.
                 - If the count of no replies exceeds the threshold, say goodbye
                   and exit the loop.
-                - If the input text indicates the intent to end the
-                  conversation or urgent assistance is needed:
+                - Check concurrently whether the input text indicates the
+                  intent to end the conversation or urgent assistance is
+                  needed:
                     - Display the input text.
-                    - If the intent is to end the conversation, say goodbye.
                     - If urgent assistance is needed, send an alert and exit
                       the loop.
+                    - If the intent is to end the conversation, say goodbye
+                      and exit the loop.
+
+        In combined turn mode the reply, urgency and intent to end the
+        conversation are obtained together for each input by
+        handle_combined_turn instead.
         """
         NO_REPLY_THRESH_HOLD: int = 2
         no_replies_count: int = 0
@@ -135,11 +435,22 @@ class CareBotController:
         while True:
             self.display_message(input_text)
 
-            response_text = self.get_model().generate_response(
-                input_text, self.get_conversation_history())
+            if self.get_is_combined_turn():
+                if self.handle_combined_turn(input_text):
+                    break
+            elif self.get_is_stream_response():
+                self.stream_and_play_response(input_text)
+            else:
+                response_text = self.get_model().generate_response(
+                    input_text, self.get_conversation_history())
+
+                self.display_message(response_text, False)
+                self.play_reply(response_text)
 
-            self.display_message(response_text, False)
-            self.get_model().process_and_play_response(response_text)
+            # Keep the caregiver summary current in the background
+            self.get_model().update_caregiver_summary(
+                self.get_conversation_history())
+            self.checkpoint_conversation()
 
             input_text = self.get_voice_input()
 
@@ -150,30 +461,160 @@ class CareBotController:
                 self.say_goodbye()
                 break
 
-            if self.handle_intent_to_end_conversation(input_text) or \
-                    self.handle_urgent_assistance(input_text):
+            # Combined turns classify the input together with the next reply
+            if not self.get_is_combined_turn() and \
+                    self.handle_classification(input_text):
                 break
 
+    def start_barge_in(self, stop_event: threading.Event,
+                       response_text: str = "") -> None:
+        """
+        Starts listening for the Resident while a reply is played, if
+        barge-in is enabled. As soon as they say a keyword that is not part
+        of the reply, the playback is stopped through the stop event.
+
+        Args:
+            stop_event (threading.Event): Stops the playback of the reply
+            when set.
+            response_text (str, optional): The reply, or its first part if
+            it is streamed.
+        """
+        if self.get_is_barge_in():
+            self.get_model().start_barge_in_monitor(stop_event.set)
+            self.get_model().add_barge_in_spoken_text(response_text)
+
+    def finish_barge_in(self, is_interrupted: bool = True) -> None:
+        """
+        Stops listening for the Resident once a reply has been played. If
+        they barged in, waits for the end of their utterance and keeps it as
+        their next input.
+
+        Args:
+            is_interrupted (bool, optional): Whether an utterance in which
+            the Resident barged in should be kept. Defaults to True.
+        """
+        if not self.get_is_barge_in():
+            return
+
+        utterance = self.get_model().stop_barge_in_monitor(is_interrupted)
+        if utterance is not None:
+            print("The Resident interrupted the reply.")
+            self.__barge_in_input = utterance
+
+    def pop_barge_in_input(self) -> Optional[str]:
+        """
+        Returns and forgets the utterance in which the Resident interrupted
+        the last reply.
+
+        Returns:
+            Optional[str]: The utterance, or None if the Resident did not
+            interrupt the reply.
+        """
+        utterance = self.__barge_in_input
+        self.__barge_in_input = None
+        return utterance
+
+    @telemetry.traced("controller.play_reply")
+    def play_reply(self, response_text: str) -> None:
+        """
+        Plays a reply, which the Resident may interrupt if barge-in is
+        enabled.
+
+        Args:
+            response_text (str): The reply to play.
+        """
+        stop_event = threading.Event()
+        self.start_barge_in(stop_event, response_text)
+        try:
+            self.get_model().process_and_play_response(
+                response_text, stop_event=stop_event)
+        finally:
+            self.finish_barge_in()
+
+    @telemetry.traced("controller.stream_and_play_response")
+    def stream_and_play_response(self, input_text: str) -> str:
+        """
+        Generates a response to the input text as a stream and plays each
+        sentence as soon as it has been synthesized.
+
+        The full response is appended to the conversation history by the
+        model once the stream is complete, or the sentences played so far if
+        the Resident interrupted the reply, and the time to first audio of
+        the turn is recorded.
+
+        Args:
+            input_text (str): The Resident's input text to respond to.
+
+        Returns:
+            str: The full response text.
+        """
+        start_time = time.perf_counter()
+        sentences: List[str] = []
+        stop_event = threading.Event()
+
+        response_stream = self.get_model().generate_response_stream(
+            input_text, self.get_conversation_history())
+
+        def collect_sentences() -> Iterator[str]:
+            for sentence in response_stream:
+                sentences.append(sentence)
+                if self.get_is_barge_in():
+                    self.get_model().add_barge_in_spoken_text(sentence)
+                yield sentence
+
+        self.start_barge_in(stop_event)
+        try:
+            time_to_first_audio: Optional[float] = self.get_model()\
+                .process_and_play_stream(collect_sentences(), start_time,
+                                         stop_event)
+        finally:
+            # An interrupted stream saves the partial turn when it is closed,
+            # which must happen before the next turn reads the history
+            response_stream.close()
+            self.finish_barge_in()
+
+        response_text = " ".join(sentences)
+        self.display_message(response_text, False)
+
+        if time_to_first_audio is not None:
+            self.record_time_to_first_audio(time_to_first_audio)
+
+        return response_text
+
+    @telemetry.traced("controller.say_goodbye")
     def say_goodbye(self) -> None:
         """
         Displays and plays a goodbye message.
         """
-        response_text = "Thank you. It seems you do not require further " \
-                        "assistance. " \
-                        "Feel free to chat with me anytime using my name " \
-                        "Care-Bot. " \
-                        "Goodbye for now.\n"
+        response_text = MESSAGE_GOODBYE
 
         self.display_message(response_text, False)
-        self.get_model().process_and_play_response(response_text)
+        self.get_model().process_and_play_response(response_text,
+                                                   is_cache=True)
 
+    @telemetry.traced("controller.alert_ready")
     def alert_ready(self) -> None:
         """
         Alerts the user that Care-Bot is ready and listening.
         """
-        message_ready = "\nCare-Bot is ready and is listening.\n"
+        message_ready = MESSAGE_READY
         self.display_message(message_ready, False)
-        self.get_model().process_and_play_response(message_ready)
+
+        # Listening must not wait for the TTS model to load at startup
+        if not self.get_model().is_synthesis_ready(message_ready):
+            self.get_model().play_cue("ready")
+            return
+
+        self.get_model().process_and_play_response(message_ready,
+                                                   is_cache=True)
+
+    def prewarm_system_phrases(self) -> None:
+        """
+        Synthesizes the fixed messages spoken by Care-Bot ahead of time, so
+        they are played from the synthesis cache without reaching the TTS
+        model.
+        """
+        self.get_model().prewarm_synthesis_cache(SYSTEM_PHRASES)
 
     def clear_conversation_history(self):
         """
@@ -184,9 +625,15 @@ class CareBotController:
         Streamlit UI, if applicable.
         """
         self.get_conversation_history().clear()
+        self.get_model().clear_conversation_checkpoint()
+        self.get_model().reset_caregiver_summary()
+        self.pop_barge_in_input()
         self.get_view().clear_streamlit_messages()
 
-    def restart_system(self, error_message: str, traceback_message: str):
+    @telemetry.traced("controller.restart_system")
+    def restart_system(self, error_message: str, traceback_message: str,
+                       is_warm: bool = False,
+                       is_resources_healthy: bool = True):
         """
         Restarts the system after a fatal error.
 
@@ -195,6 +642,15 @@ class CareBotController:
             the fatal error.
             traceback_message (str): The traceback message providing additional
             details about the error.
+            is_warm (bool, optional): Return after alerting the Resident, so
+            the caller can restart the conversation loop with the models
+            already loaded. If alerting the Resident fails, the error is
+            raised, so the caller can restart cold instead. Defaults to
+            False.
+            is_resources_healthy (bool, optional): Whether the speech models
+            passed their health check. If not, the restart is not announced
+            out loud, since the models could fail or hang again before the
+            script restarts. Defaults to True.
 
         This method prints the error message and traceback message, displays
         a message indicating
@@ -202,20 +658,34 @@ class CareBotController:
         restarts the system.
 
         If the system is running in Streamlit UI mode, it restarts
-        Streamlit; otherwise, it restarts the script using the same command
-        that launched it.
+        Streamlit; otherwise, unless the restart is warm, it restarts the
+        script using the same command that launched it.
         """
         print("An error occurred:", error_message)
         print("Full traceback:", traceback_message)
+        if self.get_view().get_is_ui():
+            restarts.inc(kind="ui")
+        else:
+            restarts.inc(kind="warm" if is_warm else "process")
 
-        message = "Care-Bot is restarting due to a fatal error.\n"
+        message = MESSAGE_RESTARTING
         self.display_message(message, False)
-        self.get_model().process_and_play_response(message)
+        try:
+            if is_warm or is_resources_healthy:
+                self.get_model().play_cue("error")
+                self.get_model().process_and_play_response(message,
+                                                           is_cache=True)
+        except Exception as error:
+            if is_warm:
+                # The caller restarts cold instead
+                raise
+            # Failing to announce a cold restart must not prevent it
+            print("Could not announce the restart:", error)
 
         if self.get_view().get_is_ui():
             # Restart streamlit
             self.get_view().clear_streamlit()
-        else:
+        elif not is_warm:
             # Restart the script when not running in Streamlit UI mode
             print(message)
             os.execv(sys.executable, ['python'] + sys.argv)
@@ -246,6 +716,7 @@ class CareBotController:
 
         self.get_view().display_streamlit_message(message_text, is_user)
 
+    @telemetry.traced("controller.get_voice_input")
     def get_voice_input(self, is_listen_keywords: bool = False):
         """
         Gets voice input from the user.
@@ -267,8 +738,16 @@ class CareBotController:
         if is_listen_keywords:
             self.clear_conversation_history()
             self.alert_ready()
-            self.get_model().beep(800, 200)
-            return self.get_model().listen_for_keywords()
+            self.get_model().play_cue("listen")
+            self.notify_listening()
+            input_text = self.get_model().listen_for_keywords()
         else:
-            self.get_model().beep(800, 200)
-            return self.get_model().transcribe_audio()
+            # The Resident already spoke by interrupting the last reply
+            input_text = self.pop_barge_in_input()
+            if input_text is None:
+                self.get_model().play_cue("listen")
+                self.notify_listening()
+                input_text = self.get_model().transcribe_audio()
+
+        self.record_input_time()
+        return input_text
@@ -0,0 +1,219 @@
+import threading
+import time
+import wave
+from collections import deque
+from typing import Any, Callable, Deque, Iterator, Optional, Tuple
+
+import pyaudio
+
+# Constants for audio settings
+FORMAT = pyaudio.paInt16
+CHANNELS = 1
+RATE = 16000
+FRAMES_PER_BUFFER = 8192
+READ_BUFFER_SIZE = 4096
+
+# Number of chunks kept in the ring buffer, about 15 seconds of audio
+RING_BUFFER_CHUNKS = 60
+
+# Seconds to wait before reopening the microphone after an error
+REOPEN_DELAY_SECONDS = 1.0
+
+
+def open_microphone() -> Tuple[Any, Optional[pyaudio.PyAudio]]:
+    """
+    Open and start an input stream on the default microphone.
+
+    Returns:
+        Tuple[Any, Optional[pyaudio.PyAudio]]: The started stream and the
+                                               PortAudio instance.
+    """
+    mic = pyaudio.PyAudio()
+    try:
+        stream = mic.open(format=FORMAT, channels=CHANNELS, rate=RATE,
+                          input=True, frames_per_buffer=FRAMES_PER_BUFFER)
+        stream.start_stream()
+    except Exception:
+        mic.terminate()
+        raise
+
+    return stream, mic
+
+
+class AudioCaptureService:
+    """
+    Captures audio from the default microphone on a background thread.
+
+    The device is opened once and kept open across listen calls. Captured
+    chunks are kept in a bounded ring buffer that any number of listeners
+    iterate over with frames(). If reading from the device fails, the device
+    is closed and reopened automatically.
+
+    The device is opened with open_device, which returns the started stream
+    and the PortAudio instance to terminate with it, if any.
+    """
+
+    def __init__(self, ring_buffer_chunks: int = RING_BUFFER_CHUNKS,
+                 reopen_delay: float = REOPEN_DELAY_SECONDS,
+                 open_device: Callable[
+                     [], Tuple[Any, Optional[pyaudio.PyAudio]]
+                 ] = open_microphone):
+        self.__open_device = open_device
+        self.__ring_buffer: Deque[bytes] = deque(maxlen=ring_buffer_chunks)
+        # Sequence number of the next chunk appended to the ring buffer
+        self.__next_sequence = 0
+        self.__reopen_delay = reopen_delay
+        self.__condition = threading.Condition()
+        self.__thread: Optional[threading.Thread] = None
+        self.__is_running = False
+
+    def is_running(self) -> bool:
+        """
+        Returns whether the capture thread is running.
+
+        Returns:
+            bool: True if audio is being captured.
+        """
+        return self.__is_running
+
+    def start(self) -> None:
+        """
+        Start capturing audio, if it is not captured already.
+        """
+        with self.__condition:
+            if self.__is_running:
+                return
+            self.__is_running = True
+            self.__thread = threading.Thread(
+                target=self.__capture, name="audio_capture", daemon=True)
+            self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop capturing audio and close the device. Listeners stop iterating.
+        """
+        with self.__condition:
+            self.__is_running = False
+            self.__condition.notify_all()
+
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __capture(self) -> None:
+        """
+        Read chunks from the microphone into the ring buffer until stopped,
+        reopening the device after errors.
+        """
+        mic: Optional[pyaudio.PyAudio] = None
+        stream = None
+
+        while self.__is_running:
+            try:
+                if stream is None:
+                    stream, mic = self.__open_device()
+
+                data = stream.read(READ_BUFFER_SIZE,
+                                   exception_on_overflow=False)
+
+                with self.__condition:
+                    self.__ring_buffer.append(data)
+                    self.__next_sequence += 1
+                    self.__condition.notify_all()
+
+            except Exception as error:
+                print("Audio capture error, reopening the microphone:",
+                      error)
+                stream, mic = self.__close(stream, mic)
+                time.sleep(self.__reopen_delay)
+
+        self.__close(stream, mic)
+
+    @staticmethod
+    def __close(stream, mic: Optional[pyaudio.PyAudio]
+                ) -> Tuple[None, None]:
+        """
+        Close the stream and terminate PortAudio, ignoring errors.
+        """
+        try:
+            if stream is not None:
+                stream.close()
+        except Exception:
+            pass
+
+        try:
+            if mic is not None:
+                mic.terminate()
+        except Exception:
+            pass
+
+        return None, None
+
+    def frames(self, pre_roll_chunks: int = 0) -> Iterator[bytes]:
+        """
+        Iterate over the captured chunks, starting with the next chunk to be
+        captured. Capturing is started if needed.
+
+        A listener that falls behind by more than the ring buffer size skips
+        to the oldest chunk still buffered.
+
+        Parameters:
+        pre_roll_chunks (int): Number of already captured chunks to start
+                               with. Defaults to 0.
+
+        Yields:
+        bytes: Chunks of READ_BUFFER_SIZE 16 bit mono frames at RATE Hertz.
+        """
+        self.start()
+
+        with self.__condition:
+            position = self.__next_sequence - \
+                min(pre_roll_chunks, len(self.__ring_buffer))
+
+        while True:
+            with self.__condition:
+                while self.__is_running and \
+                        position >= self.__next_sequence:
+                    self.__condition.wait()
+
+                if not self.__is_running:
+                    return
+
+                oldest_sequence = self.__next_sequence - \
+                    len(self.__ring_buffer)
+                position = max(position, oldest_sequence)
+                data = self.__ring_buffer[position - oldest_sequence]
+
+            position += 1
+            yield data
+
+
+capture_service = AudioCaptureService()
+
+
+def read_wav_frames(file_path: str,
+                    chunk_frames: int = READ_BUFFER_SIZE) -> Iterator[bytes]:
+    """
+    Read a recorded WAV file in the same chunks the capture service yields,
+    so recorded audio can be processed like microphone input.
+
+    Parameters:
+    file_path (str): The path of a 16 bit mono WAV file recorded at RATE
+                     Hertz.
+    chunk_frames (int): The number of frames per chunk.
+
+    Yields:
+    bytes: Chunks of 16 bit mono frames.
+    """
+    with wave.open(file_path, "rb") as wav_file:
+        if wav_file.getnchannels() != CHANNELS or \
+                wav_file.getsampwidth() != 2 or \
+                wav_file.getframerate() != RATE:
+            raise ValueError(f"{file_path} must be a 16 bit mono WAV file "
+                             f"recorded at {RATE} Hertz.")
+
+        while True:
+            data = wav_file.readframes(chunk_frames)
+            if len(data) == 0:
+                break
+            yield data
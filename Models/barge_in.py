@@ -0,0 +1,258 @@
+import json
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Iterable, List, Optional
+
+from Models.keyword_recognition import KeywordMatcher, get_keyword_matcher
+
+# Number of consecutive partial results that must contain a keyword not
+# explained by Care-Bot's own speech before the playback is stopped
+BARGE_IN_DEBOUNCE_RESULTS = 2
+# Number of chunks decoded after a barge-in before the utterance is returned
+# even if the recognizer has not ended it, about 10 seconds of audio
+MAX_UTTERANCE_CHUNKS = 40
+
+
+def find_unexplained_keywords(heard_text: str, spoken_text: str,
+                              matcher: Optional[KeywordMatcher] = None
+                              ) -> List[str]:
+    """
+    Find the keywords heard by the microphone that are not explained by the
+    echo of Care-Bot's own speech.
+
+    Every keyword of the spoken text discounts one occurrence of the same
+    keyword in the heard text.
+
+    Parameters:
+    heard_text (str): The text recognized from the microphone.
+    spoken_text (str): The text Care-Bot is speaking.
+    matcher (KeywordMatcher, optional): The keyword matcher. Defaults to the
+                                        shared one.
+
+    Returns:
+    List[str]: The keywords heard that Care-Bot did not speak.
+    """
+    if matcher is None:
+        matcher = get_keyword_matcher()
+
+    spoken_keywords = Counter(matcher.find_keywords(spoken_text))
+    unexplained: List[str] = []
+    for keyword in matcher.find_keywords(heard_text):
+        if spoken_keywords[keyword] > 0:
+            spoken_keywords[keyword] -= 1
+        else:
+            unexplained.append(keyword)
+
+    return unexplained
+
+
+class BargeInDetector:
+    """
+    Detects the Resident barging in while Care-Bot speaks, by decoding the
+    microphone audio and looking for keywords that are not part of
+    Care-Bot's own speech.
+
+    Once a barge-in is detected the rest of the utterance is decoded, so it
+    can be handled as the Resident's next input.
+    """
+
+    def __init__(self, stream_recognizer: Any,
+                 debounce_results: int = BARGE_IN_DEBOUNCE_RESULTS,
+                 max_utterance_chunks: int = MAX_UTTERANCE_CHUNKS,
+                 matcher: Optional[KeywordMatcher] = None):
+        self.__recognizer = stream_recognizer
+        self.__debounce_results = debounce_results
+        self.__max_utterance_chunks = max_utterance_chunks
+        self.__matcher = matcher
+        self.__spoken_text = ""
+        self.__lock = threading.Lock()
+        self.__consecutive_hits = 0
+        self.__trigger_time: Optional[float] = None
+        self.__chunks_since_trigger = 0
+        self.__utterance: Optional[str] = None
+
+    def add_spoken_text(self, text: str) -> None:
+        """
+        Add text that Care-Bot speaks, so its echo is not taken for the
+        Resident.
+
+        Parameters:
+        text (str): The text being spoken.
+        """
+        with self.__lock:
+            self.__spoken_text += " " + text
+
+    def is_triggered(self) -> bool:
+        """
+        Returns whether a barge-in was detected.
+
+        Returns:
+            bool: True if the Resident barged in.
+        """
+        return self.__trigger_time is not None
+
+    def get_trigger_time(self) -> Optional[float]:
+        """
+        Returns the time.perf_counter() value at which the barge-in was
+        detected.
+
+        Returns:
+            Optional[float]: The detection time, or None if the Resident did
+            not barge in.
+        """
+        return self.__trigger_time
+
+    def get_utterance(self) -> Optional[str]:
+        """
+        Returns the utterance in which the Resident barged in, once it has
+        ended.
+
+        Returns:
+            Optional[str]: The utterance, or None if it has not ended or the
+            Resident did not barge in.
+        """
+        return self.__utterance
+
+    def process(self, data: bytes) -> bool:
+        """
+        Decode an audio chunk.
+
+        Parameters:
+        data (bytes): A chunk of 16 bit mono samples.
+
+        Returns:
+        bool: True once the utterance containing a barge-in has ended.
+        """
+        is_final = self.__recognizer.AcceptWaveform(data)
+        if is_final:
+            text = json.loads(self.__recognizer.Result()).get('text', '')
+        else:
+            text = json.loads(
+                self.__recognizer.PartialResult()).get('partial', '')
+
+        if not self.is_triggered():
+            with self.__lock:
+                spoken_text = self.__spoken_text
+
+            if find_unexplained_keywords(text, spoken_text, self.__matcher):
+                self.__consecutive_hits += 1
+                # A final result needs no debouncing
+                if is_final or \
+                        self.__consecutive_hits >= self.__debounce_results:
+                    self.__trigger_time = time.perf_counter()
+            else:
+                self.__consecutive_hits = 0
+
+            if is_final:
+                self.__consecutive_hits = 0
+
+        if not self.is_triggered():
+            return False
+
+        self.__chunks_since_trigger += 1
+        if is_final or \
+                self.__chunks_since_trigger >= self.__max_utterance_chunks:
+            self.__utterance = text
+            return True
+
+        return False
+
+
+class BargeInMonitor:
+    """
+    Listens for the Resident barging in on a background thread while
+    Care-Bot speaks.
+    """
+
+    def __init__(self, create_recognizer: Callable[[], Any],
+                 frames: Callable[[], Iterable[bytes]]):
+        """
+        Parameters:
+        create_recognizer (Callable): Creates a new speech recognizer.
+        frames (Callable): Returns an iterator over the microphone audio
+                           chunks, starting with the next chunk captured.
+        """
+        self.__create_recognizer = create_recognizer
+        self.__frames = frames
+        self.__detector: Optional[BargeInDetector] = None
+        self.__stop_listening: Optional[threading.Event] = None
+        self.__thread: Optional[threading.Thread] = None
+        # Held while a chunk is processed and while stopping, so a barge-in
+        # is either detected before stop() checks for it or never
+        self.__lock = threading.Lock()
+
+    def start(self, on_barge_in: Callable[[], None]) -> None:
+        """
+        Start listening. Any previous listening is stopped.
+
+        Parameters:
+        on_barge_in (Callable): Called on the listening thread as soon as a
+                                barge-in is detected, e.g. to stop the
+                                playback.
+        """
+        self.stop(is_wait=False)
+
+        detector = BargeInDetector(self.__create_recognizer())
+        stop_listening = threading.Event()
+
+        def listen() -> None:
+            is_notified = False
+            for data in self.__frames():
+                with self.__lock:
+                    if stop_listening.is_set():
+                        break
+
+                    is_done = detector.process(data)
+                    is_triggered = detector.is_triggered()
+
+                if is_triggered and not is_notified:
+                    is_notified = True
+                    on_barge_in()
+                if is_done:
+                    break
+
+        self.__detector = detector
+        self.__stop_listening = stop_listening
+        self.__thread = threading.Thread(target=listen, name="barge_in",
+                                         daemon=True)
+        self.__thread.start()
+
+    def add_spoken_text(self, text: str) -> None:
+        """
+        Add text that Care-Bot speaks, so its echo is not taken for the
+        Resident.
+
+        Parameters:
+        text (str): The text being spoken.
+        """
+        if self.__detector is not None:
+            self.__detector.add_spoken_text(text)
+
+    def stop(self, is_wait: bool = True) -> Optional[str]:
+        """
+        Stop listening.
+
+        Parameters:
+        is_wait (bool, optional): If the Resident barged in, wait until the
+                                  utterance has ended. Defaults to True.
+
+        Returns:
+        Optional[str]: The utterance in which the Resident barged in, or
+                       None if they did not or is_wait is False.
+        """
+        detector, thread = self.__detector, self.__thread
+        self.__detector = None
+        self.__thread = None
+        if detector is None or thread is None:
+            return None
+
+        with self.__lock:
+            if not (is_wait and detector.is_triggered()):
+                # Without a barge-in the thread exits at the next chunk
+                if self.__stop_listening is not None:
+                    self.__stop_listening.set()
+                return None
+
+        thread.join()
+        return detector.get_utterance()
@@ -0,0 +1,81 @@
+import json
+import os
+import time
+from typing import Dict, List
+
+# Checkpoints older than this are from a conversation that is over
+DEFAULT_MAX_AGE_SECONDS = 10 * 60
+
+
+class ConversationCheckpoint:
+    """
+    Keeps a copy of the conversation history on disk, so the conversation
+    can resume after Care-Bot restarts.
+
+    The checkpoint is replaced atomically, so a crash while saving leaves
+    the previous checkpoint intact.
+    """
+
+    def __init__(self, path: str,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self.__path = path
+        self.__max_age_seconds = max_age_seconds
+
+    def save(self, conversation_history: List[Dict[str, str]]) -> None:
+        """
+        Save the conversation history. Errors are reported and otherwise
+        ignored, so they never interrupt the conversation.
+
+        Parameters:
+        conversation_history (List[Dict[str, str]]): The history to save.
+        """
+        temporary_path = self.__path + ".tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump({"saved_at": time.time(),
+                           "conversation_history": conversation_history},
+                          file)
+            os.replace(temporary_path, self.__path)
+        except OSError as error:
+            print("Saving the conversation checkpoint failed:", error)
+
+    def load(self) -> List[Dict[str, str]]:
+        """
+        Returns the saved conversation history.
+
+        Returns:
+        List[Dict[str, str]]: The history, empty if there is no checkpoint,
+                              it is unreadable or it is too old.
+        """
+        try:
+            with open(self.__path, encoding="utf-8") as file:
+                checkpoint = json.load(file)
+            saved_at = float(checkpoint["saved_at"])
+            conversation_history = [
+                {"role": str(message["role"]),
+                 "content": str(message["content"])}
+                for message in checkpoint["conversation_history"]]
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            print("Ignoring an unreadable conversation checkpoint:", error)
+            return []
+
+        if time.time() - saved_at > self.__max_age_seconds:
+            return []
+        return conversation_history
+
+    def clear(self) -> None:
+        """
+        Delete the checkpoint, e.g. when a new conversation starts.
+        """
+        try:
+            os.remove(self.__path)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            print("Deleting the conversation checkpoint failed:", error)
+
+
+conversation_checkpoint = ConversationCheckpoint(
+    os.getenv('CONVERSATION_CHECKPOINT_PATH', 'conversation_checkpoint.json'))
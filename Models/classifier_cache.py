@@ -0,0 +1,240 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Dict, Optional, Tuple
+
+# Default limits of the classifier cache
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_DISK_ENTRIES = 10000
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+g_punctuation = re.compile(r"[^\w\s']")
+g_whitespace = re.compile(r"\s+")
+
+
+def normalize_input(text: str) -> str:
+    """
+    Normalize a classifier input so utterances differing only by case,
+    punctuation or spacing share a cache entry.
+
+    Parameters:
+    text (str): The classifier input.
+
+    Returns:
+    str: The normalized input.
+    """
+    text = text.lower().replace("’", "'")
+    return g_whitespace.sub(" ", g_punctuation.sub(" ", text)).strip()
+
+
+class ClassifierCache:
+    """
+    A cache of the verdicts of the deterministic LLM classifiers, keyed by
+    (classifier, prompt version, model, normalized input).
+
+    Entries expire after a time to live. Recently used entries are kept in
+    memory and, if a database path is given, every entry is also stored on
+    disk, so it survives restarts. When a tier is full, False verdicts are
+    evicted, least recently used first, before any True verdict, and a
+    cached True verdict is never replaced by a False one.
+    """
+
+    def __init__(self, database_path: Optional[str] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.__database_path = database_path
+        self.__max_entries = max_entries
+        self.__max_disk_entries = max_disk_entries
+        self.__ttl_seconds = ttl_seconds
+        self.__lock = threading.Lock()
+        # Key to expiry time, one tier per verdict so False verdicts can be
+        # evicted first
+        self.__entries: Dict[bool, "OrderedDict[str, float]"] = {
+            True: OrderedDict(),
+            False: OrderedDict(),
+        }
+        self.__stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+        }
+        # The database is created on first use, so creating a cache leaves
+        # nothing on disk
+        self.__is_database_created = False
+
+    def __connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(str(self.__database_path), timeout=30.0)
+        if not self.__is_database_created:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS verdicts ("
+                    "key TEXT PRIMARY KEY, "
+                    "verdict INTEGER NOT NULL, "
+                    "expires_at REAL NOT NULL, "
+                    "used_at REAL NOT NULL)")
+            self.__is_database_created = True
+        return connection
+
+    @staticmethod
+    def make_key(classifier: str, prompt_version: str, model_name: str,
+                 text: str) -> str:
+        """
+        Returns the cache key of a classifier input.
+
+        Parameters:
+        classifier (str): The name of the classifier.
+        prompt_version (str): The version of the classifier's prompt.
+        model_name (str): The name of the LLM.
+        text (str): The classifier input.
+
+        Returns:
+        str: A hexadecimal digest identifying the entry.
+        """
+        return hashlib.sha256(
+            f"{classifier}\0{prompt_version}\0{model_name}\0"
+            f"{normalize_input(text)}".encode("utf-8")).hexdigest()
+
+    def __remember(self, key: str, verdict: bool, expires_at: float) -> None:
+        """
+        Store a verdict in memory, evicting False verdicts before True ones.
+        Must be called with the lock held.
+        """
+        if not verdict and self.__entries[True].get(key, 0.0) > time.time():
+            return
+
+        self.__entries[not verdict].pop(key, None)
+        self.__entries[verdict][key] = expires_at
+        self.__entries[verdict].move_to_end(key)
+
+        while len(self.__entries[True]) + len(self.__entries[False]) > \
+                self.__max_entries:
+            tier = self.__entries[False] if self.__entries[False] \
+                else self.__entries[True]
+            tier.popitem(last=False)
+
+    def __lookup_memory(self, key: str, now: float) -> Optional[bool]:
+        """
+        Returns the unexpired verdict of a key in memory. Must be called
+        with the lock held.
+        """
+        for verdict in [True, False]:
+            expires_at = self.__entries[verdict].get(key)
+            if expires_at is None:
+                continue
+            if expires_at <= now:
+                del self.__entries[verdict][key]
+                return None
+            self.__entries[verdict].move_to_end(key)
+            return verdict
+        return None
+
+    def __lookup_disk(self, key: str, now: float
+                      ) -> Optional[Tuple[bool, float]]:
+        """
+        Returns the unexpired verdict of a key on disk and its expiry time.
+        """
+        with closing(self.__connect()) as connection, connection:
+            row = connection.execute(
+                "SELECT verdict, expires_at FROM verdicts WHERE key = ? AND "
+                "expires_at > ?", (key, now)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE verdicts SET used_at = ? WHERE key = ?",
+                               (now, key))
+        return bool(row[0]), float(row[1])
+
+    def get(self, classifier: str, prompt_version: str, model_name: str,
+            text: str) -> Optional[bool]:
+        """
+        Returns the cached verdict of a classifier input, from memory or
+        from disk.
+
+        Parameters:
+        classifier (str): The name of the classifier.
+        prompt_version (str): The version of the classifier's prompt.
+        model_name (str): The name of the LLM.
+        text (str): The classifier input.
+
+        Returns:
+        Optional[bool]: The verdict, or None if it is not cached or expired.
+        """
+        key = self.make_key(classifier, prompt_version, model_name, text)
+        now = time.time()
+
+        with self.__lock:
+            verdict = self.__lookup_memory(key, now)
+            if verdict is not None:
+                self.__stats["memory_hits"] += 1
+                return verdict
+
+            if self.__database_path is not None:
+                entry = self.__lookup_disk(key, now)
+                if entry is not None:
+                    self.__stats["disk_hits"] += 1
+                    self.__remember(key, entry[0], entry[1])
+                    return entry[0]
+
+            self.__stats["misses"] += 1
+            return None
+
+    def put(self, classifier: str, prompt_version: str, model_name: str,
+            text: str, verdict: bool) -> None:
+        """
+        Store the verdict of a classifier input in memory and on disk.
+
+        Parameters:
+        classifier (str): The name of the classifier.
+        prompt_version (str): The version of the classifier's prompt.
+        model_name (str): The name of the LLM.
+        text (str): The classifier input.
+        verdict (bool): The verdict of the classifier.
+        """
+        key = self.make_key(classifier, prompt_version, model_name, text)
+        now = time.time()
+        expires_at = now + self.__ttl_seconds
+
+        with self.__lock:
+            self.__remember(key, verdict, expires_at)
+
+            if self.__database_path is None:
+                return
+
+            with closing(self.__connect()) as connection, connection:
+                # An unexpired True verdict is kept over a False one
+                connection.execute(
+                    "INSERT INTO verdicts (key, verdict, expires_at, used_at) "
+                    "VALUES (?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                    "verdict = CASE WHEN verdicts.expires_at > ? "
+                    "THEN MAX(verdicts.verdict, excluded.verdict) "
+                    "ELSE excluded.verdict END, "
+                    "expires_at = excluded.expires_at, "
+                    "used_at = excluded.used_at",
+                    (key, int(verdict), expires_at, now, now))
+
+                connection.execute(
+                    "DELETE FROM verdicts WHERE expires_at <= ?", (now,))
+                connection.execute(
+                    "DELETE FROM verdicts WHERE key IN (SELECT key FROM "
+                    "verdicts ORDER BY verdict DESC, used_at DESC "
+                    "LIMIT -1 OFFSET ?)", (self.__max_disk_entries,))
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Returns the number of hits and misses and the hit rate.
+
+        Returns:
+            Dict[str, float]: 'memory_hits', 'disk_hits', 'misses' and
+            'hit_rate', the fraction of lookups answered from the cache.
+        """
+        with self.__lock:
+            stats: Dict[str, float] = dict(self.__stats)
+
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = \
+            (stats["memory_hits"] + stats["disk_hits"]) / max(lookups, 1)
+        return stats
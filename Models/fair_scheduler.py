@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from Models.resilience import LatencyTracker
+
+# Tasks a session may have waiting before submitting another one blocks
+DEFAULT_MAX_PENDING_PER_SESSION = 4
+
+Task = Tuple[Future, Callable[..., Any], Tuple[Any, ...], float]
+
+
+class FairScheduler:
+    """
+    Runs the tasks of many sessions on a bounded pool of worker threads,
+    taking turns between the sessions.
+
+    Each session has its own queue of tasks. Workers pick sessions in round
+    robin order, so a session with a long backlog cannot delay the others
+    by more than one task each. At most one task of a session runs at a
+    time, in submission order, so a session's recognizer or other state
+    never needs a lock. A session with too many tasks waiting blocks its
+    submitter until a worker catches up.
+    """
+
+    def __init__(self, workers: int,
+                 max_pending_per_session: int =
+                 DEFAULT_MAX_PENDING_PER_SESSION,
+                 name: str = "fair_scheduler"):
+        """
+        Parameters:
+        workers (int): The number of worker threads.
+        max_pending_per_session (int): The number of tasks of a session that
+                                       may wait before submit() blocks.
+        name (str): The prefix of the names of the worker threads.
+        """
+        self.__max_pending_per_session = max(max_pending_per_session, 1)
+        self.__condition = threading.Condition()
+        self.__queues: Dict[str, Deque[Task]] = {}
+        # Sessions with waiting tasks and no running task, in turn order
+        self.__ready: Deque[str] = deque()
+        self.__running: Set[str] = set()
+        self.__is_running = True
+        self.__wait_tracker = LatencyTracker(min_samples=1)
+        self.__threads: List[threading.Thread] = [
+            threading.Thread(target=self.__work, name=f"{name}_{index}",
+                             daemon=True)
+            for index in range(max(workers, 1))]
+        for thread in self.__threads:
+            thread.start()
+
+    def get_worker_count(self) -> int:
+        """
+        Returns the number of worker threads.
+
+        Returns:
+            int: The number of workers.
+        """
+        return len(self.__threads)
+
+    def get_pending_count(self) -> int:
+        """
+        Returns the number of tasks waiting for a worker.
+
+        Returns:
+            int: The number of tasks of every session.
+        """
+        with self.__condition:
+            return sum(len(tasks) for tasks in self.__queues.values())
+
+    def get_wait_percentile(self, percentile: float) -> Optional[float]:
+        """
+        Returns a percentile of the time the recent tasks waited for a
+        worker.
+
+        Parameters:
+        percentile (float): The percentile, between 0 and 100.
+
+        Returns:
+        Optional[float]: The time in seconds, or None if no task ran yet.
+        """
+        return self.__wait_tracker.get_percentile(percentile)
+
+    def submit(self, session_id: str, function: Callable[..., Any],
+               *args: Any) -> Future:
+        """
+        Queue a task of a session, blocking while the session already has
+        too many tasks waiting.
+
+        Parameters:
+        session_id (str): The session the task belongs to.
+        function (Callable): The function to call.
+        *args: The arguments of the function.
+
+        Returns:
+        Future: The result of the function.
+
+        Raises:
+        RuntimeError: If the scheduler was shut down.
+        """
+        future: Future = Future()
+
+        with self.__condition:
+            tasks = self.__queues.setdefault(session_id, deque())
+            while self.__is_running and \
+                    len(tasks) >= self.__max_pending_per_session:
+                self.__condition.wait()
+
+            if not self.__is_running:
+                raise RuntimeError("The scheduler was shut down")
+
+            tasks.append((future, function, args, time.monotonic()))
+            if len(tasks) == 1 and session_id not in self.__running:
+                self.__ready.append(session_id)
+                self.__condition.notify_all()
+
+        return future
+
+    def remove_session(self, session_id: str) -> None:
+        """
+        Cancel the waiting tasks of a session that ended. A task that is
+        already running finishes.
+
+        Parameters:
+        session_id (str): The session.
+        """
+        with self.__condition:
+            tasks = self.__queues.pop(session_id, deque())
+            if session_id in self.__ready:
+                self.__ready.remove(session_id)
+            self.__condition.notify_all()
+
+        for future, _, _, _ in tasks:
+            future.cancel()
+
+    def shutdown(self) -> None:
+        """
+        Stop the workers once the running tasks finish, cancelling the
+        waiting tasks.
+        """
+        with self.__condition:
+            self.__is_running = False
+            queues = list(self.__queues.values())
+            self.__queues.clear()
+            self.__ready.clear()
+            self.__condition.notify_all()
+
+        for tasks in queues:
+            for future, _, _, _ in tasks:
+                future.cancel()
+
+        for thread in self.__threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def __work(self) -> None:
+        """
+        Run the next task of the session whose turn it is, until shut down.
+        """
+        while True:
+            with self.__condition:
+                while self.__is_running and not self.__ready:
+                    self.__condition.wait()
+
+                if not self.__is_running:
+                    return
+
+                session_id = self.__ready.popleft()
+                future, function, args, submit_time = \
+                    self.__queues[session_id].popleft()
+                self.__running.add(session_id)
+                # Submitters blocked on a full queue may continue
+                self.__condition.notify_all()
+
+            if future.set_running_or_notify_cancel():
+                self.__wait_tracker.add(time.monotonic() - submit_time)
+                try:
+                    future.set_result(function(*args))
+                except BaseException as error:
+                    future.set_exception(error)
+
+            with self.__condition:
+                self.__running.discard(session_id)
+                # The session goes to the back of the turn order
+                if self.__queues.get(session_id):
+                    self.__ready.append(session_id)
+                    self.__condition.notify_all()
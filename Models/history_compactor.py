@@ -0,0 +1,213 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Default number of tokens of conversation history sent with each request
+DEFAULT_TOKEN_BUDGET = 2000
+# Number of most recent messages always kept verbatim, even over budget
+MIN_RECENT_MESSAGES = 2
+# Tokens taken by the role and separators of every chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Characters per token assumed when tiktoken is not installed
+CHARACTERS_PER_TOKEN = 4
+
+SUMMARY_PREFIX = "Summary of the earlier conversation with the Resident: "
+
+encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text, with tiktoken if it is
+    installed and from the number of characters otherwise.
+
+    Parameters:
+    text (str): The text.
+
+    Returns:
+    int: The number of tokens.
+    """
+    global encoding
+    if tiktoken is None:
+        return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+
+    if encoding is None:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    """
+    Estimate the number of tokens a chat message takes in a request.
+
+    Parameters:
+    message (Dict[str, str]): A dict with 'role' and 'content' keys.
+
+    Returns:
+    int: The number of tokens.
+    """
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class HistoryCompactor:
+    """
+    Keeps the conversation history sent with each request within a token
+    budget.
+
+    The most recent messages that fit in the budget are sent verbatim and
+    older messages are folded into a running summary, sent as a single
+    system message. Summaries are written on a background thread: until a
+    summary is ready, the messages it will cover are left out, so compaction
+    never adds latency to a turn.
+    """
+
+    def __init__(self,
+                 summarize: Callable[[str, List[Dict[str, str]]], str],
+                 token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 min_recent_messages: int = MIN_RECENT_MESSAGES):
+        """
+        Parameters:
+        summarize (Callable): Returns a summary of the previous summary,
+                              which may be empty, followed by the messages.
+        token_budget (int): The maximum number of tokens of history.
+        min_recent_messages (int): The number of most recent messages always
+                                   kept verbatim.
+        """
+        self.__summarize = summarize
+        self.__token_budget = token_budget
+        self.__min_recent_messages = min_recent_messages
+        self.__executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="history_compaction")
+        self.__lock = threading.Lock()
+
+        # The conversation the summary belongs to, identified by its list
+        # and its first message
+        self.__history_id: Optional[int] = None
+        self.__first_message: Optional[Dict[str, str]] = None
+        self.__conversation = 0
+
+        self.__summary = ""
+        # Number of messages at the start of the history the summary covers
+        self.__summarized_count = 0
+        self.__pending_summary: Optional[Future] = None
+
+    def get_token_budget(self) -> int:
+        """
+        Returns the maximum number of tokens of history.
+
+        Returns:
+            int: The token budget.
+        """
+        return self.__token_budget
+
+    def get_summary(self) -> str:
+        """
+        Returns the running summary of the current conversation.
+
+        Returns:
+            str: The summary, empty if no message has been folded yet.
+        """
+        with self.__lock:
+            return self.__summary
+
+    def __track(self, conversation_history: List[Dict[str, str]]) -> None:
+        """
+        Forget the summary when the history belongs to another conversation,
+        e.g. after it was cleared. Must be called with the lock held.
+        """
+        first_message = conversation_history[0] \
+            if conversation_history else None
+
+        if id(conversation_history) == self.__history_id \
+                and first_message is self.__first_message \
+                and len(conversation_history) >= self.__summarized_count:
+            return
+
+        self.__history_id = id(conversation_history)
+        self.__first_message = first_message
+        self.__conversation += 1
+        self.__summary = ""
+        self.__summarized_count = 0
+
+    def compact(self, conversation_history: List[Dict[str, str]]
+                ) -> List[Dict[str, str]]:
+        """
+        Returns the messages to send in place of the conversation history,
+        and starts summarizing the messages that no longer fit in the
+        budget.
+
+        Parameters:
+        conversation_history (List[Dict[str, str]]): The full history.
+
+        Returns:
+        List[Dict[str, str]]: The summary message, if any, followed by the
+                              most recent messages that fit in the budget.
+        """
+        # Requests without history, e.g. classifications, must not reset
+        # the summary of the conversation
+        if not conversation_history:
+            return []
+
+        with self.__lock:
+            self.__track(conversation_history)
+
+            messages: List[Dict[str, str]] = []
+            if self.__summary:
+                messages.append({"role": "system",
+                                 "content": SUMMARY_PREFIX + self.__summary})
+
+            budget = self.__token_budget - sum(map(count_message_tokens,
+                                                   messages))
+            unsummarized = conversation_history[self.__summarized_count:]
+
+            recent: List[Dict[str, str]] = []
+            for message in reversed(unsummarized):
+                tokens = count_message_tokens(message)
+                if tokens > budget and \
+                        len(recent) >= self.__min_recent_messages:
+                    break
+                budget -= tokens
+                recent.append(message)
+            recent.reverse()
+
+            overflow = unsummarized[:len(unsummarized) - len(recent)]
+            if overflow and self.__pending_summary is None:
+                self.__pending_summary = self.__executor.submit(
+                    self.__fold, self.__conversation, self.__summary,
+                    list(overflow), self.__summarized_count + len(overflow))
+
+            return messages + recent
+
+    def __fold(self, conversation: int, summary: str,
+               messages: List[Dict[str, str]], summarized_count: int) -> None:
+        """
+        Fold messages into the running summary, on the background thread.
+        """
+        try:
+            new_summary: Optional[str] = self.__summarize(summary, messages)
+        except Exception as error:
+            print("Conversation history summary failed:", error)
+            new_summary = None
+
+        with self.__lock:
+            self.__pending_summary = None
+            if new_summary and conversation == self.__conversation:
+                self.__summary = new_summary
+                self.__summarized_count = summarized_count
+
+    def wait_for_summary(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait until the summary being written, if any, is ready.
+
+        Parameters:
+        timeout (float, optional): The maximum number of seconds to wait.
+        """
+        with self.__lock:
+            pending_summary = self.__pending_summary
+        if pending_summary is not None:
+            pending_summary.result(timeout)
@@ -0,0 +1,131 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+
+class IncrementalSummary:
+    """
+    A summary of the conversation that is kept up to date after every turn.
+
+    update() folds the messages added since the last update into the
+    summary on a background thread, so by the time the summary is needed it
+    is either ready or only the latest messages remain to be folded.
+    """
+
+    def __init__(self,
+                 update_summary: Callable[[str, List[Dict[str, str]]], str]):
+        """
+        Parameters:
+        update_summary (Callable): Returns the previous summary, which may be
+                                   empty, updated with new messages.
+        """
+        self.__update_summary = update_summary
+        self.__executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="incremental_summary")
+        self.__lock = threading.Lock()
+        self.__conversation = 0
+        self.__summary = ""
+        # Number of messages at the start of the history the summary covers
+        self.__summarized_count = 0
+        self.__pending_update: Optional[Future] = None
+
+    def reset(self) -> None:
+        """
+        Forget the summary, e.g. when a new conversation starts. An update
+        in progress is discarded.
+        """
+        with self.__lock:
+            self.__conversation += 1
+            self.__summary = ""
+            self.__summarized_count = 0
+
+    def __fold(self, conversation: int,
+               conversation_history: List[Dict[str, str]]) -> None:
+        """
+        Fold the messages the summary does not cover yet, on the background
+        thread.
+        """
+        with self.__lock:
+            if conversation != self.__conversation:
+                return
+            summary = self.__summary
+            new_messages = conversation_history[self.__summarized_count:]
+
+        if not new_messages:
+            return
+
+        new_summary = self.__update_summary(summary, new_messages)
+
+        with self.__lock:
+            if conversation == self.__conversation:
+                self.__summary = new_summary
+                self.__summarized_count = len(conversation_history)
+
+    def __fold_in_background(self, conversation: int,
+                             conversation_history: List[Dict[str, str]]
+                             ) -> None:
+        try:
+            self.__fold(conversation, conversation_history)
+        except Exception as error:
+            print("Conversation summary update failed:", error)
+        finally:
+            with self.__lock:
+                self.__pending_update = None
+
+    def update(self, conversation_history: List[Dict[str, str]]) -> None:
+        """
+        Start folding the new messages of the history into the summary and
+        return immediately. If an update is already in progress, the new
+        messages are left to the next update.
+
+        Parameters:
+        conversation_history (List[Dict[str, str]]): The full history.
+        """
+        with self.__lock:
+            if self.__pending_update is not None or \
+                    len(conversation_history) <= self.__summarized_count:
+                return
+            self.__pending_update = self.__executor.submit(
+                self.__fold_in_background, self.__conversation,
+                list(conversation_history))
+
+    def get(self, conversation_history: List[Dict[str, str]]) -> str:
+        """
+        Returns the summary of the whole history, waiting for the update in
+        progress and folding the messages it does not cover.
+
+        If folding the latest messages fails, the summary of the earlier
+        messages is returned.
+
+        Parameters:
+        conversation_history (List[Dict[str, str]]): The full history.
+
+        Returns:
+        str: The summary, empty if nothing could be summarized.
+        """
+        with self.__lock:
+            conversation = self.__conversation
+
+        # Updates run one at a time, so this runs after any update in
+        # progress
+        try:
+            self.__executor.submit(self.__fold, conversation,
+                                   list(conversation_history)).result()
+        except Exception as error:
+            print("Conversation summary update failed:", error)
+
+        with self.__lock:
+            return self.__summary
+
+    def is_current(self, conversation_history: List[Dict[str, str]]) -> bool:
+        """
+        Check if the summary covers every message of the history.
+
+        Parameters:
+        conversation_history (List[Dict[str, str]]): The full history.
+
+        Returns:
+        bool: True if no message remains to be folded.
+        """
+        with self.__lock:
+            return self.__summarized_count >= len(conversation_history)
@@ -1,4 +1,248 @@
+import json
+import os
 import re
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Keyword matcher backends
+BACKEND_REGEX = "regex"
+BACKEND_TRIE = "trie"
+
+DEFAULT_VOCABULARY_PATH = os.path.join(os.path.dirname(__file__), "data",
+                                       "keywords.json")
+
+# A word is a run of word characters, the same unit a regex \b delimits
+g_word_pattern = re.compile(r"\w+")
+
+
+def load_vocabulary(vocabulary_path: str = DEFAULT_VOCABULARY_PATH
+                    ) -> Tuple[List[str], List[str]]:
+    """
+    Load the keywords, their inflections and the suffixes that may follow
+    them from a JSON data file.
+
+    The data file holds a "keywords" object mapping each keyword to a list of
+    inflections, and a "suffixes" list that may be appended to the last word
+    of every keyword and inflection.
+
+    Parameters:
+    vocabulary_path (str): The path of the JSON data file.
+
+    Returns:
+    Tuple[List[str], List[str]]: The lower case keywords and inflections,
+        with the words of multi-word keywords separated by a single space,
+        and the suffixes.
+    """
+    with open(vocabulary_path) as vocabulary_file:
+        data = json.load(vocabulary_file)
+
+    forms: List[str] = []
+    for keyword, inflections in data["keywords"].items():
+        for form in [keyword] + list(inflections):
+            form = " ".join(form.lower().split())
+            if form not in forms:
+                forms.append(form)
+
+    return forms, list(data.get("suffixes", []))
+
+
+def build_prefix_pattern(forms: List[str]) -> str:
+    """
+    Build a regex alternation of the forms in which common prefixes are
+    factored out, e.g. "fall(?:en|ing)?" for "fall", "fallen" and "falling",
+    so the regex engine never tries two alternatives sharing a prefix.
+
+    Parameters:
+    forms (List[str]): The forms to match. Spaces match any whitespace.
+
+    Returns:
+    str: The regex pattern.
+    """
+    trie: Dict[str, dict] = {}
+    for form in forms:
+        node = trie
+        for character in form:
+            node = node.setdefault(character, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        alternatives = [
+            (r"\s+" if character == " " else re.escape(character))
+            + build(child)
+            for character, child in sorted(node.items()) if character != ""]
+
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1 and "" not in node:
+            return alternatives[0]
+
+        pattern = "(?:" + "|".join(alternatives) + ")"
+        return pattern + "?" if "" in node else pattern
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Finds keywords in text. The vocabulary is loaded and compiled once, when
+    the matcher is created.
+
+    Two backends are available:
+    - BACKEND_REGEX matches a single precompiled regex in which common
+      prefixes of the keywords are factored out.
+    - BACKEND_TRIE splits the text into words and scans each word once
+      through an Aho-Corasick automaton built over the words of the
+      keywords, with no regex backtracking.
+    """
+
+    def __init__(self, vocabulary_path: str = DEFAULT_VOCABULARY_PATH,
+                 backend: str = BACKEND_TRIE):
+        if backend not in [BACKEND_REGEX, BACKEND_TRIE]:
+            raise ValueError(f"Unknown keyword matcher backend: {backend}")
+
+        self.__backend = backend
+        forms, suffixes = load_vocabulary(vocabulary_path)
+
+        # Every form may be followed by one of the suffixes
+        self.__vocabulary: List[str] = []
+        for form in forms:
+            for suffix in [""] + suffixes:
+                if form + suffix not in self.__vocabulary:
+                    self.__vocabulary.append(form + suffix)
+
+        self.__pattern = re.compile(
+            r"\b" + build_prefix_pattern(forms)
+            + r"(?:" + "|".join(map(re.escape, suffixes)) + r")?\b",
+            re.IGNORECASE)
+
+        self.__goto: List[Dict[str, int]] = [{}]
+        self.__fail: List[int] = [0]
+        self.__output: List[List[str]] = [[]]
+        self.__build_automaton()
+
+    def get_backend(self) -> str:
+        """
+        Returns the backend used by the matcher.
+
+        Returns:
+            str: BACKEND_REGEX or BACKEND_TRIE.
+        """
+        return self.__backend
+
+    def get_vocabulary(self) -> List[str]:
+        """
+        Returns every surface form the matcher recognizes.
+
+        Returns:
+            List[str]: The lower case surface forms.
+        """
+        return list(self.__vocabulary)
+
+    def __build_automaton(self) -> None:
+        """
+        Build the Aho-Corasick automaton over the words of the surface forms.
+        """
+        for form in self.__vocabulary:
+            state = 0
+            for word in form.split():
+                if word not in self.__goto[state]:
+                    self.__goto.append({})
+                    self.__fail.append(0)
+                    self.__output.append([])
+                    self.__goto[state][word] = len(self.__goto) - 1
+                state = self.__goto[state][word]
+            self.__output[state].append(form)
+
+        # Breadth first, so the failure state of every parent is known
+        # before its children are visited
+        states: Deque[int] = deque(self.__goto[0].values())
+        while states:
+            state = states.popleft()
+            for word, next_state in self.__goto[state].items():
+                fail_state = self.__fail[state]
+                while fail_state and word not in self.__goto[fail_state]:
+                    fail_state = self.__fail[fail_state]
+                self.__fail[next_state] = \
+                    self.__goto[fail_state].get(word, 0)
+                self.__output[next_state] = \
+                    self.__output[next_state] + \
+                    self.__output[self.__fail[next_state]]
+                states.append(next_state)
+
+    def __scan(self, text: str, is_first_only: bool) -> List[str]:
+        """
+        Scan the words of the text through the automaton.
+
+        Parameters:
+        text (str): The text to scan.
+        is_first_only (bool): Stop at the first keyword found.
+
+        Returns:
+        List[str]: The keywords found, in order of their last word.
+        """
+        found: List[str] = []
+        state = 0
+
+        for match in g_word_pattern.finditer(text.lower()):
+            word = match.group()
+            while state and word not in self.__goto[state]:
+                state = self.__fail[state]
+            state = self.__goto[state].get(word, 0)
+
+            if self.__output[state]:
+                found.extend(self.__output[state])
+                if is_first_only:
+                    break
+
+        return found
+
+    def find_keywords(self, text: str) -> List[str]:
+        """
+        Find every keyword in the text.
+
+        Parameters:
+        text (str): The text to analyze.
+
+        Returns:
+        List[str]: The lower case keywords found in the text.
+        """
+        if self.__backend == BACKEND_REGEX:
+            return [" ".join(match.group().lower().split())
+                    for match in self.__pattern.finditer(text)]
+        return self.__scan(text, is_first_only=False)
+
+    def has_keyword(self, text: str) -> bool:
+        """
+        Check if the text contains a keyword.
+
+        Parameters:
+        text (str): The text to analyze.
+
+        Returns:
+        bool: True if a keyword is found, False otherwise.
+        """
+        if self.__backend == BACKEND_REGEX:
+            return bool(self.__pattern.search(text))
+        return bool(self.__scan(text, is_first_only=True))
+
+
+keyword_matcher: Optional[KeywordMatcher] = None
+
+
+def get_keyword_matcher() -> KeywordMatcher:
+    """
+    Returns the keyword matcher used by has_keyword, creating it on first
+    use. The backend is selected with the KEYWORD_MATCHER_BACKEND
+    environment variable and defaults to the trie backend.
+
+    Returns:
+        KeywordMatcher: The shared keyword matcher.
+    """
+    global keyword_matcher
+    if keyword_matcher is None:
+        keyword_matcher = KeywordMatcher(
+            backend=os.getenv('KEYWORD_MATCHER_BACKEND', BACKEND_TRIE))
+    return keyword_matcher
 
 
 def has_keyword(text: str) -> bool:
@@ -12,16 +256,4 @@ def has_keyword(text: str) -> bool:
     Returns:
     bool: True if assistance-related keywords are found, False otherwise.
     """
-    pattern = re.compile(
-        r'\b(?:Help|Emergency|Fall('
-        r'?:en|ing)?|Hurt|Medication|Doctor|Nurse|Sick|Assistance|Aid'
-        r'|Distress|Panic|Suffering|Support|Alarming|Disturbance|Critical'
-        r'|Rescue|Urgent|Quick|Ache|Trouble|Need|Now|Bad|Unwell|Worsen('
-        r'?:ing)?|Stop|Difficult|Terrible|Worse|Abnormal|Unbearable|Concern'
-        r'|Serious|Intense|Dire|Dangerous|Frantic|Dreadful|Panic('
-        r'?:king)?|Fright(?:en(?:ing|ed)?)?|Terrify(?:ing)?|Urgency|Agon('
-        r'?:y|izing)|Mis(?:ery|erable)|Worr(?:y|ied)|Pain('
-        r'?:ful)?|Care\s*Bot|Care|Bot)('
-        r'?:s|es)?\b',
-        re.IGNORECASE)
-    return bool(pattern.search(text))
+    return get_keyword_matcher().has_keyword(text)
@@ -0,0 +1,147 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Generic, Iterable, Optional, TypeVar
+
+from Models.telemetry import telemetry
+
+T = TypeVar("T")
+
+ready_seconds = telemetry.gauge(
+    "carebot_resource_ready_seconds",
+    "Time it took to load and warm up each heavy resource.")
+
+
+class LazyResource(Generic[T]):
+    """
+    A heavy resource, e.g. a speech model, created on first use.
+
+    The resource is loaded once, by the first thread that needs it, while
+    the other threads wait for it. A warm-up, e.g. a dummy synthesis, can
+    run right after loading so the first real use does not pay for it. If
+    loading fails, the error is raised and the next use tries again.
+
+    A loaded resource can be checked for corruption, e.g. after an error,
+    to decide whether the process must be restarted to reload it.
+    """
+
+    def __init__(self, name: str, load: Callable[[], T],
+                 warm_up: Optional[Callable[[T], None]] = None,
+                 check: Optional[Callable[[T], bool]] = None):
+        """
+        Parameters:
+        name (str): The name of the resource in the load times.
+        load (Callable): Creates the resource.
+        warm_up (Callable, optional): Called with the resource once it is
+                                      loaded. Errors are reported and
+                                      otherwise ignored.
+        check (Callable, optional): Returns True if the resource still
+                                    works. Defaults to no check.
+        """
+        self.__name = name
+        self.__load = load
+        self.__warm_up = warm_up
+        self.__check = check
+        self.__lock = threading.Lock()
+        self.__resource: Optional[T] = None
+        self.__is_loaded = False
+        self.__load_seconds: Optional[float] = None
+
+    def get_name(self) -> str:
+        """
+        Returns the name of the resource.
+
+        Returns:
+            str: The name.
+        """
+        return self.__name
+
+    def is_loaded(self) -> bool:
+        """
+        Check if the resource is ready to use.
+
+        Returns:
+            bool: True if the resource was loaded and warmed up.
+        """
+        return self.__is_loaded
+
+    def get_load_seconds(self) -> Optional[float]:
+        """
+        Returns the time it took to load and warm up the resource.
+
+        Returns:
+            Optional[float]: The time in seconds, None if it is not loaded.
+        """
+        return self.__load_seconds
+
+    def is_healthy(self) -> bool:
+        """
+        Check that the resource still works, if it is loaded.
+
+        Returns:
+            bool: False if the check of the loaded resource failed or
+            raised an error.
+        """
+        if not self.__is_loaded or self.__check is None:
+            return True
+
+        try:
+            return bool(self.__check(self.get()))
+        except Exception as error:
+            print(f"Checking {self.__name} failed:", error)
+            return False
+
+    def get(self) -> T:
+        """
+        Returns the resource, loading it if no thread did yet.
+
+        Returns:
+            T: The resource.
+        """
+        if self.__is_loaded:
+            return self.__resource  # type: ignore[return-value]
+
+        with self.__lock:
+            if self.__is_loaded:
+                return self.__resource  # type: ignore[return-value]
+
+            start_time = time.perf_counter()
+            resource = self.__load()
+            load_seconds = time.perf_counter() - start_time
+
+            if self.__warm_up is not None:
+                try:
+                    self.__warm_up(resource)
+                except Exception as error:
+                    print(f"Warming up {self.__name} failed:", error)
+
+            self.__load_seconds = time.perf_counter() - start_time
+            self.__resource = resource
+            self.__is_loaded = True
+            ready_seconds.set(self.__load_seconds, resource=self.__name)
+
+        print(f"Loaded {self.__name} in {load_seconds:.2f} seconds, "
+              f"ready in {self.__load_seconds:.2f} seconds")
+        return resource
+
+
+def load_in_background(resources: Iterable[LazyResource]
+                       ) -> Dict[str, Future]:
+    """
+    Start loading resources in parallel, each on its own background thread.
+
+    Parameters:
+    resources (Iterable[LazyResource]): The resources to load.
+
+    Returns:
+    Dict[str, Future]: The loading of each resource by name. The result of
+                       a future is the resource.
+    """
+    resources = list(resources)
+    executor = ThreadPoolExecutor(max_workers=max(len(resources), 1),
+                                  thread_name_prefix="resource_loading")
+    futures = {resource.get_name(): executor.submit(resource.get)
+               for resource in resources}
+    # The threads exit once every resource is loaded
+    executor.shutdown(wait=False)
+    return futures
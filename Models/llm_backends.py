@@ -0,0 +1,521 @@
+import json
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Models.history_compactor import count_message_tokens
+from Models.telemetry import telemetry
+
+# Names of the LLM backends
+BACKEND_OPENAI = "openai"
+BACKEND_STAND_IN = "stand-in"
+
+OPENAI_API_BASE_URL = "https://api.openai.com/v1"
+DEFAULT_MODEL_NAME = "gpt-3.5-turbo"
+
+# Connect and read timeouts of the requests to the chat completion endpoint.
+# When streaming, the read timeout applies to every chunk.
+REQUEST_TIMEOUT_SECONDS = (3.05, 60.0)
+
+# Connections kept open to the endpoint, enough for a reply, both
+# classifications and the background summaries at the same time
+POOL_MAXSIZE = 8
+
+# Canned responses of the stand-in backend, as pairs of a pattern searched
+# in the last message and the response. The classifier prompts end with the
+# Resident's input delimited with '####'.
+DEFAULT_STAND_IN_RESPONSES: List[Tuple[str, str]] = [
+    (r"Output 'true' if the Input_Text suggests an urgent.*####[^#]*"
+     r"\b(?:help|fell|fallen|hurts?|pain|breathe|chest|emergency)\b"
+     r"[^#]*####\W*$", "true"),
+    (r"Output 'true' if the Input_Text suggests an urgent", "false"),
+    (r"Output 'true' if the Input_Text suggests an intent to end.*####"
+     r"[^#]*\b(?:bye|goodbye|talk to you later)\b[^#]*####\W*$", "true"),
+    (r"Output 'true' if the Input_Text suggests an intent to end", "false"),
+]
+DEFAULT_STAND_IN_REPLY = "I am here with you. Could you tell me more?"
+
+request_seconds = telemetry.histogram(
+    "carebot_llm_request_seconds",
+    "Duration of the completions, to the end of streamed ones.")
+first_token_seconds = telemetry.histogram(
+    "carebot_llm_first_token_seconds",
+    "Time to the first piece of the streamed completions.")
+tokens = telemetry.counter(
+    "carebot_llm_tokens_total",
+    "Tokens of the prompts and the completions, estimated when the backend "
+    "does not report them.")
+errors = telemetry.counter(
+    "carebot_llm_errors_total", "Completions that failed.")
+
+
+class LLMError(Exception):
+    """
+    Raised when the LLM backend could not produce a completion.
+
+    Attributes:
+    status_code (Optional[int]): The HTTP status code of the failed request,
+                                 None if no response was received.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def record_completion(backend: str, operation: str, start_time: float,
+                      messages: List[Dict[str, str]], content: str,
+                      usage: Optional[Dict[str, int]] = None) -> None:
+    """
+    Record the duration and the tokens of a completion in the metrics.
+
+    Parameters:
+    backend (str): The name of the backend.
+    operation (str): 'complete' or 'stream'.
+    start_time (float): The perf_counter time the completion started.
+    messages (List[Dict[str, str]]): The chat messages of the prompt.
+    content (str): The completion.
+    usage (Dict[str, int], optional): The tokens reported by the backend.
+                                      Defaults to estimating them.
+    """
+    if not telemetry.is_enabled():
+        return
+
+    request_seconds.observe(time.perf_counter() - start_time,
+                            operation=operation, backend=backend)
+    if usage:
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    else:
+        prompt_tokens = sum(count_message_tokens(message)
+                            for message in messages)
+        completion_tokens = count_message_tokens(
+            {"role": "assistant", "content": content})
+    tokens.inc(prompt_tokens, kind="prompt", backend=backend)
+    tokens.inc(completion_tokens, kind="completion", backend=backend)
+
+
+def measure_stream(pieces: Iterator[str], backend: str,
+                   messages: List[Dict[str, str]]) -> Iterator[str]:
+    """
+    Record the time to the first piece, the duration and the tokens of a
+    streamed completion in the metrics, as it is read.
+
+    Parameters:
+    pieces (Iterator[str]): The pieces of the completion.
+    backend (str): The name of the backend.
+    messages (List[Dict[str, str]]): The chat messages of the prompt.
+
+    Returns:
+    Iterator[str]: The pieces, unchanged.
+    """
+    if not telemetry.is_enabled():
+        return pieces
+
+    def measured_pieces() -> Iterator[str]:
+        start_time = time.perf_counter()
+        content: List[str] = []
+        try:
+            for piece in pieces:
+                if not content:
+                    first_token_seconds.observe(
+                        time.perf_counter() - start_time, backend=backend)
+                content.append(piece)
+                yield piece
+        except LLMError:
+            errors.inc(operation="stream", backend=backend)
+            raise
+        record_completion(backend, "stream", start_time, messages,
+                          "".join(content))
+
+    return measured_pieces()
+
+
+class LLMBackend(ABC):
+    """
+    The interface of the chat completion backends the prompts are sent to.
+    """
+
+    @abstractmethod
+    def get_model_name(self) -> str:
+        """
+        Returns the name of the model completing the prompts.
+
+        Returns:
+            str: The model name.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, messages: List[Dict[str, str]],
+                 max_tokens: int = 1000, temperature: float = 0.0) -> str:
+        """
+        Complete a chat.
+
+        Parameters:
+        messages (List[Dict[str, str]]): The chat messages, each a dict with
+                                         'role' and 'content' keys.
+        max_tokens (int): The maximum number of tokens of the completion.
+        temperature (float): The sampling temperature.
+
+        Returns:
+        str: The content of the completion.
+
+        Raises:
+        LLMError: If the completion failed.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stream(self, messages: List[Dict[str, str]],
+               max_tokens: int = 1000,
+               temperature: float = 0.0) -> Iterator[str]:
+        """
+        Complete a chat, yielding the completion as it is generated.
+
+        Parameters:
+        messages (List[Dict[str, str]]): The chat messages, each a dict with
+                                         'role' and 'content' keys.
+        max_tokens (int): The maximum number of tokens of the completion.
+        temperature (float): The sampling temperature.
+
+        Yields:
+        str: The pieces of the completion, in order.
+
+        Raises:
+        LLMError: If the completion failed.
+        """
+        raise NotImplementedError
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    Sends the prompts to an OpenAI compatible chat completion endpoint,
+    reusing pooled keep-alive HTTP connections across requests, so only the
+    first request pays for the connection and TLS setup.
+    """
+
+    def __init__(self, api_key: Optional[str],
+                 model_name: str = DEFAULT_MODEL_NAME,
+                 base_url: str = OPENAI_API_BASE_URL,
+                 pool_maxsize: int = POOL_MAXSIZE):
+        self.__model_name = model_name
+        self.__url = f"{base_url.rstrip('/')}/chat/completions"
+        self.__session = requests.Session()
+        if api_key:
+            self.__session.headers["Authorization"] = f"Bearer {api_key}"
+        self.__session.mount(base_url, HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_maxsize))
+
+    def get_model_name(self) -> str:
+        return self.__model_name
+
+    def __post(self, messages: List[Dict[str, str]], max_tokens: int,
+               temperature: float, is_stream: bool) -> requests.Response:
+        try:
+            response = self.__session.post(
+                self.__url,
+                json={"model": self.__model_name, "messages": messages,
+                      "max_tokens": max_tokens, "n": 1,
+                      "temperature": temperature, "stream": is_stream},
+                stream=is_stream, timeout=REQUEST_TIMEOUT_SECONDS)
+        except requests.RequestException as error:
+            raise LLMError(f"Request failed: {error}") from error
+
+        if response.status_code >= 400:
+            # Read the body, so the connection goes back to the pool
+            message = f"HTTP {response.status_code}: {response.text}"
+            raise LLMError(message, response.status_code)
+
+        return response
+
+    def complete(self, messages: List[Dict[str, str]],
+                 max_tokens: int = 1000, temperature: float = 0.0) -> str:
+        start_time = time.perf_counter()
+        try:
+            response = self.__post(messages, max_tokens, temperature, False)
+            try:
+                data = response.json()
+                content = data["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError) as error:
+                raise LLMError(
+                    f"Invalid response: {response.text}") from error
+        except LLMError:
+            errors.inc(operation="complete", backend=BACKEND_OPENAI)
+            raise
+
+        record_completion(BACKEND_OPENAI, "complete", start_time, messages,
+                          content, data.get("usage"))
+        return content
+
+    def stream(self, messages: List[Dict[str, str]],
+               max_tokens: int = 1000,
+               temperature: float = 0.0) -> Iterator[str]:
+        return measure_stream(
+            self.__stream(messages, max_tokens, temperature),
+            BACKEND_OPENAI, messages)
+
+    def __stream(self, messages: List[Dict[str, str]], max_tokens: int,
+                 temperature: float) -> Iterator[str]:
+        response = self.__post(messages, max_tokens, temperature, True)
+
+        # Closing the response when the caller stops early drops the
+        # connection instead of reading the rest of the completion
+        with response:
+            try:
+                # Server-sent events, one 'data: <json>' line per chunk
+                for line in response.iter_lines():
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        # Read on to the end of the response, so the
+                        # connection goes back to the pool
+                        continue
+                    content = json.loads(data)["choices"][0]["delta"].get(
+                        "content")
+                    if content:
+                        yield content
+            except requests.RequestException as error:
+                raise LLMError(f"Stream failed: {error}") from error
+            except (ValueError, KeyError, IndexError) as error:
+                raise LLMError(f"Invalid stream chunk: {error}") from error
+
+
+class StandInBackend(LLMBackend):
+    """
+    A local stand-in of the LLM answering with canned responses after a
+    configurable latency, so the program, the tests and the benchmarks can
+    run without network access.
+    """
+
+    def __init__(self,
+                 responses: Optional[List[Tuple[str, str]]] = None,
+                 default_response: str = DEFAULT_STAND_IN_REPLY,
+                 latency_seconds: float = 0.0,
+                 token_latency_seconds: float = 0.0,
+                 model_name: str = BACKEND_STAND_IN):
+        """
+        Parameters:
+        responses (List[Tuple[str, str]], optional): Pairs of a pattern
+            searched in the last message, ignoring case, and the response.
+            The first match is used. Defaults to answering the classifier
+            prompts from keywords of the input.
+        default_response (str): The response when no pattern matches.
+        latency_seconds (float): The delay before the response, or before
+                                 its first piece when streaming.
+        token_latency_seconds (float): The delay between streamed pieces.
+        model_name (str): The model name reported by the backend.
+        """
+        if responses is None:
+            responses = DEFAULT_STAND_IN_RESPONSES
+        self.__responses = [
+            (re.compile(pattern, re.IGNORECASE | re.DOTALL), response)
+            for pattern, response in responses]
+        self.__default_response = default_response
+        self.__latency_seconds = latency_seconds
+        self.__token_latency_seconds = token_latency_seconds
+        self.__model_name = model_name
+        self.__lock = threading.Lock()
+        self.__request_count = 0
+
+    def get_model_name(self) -> str:
+        return self.__model_name
+
+    def get_request_count(self) -> int:
+        """
+        Returns the number of completions requested so far.
+
+        Returns:
+            int: The number of requests.
+        """
+        with self.__lock:
+            return self.__request_count
+
+    def respond(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Returns the canned response to a chat, without any latency.
+
+        Parameters:
+        messages (List[Dict[str, str]]): The chat messages.
+
+        Returns:
+        str: The response of the first matching pattern, or the default
+             response.
+        """
+        with self.__lock:
+            self.__request_count += 1
+
+        last_message = messages[-1]["content"] if messages else ""
+        for pattern, response in self.__responses:
+            if pattern.search(last_message):
+                return response
+        return self.__default_response
+
+    def complete(self, messages: List[Dict[str, str]],
+                 max_tokens: int = 1000, temperature: float = 0.0) -> str:
+        start_time = time.perf_counter()
+        response_text = self.respond(messages)
+        time.sleep(self.__latency_seconds)
+        record_completion(BACKEND_STAND_IN, "complete", start_time, messages,
+                          response_text)
+        return response_text
+
+    def stream(self, messages: List[Dict[str, str]],
+               max_tokens: int = 1000,
+               temperature: float = 0.0) -> Iterator[str]:
+        return measure_stream(self.__stream(messages), BACKEND_STAND_IN,
+                              messages)
+
+    def __stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        response_text = self.respond(messages)
+        time.sleep(self.__latency_seconds)
+
+        # One piece per word, with the whitespace that precedes it
+        for index, piece in enumerate(re.findall(r"\s*\S+", response_text)):
+            if index > 0:
+                time.sleep(self.__token_latency_seconds)
+            yield piece
+
+
+class StandInLLMServer(ThreadingHTTPServer):
+    """
+    A local HTTP server exposing a stand-in backend as an OpenAI compatible
+    chat completion endpoint, to exercise OpenAIBackend and its connection
+    handling without network access.
+    """
+
+    def __init__(self, backend: StandInBackend,
+                 address: Tuple[str, int] = ("127.0.0.1", 0)):
+        # Shared with the handler, where the private attributes of the
+        # server are out of reach
+        lock = threading.Lock()
+        connection_count = [0]
+        self.__lock = lock
+        self.__connection_count = connection_count
+        self.__thread: Optional[threading.Thread] = None
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so clients can reuse their connections
+            protocol_version = "HTTP/1.1"
+
+            def setup(handler) -> None:
+                super().setup()
+                with lock:
+                    connection_count[0] += 1
+
+            def do_POST(handler) -> None:
+                length = int(handler.headers.get("Content-Length", 0))
+                request = json.loads(handler.rfile.read(length))
+                if request.get("stream"):
+                    handler.send_stream(request["messages"])
+                else:
+                    handler.send_completion(request["messages"])
+
+            def send_completion(handler,
+                                messages: List[Dict[str, str]]) -> None:
+                content = backend.complete(messages)
+                data = json.dumps({"choices": [{"message": {
+                    "role": "assistant", "content": content}}]}).encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", "application/json")
+                handler.send_header("Content-Length", str(len(data)))
+                handler.end_headers()
+                handler.wfile.write(data)
+
+            def send_stream(handler,
+                            messages: List[Dict[str, str]]) -> None:
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/event-stream")
+                handler.send_header("Transfer-Encoding", "chunked")
+                handler.end_headers()
+
+                for piece in backend.stream(messages):
+                    handler.send_chunk(json.dumps({"choices": [{
+                        "delta": {"content": piece}}]}))
+                handler.send_chunk("[DONE]")
+                handler.wfile.write(b"0\r\n\r\n")
+                handler.wfile.flush()
+
+            def send_chunk(handler, data: str) -> None:
+                event = f"data: {data}\n\n".encode()
+                handler.wfile.write(f"{len(event):x}\r\n".encode() + event
+                                    + b"\r\n")
+                handler.wfile.flush()
+
+            def log_message(handler, *args) -> None:
+                pass
+
+        super().__init__(address, Handler)
+
+    def get_base_url(self) -> str:
+        """
+        Returns the base URL to give to OpenAIBackend.
+
+        Returns:
+            str: The base URL of the endpoint.
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def get_connection_count(self) -> int:
+        """
+        Returns the number of connections accepted so far.
+
+        Returns:
+            int: The number of connections.
+        """
+        with self.__lock:
+            return self.__connection_count[0]
+
+    def start(self) -> None:
+        """
+        Serve requests on a background thread.
+        """
+        self.__thread = threading.Thread(
+            target=self.serve_forever, args=(0.05,), name="stand_in_llm",
+            daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop serving requests and close the server.
+        """
+        self.shutdown()
+        self.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+
+def create_llm_backend(name: str, api_key: Optional[str] = None,
+                       model_name: str = DEFAULT_MODEL_NAME,
+                       base_url: str = OPENAI_API_BASE_URL,
+                       stand_in_latency_seconds: float = 0.0) -> LLMBackend:
+    """
+    Create an LLM backend.
+
+    Parameters:
+    name (str): 'openai' or 'stand-in'.
+    api_key (str, optional): The API key of the OpenAI backend.
+    model_name (str): The model of the OpenAI backend.
+    base_url (str): The base URL of the OpenAI backend's endpoint.
+    stand_in_latency_seconds (float): The latency of the stand-in backend.
+
+    Returns:
+    LLMBackend: The backend.
+
+    Raises:
+    ValueError: If the backend name is unknown.
+    """
+    if name == BACKEND_OPENAI:
+        return OpenAIBackend(api_key, model_name, base_url)
+    if name == BACKEND_STAND_IN:
+        return StandInBackend(latency_seconds=stand_in_latency_seconds)
+    raise ValueError(f"Unknown LLM backend: {name}")
@@ -1,30 +1,156 @@
+import threading
+from concurrent.futures import Future
+
 from Models.chatgpt_prompts import generate_response, \
-    summarize_conversation_history, \
+    generate_response_stream, summarize_conversation_history, \
     is_urgent_assistance_needed, is_intent_to_end_conversation, \
-    append_conversation_history
+    append_conversation_history, generate_turn, TurnResult, \
+    caregiver_summary, build_urgent_alert, format_transcript, \
+    classifier_cache
+
+from Models.checkpoint import conversation_checkpoint
+from Models.lazy_resource import LazyResource, load_in_background
+from Models.telemetry import telemetry, start_telemetry_export
+from Models.sms_twilio import send_mms, enqueue_mms, start_outbox, \
+    client as twilio_client
+from Models.voice_recognition import transcribe_audio, \
+    listen_for_keywords, barge_in_monitor, get_asr_resources
+from Models.urgency_triage import urgency_triage, TRIAGE_URGENT, \
+    TRIAGE_BENIGN
+from Models.utilities import beep, play_cue, prerender_cues, mixer
+from Models.voice_synthesis import process_and_play_response, \
+    process_and_play_stream, prewarm_synthesis_cache, is_synthesis_ready, \
+    tts
+from typing import Callable, List, Dict, Generator, Iterable, Optional
+
+
+def get_heavy_resources() -> List[LazyResource]:
+    """
+    Returns the resources that are loaded on first use, speech recognition
+    first.
 
-from Models.sms_twilio import send_mms
-from Models.voice_recognition import transcribe_audio, listen_for_keywords
-from Models.utilities import beep
-from Models.voice_synthesis import process_and_play_response
-from typing import List, Dict
+    Returns:
+        List[LazyResource]: The resources.
+    """
+    return get_asr_resources() + [mixer, tts, twilio_client]
 
 
+# The counters kept by the triage and the cache are read when the metrics
+# are exported
+telemetry.gauge("carebot_urgency_triage_verdicts",
+                "Utterances triaged locally, by verdict.",
+                urgency_triage.get_counters, "verdict")
+telemetry.gauge("carebot_classifier_cache",
+                "Lookups of the classifier cache and its hit rate.",
+                classifier_cache.get_stats, "stat")
+
+
+@telemetry.trace_methods("model")
 class CareBotModel:
+    @staticmethod
+    def start_telemetry_export():
+        start_telemetry_export()
+
+    @staticmethod
+    def start_warm_up() -> Dict[str, Future]:
+        return load_in_background(get_heavy_resources())
+
+    @staticmethod
+    def get_load_times() -> Dict[str, Optional[float]]:
+        return {resource.get_name(): resource.get_load_seconds()
+                for resource in get_heavy_resources()}
+
+    @staticmethod
+    def are_resources_healthy() -> bool:
+        # Every resource is checked, so each failure is reported
+        return all([resource.is_healthy()
+                    for resource in get_heavy_resources()])
+
+    @staticmethod
+    def is_synthesis_ready(text: str) -> bool:
+        return is_synthesis_ready(text)
+
+    @staticmethod
+    def save_conversation_checkpoint(
+            conversation_history: List[Dict[str, str]]):
+        conversation_checkpoint.save(conversation_history)
+
+    @staticmethod
+    def load_conversation_checkpoint() -> List[Dict[str, str]]:
+        return conversation_checkpoint.load()
+
+    @staticmethod
+    def clear_conversation_checkpoint():
+        conversation_checkpoint.clear()
+
     @staticmethod
     def generate_response(
-            input_text: str, conversation_history: List[Dict[str, str]]):
-        return generate_response(input_text, conversation_history)
+            input_text: str, conversation_history: List[Dict[str, str]],
+            is_save_conversation_history: bool = True):
+        return generate_response(input_text, conversation_history,
+                                 is_save_conversation_history)
+
+    @staticmethod
+    def generate_response_stream(
+            input_text: str,
+            conversation_history: List[Dict[str, str]],
+            is_save_conversation_history: bool = True
+    ) -> Generator[str, None, None]:
+        return generate_response_stream(input_text, conversation_history,
+                                        is_save_conversation_history)
+
+    @staticmethod
+    def generate_turn(
+            input_text: str,
+            conversation_history: List[Dict[str, str]]) -> TurnResult:
+        return generate_turn(input_text, conversation_history)
 
     @staticmethod
     def summarize_conversation_history(
             conversation_history: List[Dict[str, str]]):
         return summarize_conversation_history(conversation_history)
 
+    @staticmethod
+    def update_caregiver_summary(
+            conversation_history: List[Dict[str, str]]):
+        caregiver_summary.update(conversation_history)
+
+    @staticmethod
+    def get_caregiver_summary(
+            conversation_history: List[Dict[str, str]]) -> str:
+        return caregiver_summary.get(conversation_history)
+
+    @staticmethod
+    def reset_caregiver_summary():
+        caregiver_summary.reset()
+
+    @staticmethod
+    def build_urgent_alert(input_text: str) -> str:
+        return build_urgent_alert(input_text)
+
+    @staticmethod
+    def format_transcript(messages: List[Dict[str, str]]) -> str:
+        return format_transcript(messages)
+
     @staticmethod
     def is_urgent_assistance_needed(input_text: str):
+        # Clear emergencies and clearly benign utterances are triaged
+        # locally, only the remaining ones are sent to the LLM
+        verdict = urgency_triage.triage(input_text)
+        if verdict == TRIAGE_URGENT:
+            return True
+        if verdict == TRIAGE_BENIGN:
+            return False
         return is_urgent_assistance_needed(input_text)
 
+    @staticmethod
+    def get_urgency_triage_counters() -> Dict[str, int]:
+        return urgency_triage.get_counters()
+
+    @staticmethod
+    def get_classifier_cache_stats() -> Dict[str, float]:
+        return classifier_cache.get_stats()
+
     @staticmethod
     def is_intent_to_end_conversation(input_text: str):
         return is_intent_to_end_conversation(input_text)
@@ -33,6 +159,15 @@ class CareBotModel:
     def send_mms(message: str):
         send_mms(message)
 
+    @staticmethod
+    def enqueue_mms(message: str,
+                    on_sent: Optional[Callable[[], None]] = None) -> int:
+        return enqueue_mms(message, on_sent)
+
+    @staticmethod
+    def start_outbox():
+        start_outbox()
+
     @staticmethod
     def transcribe_audio():
         return transcribe_audio()
@@ -41,13 +176,46 @@ class CareBotModel:
     def listen_for_keywords():
         return listen_for_keywords()
 
+    @staticmethod
+    def start_barge_in_monitor(on_barge_in: Callable[[], None]):
+        barge_in_monitor.start(on_barge_in)
+
+    @staticmethod
+    def add_barge_in_spoken_text(text: str):
+        barge_in_monitor.add_spoken_text(text)
+
+    @staticmethod
+    def stop_barge_in_monitor(is_wait: bool = True) -> Optional[str]:
+        return barge_in_monitor.stop(is_wait)
+
     @staticmethod
     def beep(frequency: int, duration: int):
         beep(frequency, duration)
 
     @staticmethod
-    def process_and_play_response(message: str):
-        process_and_play_response(message)
+    def play_cue(name: str):
+        play_cue(name)
+
+    @staticmethod
+    def prerender_cues():
+        prerender_cues()
+
+    @staticmethod
+    def process_and_play_response(
+            message: str, is_cache: bool = False,
+            stop_event: Optional[threading.Event] = None):
+        process_and_play_response(message, is_cache, stop_event)
+
+    @staticmethod
+    def prewarm_synthesis_cache(phrases: Iterable[str]):
+        prewarm_synthesis_cache(phrases)
+
+    @staticmethod
+    def process_and_play_stream(
+            sentences: Iterable[str], start_time: Optional[float] = None,
+            stop_event: Optional[threading.Event] = None
+    ) -> Optional[float]:
+        return process_and_play_stream(sentences, start_time, stop_event)
 
     @staticmethod
     def append_conversation_history(
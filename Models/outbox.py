@@ -0,0 +1,337 @@
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Models.telemetry import telemetry
+
+TWILIO_API_BASE_URL = "https://api.twilio.com"
+
+# Statuses of the messages in the outbox
+STATUS_PENDING = "pending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+# Twilio message statuses that indicate the message was accepted
+ACCEPTED_TWILIO_STATUSES = ["accepted", "queued", "sending", "sent",
+                            "delivered"]
+
+# Seconds to wait before retrying a failed send, doubled after every
+# further failure up to the maximum
+INITIAL_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 300.0
+
+# Connect and read timeouts of the requests to the messages endpoint
+REQUEST_TIMEOUT_SECONDS = (3.05, 15.0)
+
+send_attempts = telemetry.counter(
+    "carebot_caregiver_messages_total",
+    "Attempts to send a caregiver message, by the resulting status.")
+
+
+class SendError(Exception):
+    """
+    Raised when a message could not be sent.
+
+    Attributes:
+    is_permanent (bool): True if retrying can not succeed, e.g. the request
+                         was rejected as invalid.
+    """
+
+    def __init__(self, message: str, is_permanent: bool = False):
+        super().__init__(message)
+        self.is_permanent = is_permanent
+
+
+class TwilioMessagesClient:
+    """
+    Sends messages through the Twilio Messages REST endpoint, reusing
+    pooled HTTP connections across messages.
+    """
+
+    def __init__(self, account_sid: str, auth_token: str,
+                 base_url: str = TWILIO_API_BASE_URL):
+        self.__url = f"{base_url.rstrip('/')}/2010-04-01/Accounts/" \
+                     f"{account_sid}/Messages.json"
+        self.__session = requests.Session()
+        self.__session.auth = (account_sid, auth_token)
+        self.__session.mount(base_url, HTTPAdapter(pool_maxsize=2))
+
+    def send(self, body: str, from_number: str, to_number: str) -> str:
+        """
+        Send a message.
+
+        Parameters:
+        body (str): The content of the message.
+        from_number (str): The Twilio phone number to send from.
+        to_number (str): The phone number to send to.
+
+        Returns:
+        str: The SID of the message.
+
+        Raises:
+        SendError: If the message was not accepted.
+        """
+        try:
+            response = self.__session.post(
+                self.__url,
+                data={"Body": body, "From": from_number, "To": to_number},
+                timeout=REQUEST_TIMEOUT_SECONDS)
+        except requests.RequestException as error:
+            raise SendError(f"Request failed: {error}") from error
+
+        if response.status_code >= 400:
+            # Rate limiting and server errors are transient
+            is_permanent = response.status_code < 500 and \
+                response.status_code != 429
+            raise SendError(f"HTTP {response.status_code}: {response.text}",
+                            is_permanent)
+
+        try:
+            message = response.json()
+        except ValueError as error:
+            raise SendError(f"Invalid response: {response.text}") from error
+
+        if message.get("status") not in ACCEPTED_TWILIO_STATUSES:
+            raise SendError(f"Message status {message.get('status')}")
+
+        return str(message.get("sid", ""))
+
+
+class MessageOutbox:
+    """
+    A durable outbox of caregiver messages.
+
+    Messages are stored in an SQLite database as soon as they are enqueued
+    and sent by a background worker, which retries failed sends with
+    exponential backoff. Messages that are still pending when the program
+    stops are sent after it restarts.
+    """
+
+    def __init__(self, database_path: str, client: TwilioMessagesClient,
+                 from_number: str, to_number: str,
+                 initial_backoff: float = INITIAL_BACKOFF_SECONDS,
+                 max_backoff: float = MAX_BACKOFF_SECONDS):
+        self.__database_path = database_path
+        self.__client = client
+        self.__from_number = from_number
+        self.__to_number = to_number
+        self.__initial_backoff = initial_backoff
+        self.__max_backoff = max_backoff
+        self.__condition = threading.Condition()
+        self.__thread: Optional[threading.Thread] = None
+        self.__is_running = False
+        # Set when a message is enqueued, so the worker does not sleep
+        # through it
+        self.__is_enqueued = False
+        # Called once a message has been sent, by message id. Not persisted.
+        self.__on_sent_callbacks: Dict[int, Callable[[], None]] = {}
+
+        # The database is created on first use, so creating an outbox
+        # leaves nothing on disk
+        self.__is_database_created = False
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        Open a connection to the database. Every call uses its own
+        connection, so the outbox can be used from any thread.
+        """
+        connection = sqlite3.connect(self.__database_path, timeout=30.0)
+        if not self.__is_database_created:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS messages ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "body TEXT NOT NULL, "
+                    "from_number TEXT NOT NULL, "
+                    "to_number TEXT NOT NULL, "
+                    "status TEXT NOT NULL, "
+                    "attempts INTEGER NOT NULL DEFAULT 0, "
+                    "next_attempt_at REAL NOT NULL, "
+                    "created_at REAL NOT NULL, "
+                    "sent_at REAL, "
+                    "sid TEXT, "
+                    "last_error TEXT)")
+            self.__is_database_created = True
+        return connection
+
+    def enqueue(self, body: str,
+                on_sent: Optional[Callable[[], None]] = None) -> int:
+        """
+        Store a message for the caregiver and wake up the worker. Returns
+        without waiting for the message to be sent.
+
+        Parameters:
+        body (str): The content of the message.
+        on_sent (Callable, optional): Called on the worker thread once the
+                                      message has been sent.
+
+        Returns:
+        int: The id of the message in the outbox.
+        """
+        now = time.time()
+        # The callback is registered under the lock the worker takes before
+        # calling it, so a worker that sends the message as soon as it is
+        # stored still finds it
+        with self.__condition:
+            with closing(self.__connect()) as connection, connection:
+                cursor = connection.execute(
+                    "INSERT INTO messages (body, from_number, to_number, "
+                    "status, next_attempt_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (body, self.__from_number, self.__to_number,
+                     STATUS_PENDING, now, now))
+                message_id = int(cursor.lastrowid)
+
+            if on_sent is not None:
+                self.__on_sent_callbacks[message_id] = on_sent
+            self.__is_enqueued = True
+            self.__condition.notify_all()
+
+        return message_id
+
+    def get_message(self, message_id: int) -> Optional[Dict]:
+        """
+        Returns a message of the outbox.
+
+        Parameters:
+        message_id (int): The id of the message.
+
+        Returns:
+        Optional[Dict]: The columns of the message, or None if there is no
+                        such message.
+        """
+        with closing(self.__connect()) as connection:
+            connection.row_factory = sqlite3.Row
+            row = connection.execute("SELECT * FROM messages WHERE id = ?",
+                                     (message_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_pending_count(self) -> int:
+        """
+        Returns the number of messages waiting to be sent.
+
+        Returns:
+            int: The number of pending messages.
+        """
+        with closing(self.__connect()) as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM messages WHERE status = ?",
+                (STATUS_PENDING,)).fetchone()[0]
+
+    def __get_due_messages(self, now: float) -> List[sqlite3.Row]:
+        with closing(self.__connect()) as connection:
+            connection.row_factory = sqlite3.Row
+            return connection.execute(
+                "SELECT * FROM messages WHERE status = ? AND "
+                "next_attempt_at <= ? ORDER BY id",
+                (STATUS_PENDING, now)).fetchall()
+
+    def __get_next_attempt_time(self) -> Optional[float]:
+        with closing(self.__connect()) as connection:
+            return connection.execute(
+                "SELECT MIN(next_attempt_at) FROM messages WHERE status = ?",
+                (STATUS_PENDING,)).fetchone()[0]
+
+    def dispatch_pending(self) -> int:
+        """
+        Try to send every pending message that is due, oldest first.
+
+        Parameters are taken from the stored messages, so messages enqueued
+        before a restart are sent with the numbers they were enqueued with.
+
+        Returns:
+        int: The number of messages sent.
+        """
+        sent_count = 0
+
+        for message in self.__get_due_messages(time.time()):
+            attempts = message["attempts"] + 1
+            try:
+                sid = self.__client.send(message["body"],
+                                         message["from_number"],
+                                         message["to_number"])
+            except SendError as error:
+                backoff = min(self.__initial_backoff * 2 ** (attempts - 1),
+                              self.__max_backoff)
+                status = STATUS_FAILED if error.is_permanent \
+                    else STATUS_PENDING
+                send_attempts.inc(status=status)
+                print(f"Sending caregiver message {message['id']} failed "
+                      f"(attempt {attempts}): {error}")
+                with closing(self.__connect()) as connection, connection:
+                    connection.execute(
+                        "UPDATE messages SET status = ?, attempts = ?, "
+                        "next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (status, attempts, time.time() + backoff, str(error),
+                         message["id"]))
+                continue
+
+            with closing(self.__connect()) as connection, connection:
+                connection.execute(
+                    "UPDATE messages SET status = ?, attempts = ?, "
+                    "sent_at = ?, sid = ? WHERE id = ?",
+                    (STATUS_SENT, attempts, time.time(), sid, message["id"]))
+            sent_count += 1
+            send_attempts.inc(status=STATUS_SENT)
+
+            with self.__condition:
+                on_sent = self.__on_sent_callbacks.pop(message["id"], None)
+            if on_sent is not None:
+                on_sent()
+
+        return sent_count
+
+    def start(self) -> None:
+        """
+        Start the background worker, if it is not running already. Messages
+        left pending by a previous run are sent right away.
+        """
+        with self.__condition:
+            if self.__is_running:
+                return
+            self.__is_running = True
+            self.__thread = threading.Thread(
+                target=self.__work, name="outbox", daemon=True)
+            self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background worker. Pending messages stay in the outbox.
+        """
+        with self.__condition:
+            self.__is_running = False
+            self.__condition.notify_all()
+
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __work(self) -> None:
+        """
+        Send due messages until stopped, sleeping until the next message is
+        due or a new message is enqueued.
+        """
+        while self.__is_running:
+            with self.__condition:
+                self.__is_enqueued = False
+
+            try:
+                self.dispatch_pending()
+                next_attempt_time = self.__get_next_attempt_time()
+            except sqlite3.Error as error:
+                print("Caregiver outbox error:", error)
+                next_attempt_time = time.time() + self.__initial_backoff
+
+            with self.__condition:
+                if not self.__is_running:
+                    break
+                if self.__is_enqueued:
+                    continue
+                timeout = None if next_attempt_time is None \
+                    else max(next_attempt_time - time.time(), 0.0)
+                self.__condition.wait(timeout)
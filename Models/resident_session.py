@@ -0,0 +1,330 @@
+import json
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import Deque, Iterator, Optional, Tuple
+
+# Kinds of the frames exchanged with a room. Audio frames carry 16 bit mono
+# PCM at the session's sample rate, text frames carry UTF-8 JSON.
+FRAME_AUDIO = b"A"
+FRAME_TEXT = b"T"
+# Sent to the room to stop playing the audio already sent
+FRAME_STOP = b"S"
+
+# A frame is its kind and the length of its payload, then the payload
+FRAME_HEADER = struct.Struct("!cI")
+MAX_FRAME_BYTES = 1024 * 1024
+
+# Number of received audio chunks kept for a listener that falls behind
+DEFAULT_BUFFER_CHUNKS = 60
+
+# Seconds between checks of the stop event while audio plays in the room
+PLAYBACK_CHECK_SECONDS = 0.05
+
+
+class SessionClosedError(Exception):
+    """
+    Raised when the room of a session disconnected.
+    """
+
+
+def write_frame(connection: socket.socket, kind: bytes,
+                payload: bytes) -> None:
+    """
+    Send a frame.
+
+    Parameters:
+    connection (socket.socket): The connection to send the frame on.
+    kind (bytes): The kind of the frame, e.g. FRAME_AUDIO.
+    payload (bytes): The payload of the frame.
+    """
+    connection.sendall(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def read_exactly(connection: socket.socket, size: int) -> Optional[bytes]:
+    """
+    Receive a number of bytes.
+
+    Parameters:
+    connection (socket.socket): The connection to receive from.
+    size (int): The number of bytes.
+
+    Returns:
+    Optional[bytes]: The bytes, or None if the connection closed first.
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if len(chunk) == 0:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def read_frame(connection: socket.socket) -> Optional[Tuple[bytes, bytes]]:
+    """
+    Receive a frame.
+
+    Parameters:
+    connection (socket.socket): The connection to receive from.
+
+    Returns:
+    Optional[Tuple[bytes, bytes]]: The kind and the payload of the frame,
+                                   or None if the connection closed.
+
+    Raises:
+    ValueError: If the frame is larger than MAX_FRAME_BYTES.
+    """
+    header = read_exactly(connection, FRAME_HEADER.size)
+    if header is None:
+        return None
+
+    kind, size = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame of {size} bytes is too large")
+
+    payload = read_exactly(connection, size)
+    if payload is None:
+        return None
+    return kind, payload
+
+
+class ResidentSession:
+    """
+    The audio connection of one room to the Care-Bot server.
+
+    The room streams the microphone audio as audio frames and plays the
+    audio frames it receives. Its first frame may be a text frame with a
+    JSON object naming the room, e.g. {"room": "12"}. Care-Bot's messages
+    are sent to the room as text frames.
+
+    Received audio is kept in a bounded buffer that frames() iterates over,
+    like the microphone capture service, and audio received while nobody
+    listens is dropped.
+    """
+
+    def __init__(self, session_id: str, connection: socket.socket,
+                 sample_rate: int,
+                 buffer_chunks: int = DEFAULT_BUFFER_CHUNKS):
+        """
+        Parameters:
+        session_id (str): The identifier of the session.
+        connection (socket.socket): The connected socket of the room.
+        sample_rate (int): The sample rate of the audio in both directions.
+        buffer_chunks (int): The number of received chunks kept.
+        """
+        self.__session_id = session_id
+        self.__connection = connection
+        self.__sample_rate = sample_rate
+        self.__room = session_id
+        self.__buffer: Deque[bytes] = deque(maxlen=buffer_chunks)
+        # Sequence number of the next chunk appended to the buffer
+        self.__next_sequence = 0
+        self.__is_closed = False
+        self.__condition = threading.Condition()
+        self.__send_lock = threading.Lock()
+        # Time the audio sent to the room will have finished playing
+        self.__playback_end_time = 0.0
+        self.__reader: Optional[threading.Thread] = None
+
+    def get_session_id(self) -> str:
+        """
+        Returns the identifier of the session.
+
+        Returns:
+            str: The session identifier.
+        """
+        return self.__session_id
+
+    def get_room(self) -> str:
+        """
+        Returns the name of the room, as sent by the room, or the session
+        identifier if it sent none.
+
+        Returns:
+            str: The room.
+        """
+        return self.__room
+
+    def get_sample_rate(self) -> int:
+        """
+        Returns the sample rate of the audio in both directions.
+
+        Returns:
+            int: The sample rate in Hertz.
+        """
+        return self.__sample_rate
+
+    def is_closed(self) -> bool:
+        """
+        Returns whether the room disconnected or the session was closed.
+
+        Returns:
+            bool: True if the session is closed.
+        """
+        return self.__is_closed
+
+    def start(self) -> None:
+        """
+        Start receiving the frames of the room on a background thread.
+        """
+        self.__reader = threading.Thread(
+            target=self.__receive, name=f"session_{self.__session_id}",
+            daemon=True)
+        self.__reader.start()
+
+    def close(self) -> None:
+        """
+        Close the connection. Listeners stop with SessionClosedError.
+        """
+        with self.__condition:
+            self.__is_closed = True
+            self.__condition.notify_all()
+
+        try:
+            self.__connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.__connection.close()
+
+    def __receive(self) -> None:
+        """
+        Receive frames until the room disconnects.
+        """
+        try:
+            while True:
+                frame = read_frame(self.__connection)
+                if frame is None:
+                    break
+
+                kind, payload = frame
+                if kind == FRAME_AUDIO:
+                    with self.__condition:
+                        self.__buffer.append(payload)
+                        self.__next_sequence += 1
+                        self.__condition.notify_all()
+                elif kind == FRAME_TEXT:
+                    self.__room = str(json.loads(payload).get(
+                        "room", self.__room))
+        except (OSError, ValueError) as error:
+            if not self.__is_closed:
+                print(f"Session {self.__session_id} failed:", error)
+
+        with self.__condition:
+            self.__is_closed = True
+            self.__condition.notify_all()
+
+    def frames(self) -> Iterator[bytes]:
+        """
+        Iterate over the audio chunks received from the room, starting with
+        the next chunk received. A listener that falls behind by more than
+        the buffer size skips to the oldest chunk still buffered.
+
+        Yields:
+        bytes: Chunks of 16 bit mono frames.
+
+        Raises:
+        SessionClosedError: Once the room disconnected.
+        """
+        with self.__condition:
+            position = self.__next_sequence
+
+        while True:
+            with self.__condition:
+                while not self.__is_closed and \
+                        position >= self.__next_sequence:
+                    self.__condition.wait()
+
+                if self.__is_closed:
+                    raise SessionClosedError(
+                        f"Session {self.__session_id} is closed")
+
+                oldest_sequence = self.__next_sequence - len(self.__buffer)
+                position = max(position, oldest_sequence)
+                data = self.__buffer[position - oldest_sequence]
+
+            position += 1
+            yield data
+
+    def __send(self, kind: bytes, payload: bytes) -> None:
+        """
+        Send a frame to the room.
+
+        Raises:
+        SessionClosedError: If the room disconnected.
+        """
+        if self.__is_closed:
+            raise SessionClosedError(f"Session {self.__session_id} is closed")
+
+        try:
+            with self.__send_lock:
+                write_frame(self.__connection, kind, payload)
+        except OSError as error:
+            raise SessionClosedError(
+                f"Session {self.__session_id} is closed") from error
+
+    def send_text(self, text: str, is_user: bool = False) -> None:
+        """
+        Send a message to display to the room.
+
+        Parameters:
+        text (str): The message.
+        is_user (bool): Whether the message is what the Resident said.
+        """
+        self.__send(FRAME_TEXT, json.dumps(
+            {"text": text, "is_user": is_user}).encode("utf-8"))
+
+    def send_audio(self, pcm: bytes) -> None:
+        """
+        Send audio to play after the audio already sent, without waiting
+        for it to play.
+
+        Parameters:
+        pcm (bytes): 16 bit mono frames at the session's sample rate.
+        """
+        self.__send(FRAME_AUDIO, pcm)
+
+        duration = len(pcm) / 2 / self.__sample_rate
+        with self.__condition:
+            self.__playback_end_time = max(
+                self.__playback_end_time, time.monotonic()) + duration
+
+    def wait_for_playback(self,
+                          stop_event: Optional[threading.Event] = None
+                          ) -> None:
+        """
+        Wait until the room finished playing the audio sent to it, so the
+        Resident is not listened to while Care-Bot speaks.
+
+        Parameters:
+        stop_event (threading.Event, optional): Tells the room to stop
+                                                playing when set.
+        """
+        while not self.__is_closed:
+            if stop_event is not None and stop_event.is_set():
+                self.__send(FRAME_STOP, b"")
+                with self.__condition:
+                    self.__playback_end_time = 0.0
+                return
+
+            remaining = self.__playback_end_time - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, PLAYBACK_CHECK_SECONDS))
+
+    def play(self, pcm: bytes,
+             stop_event: Optional[threading.Event] = None) -> None:
+        """
+        Send audio to the room and wait until it has played.
+
+        Parameters:
+        pcm (bytes): 16 bit mono frames at the session's sample rate.
+        stop_event (threading.Event, optional): Stops the playback when set.
+        """
+        if stop_event is not None and stop_event.is_set():
+            return
+
+        self.send_audio(pcm)
+        self.wait_for_playback(stop_event)
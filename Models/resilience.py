@@ -0,0 +1,298 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, \
+    FIRST_COMPLETED
+from typing import Any, Callable, Deque, List, Optional
+
+# States of the circuit breaker
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Consecutive failed calls that open the circuit, and seconds before a
+# trial call is let through an open circuit
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT_SECONDS = 30.0
+
+# Percentile of the recent latencies after which a call is hedged, and the
+# number of latencies needed before the percentile is trusted
+DEFAULT_HEDGE_PERCENTILE = 95.0
+MIN_LATENCY_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class CallFailedError(Exception):
+    """
+    Raised when a call could not return a result within its deadline.
+    """
+
+
+class DeadlineExceededError(CallFailedError):
+    """
+    Raised when no attempt of a call finished before its deadline.
+    """
+
+
+class CircuitOpenError(CallFailedError):
+    """
+    Raised when a call is not attempted because the circuit is open.
+    """
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the most recent successful calls.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW,
+                 min_samples: int = MIN_LATENCY_SAMPLES):
+        self.__latencies: Deque[float] = deque(maxlen=window)
+        self.__min_samples = min_samples
+        self.__lock = threading.Lock()
+
+    def add(self, latency: float) -> None:
+        """
+        Record the latency of a call.
+
+        Parameters:
+        latency (float): The latency in seconds.
+        """
+        with self.__lock:
+            self.__latencies.append(latency)
+
+    def get_percentile(self, percentile: float) -> Optional[float]:
+        """
+        Returns a percentile of the recent latencies.
+
+        Parameters:
+        percentile (float): The percentile, between 0 and 100.
+
+        Returns:
+        Optional[float]: The latency in seconds, or None if too few calls
+                         were recorded.
+        """
+        with self.__lock:
+            latencies = sorted(self.__latencies)
+
+        if len(latencies) < max(self.__min_samples, 1):
+            return None
+        index = min(int(len(latencies) * percentile / 100),
+                    len(latencies) - 1)
+        return latencies[index]
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a service that is consistently failing.
+
+    The circuit opens after a number of consecutive failed calls. While it
+    is open, calls are refused right away. Once the reset timeout has
+    passed, a single trial call is let through: the circuit closes if it
+    succeeds and opens again if it fails.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT_SECONDS):
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__lock = threading.Lock()
+        self.__state = STATE_CLOSED
+        self.__failure_count = 0
+        self.__opened_at = 0.0
+        self.__is_trial_running = False
+
+    def get_state(self) -> str:
+        """
+        Returns the state of the circuit.
+
+        Returns:
+            str: STATE_CLOSED, STATE_OPEN or STATE_HALF_OPEN.
+        """
+        with self.__lock:
+            return self.__state
+
+    def allow_request(self) -> bool:
+        """
+        Check if a call may be attempted. Once the reset timeout of an open
+        circuit has passed, the first caller is let through as the trial.
+
+        Returns:
+        bool: True if the call may be attempted.
+        """
+        with self.__lock:
+            if self.__state == STATE_CLOSED:
+                return True
+
+            if self.__state == STATE_OPEN and \
+                    time.monotonic() - self.__opened_at >= \
+                    self.__reset_timeout:
+                self.__state = STATE_HALF_OPEN
+                self.__is_trial_running = False
+
+            if self.__state == STATE_HALF_OPEN and \
+                    not self.__is_trial_running:
+                self.__is_trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """
+        Record a successful call, closing the circuit.
+        """
+        with self.__lock:
+            self.__state = STATE_CLOSED
+            self.__failure_count = 0
+            self.__is_trial_running = False
+
+    def record_failure(self) -> None:
+        """
+        Record a failed call, opening the circuit if the trial call failed
+        or too many calls failed in a row.
+        """
+        with self.__lock:
+            self.__failure_count += 1
+            self.__is_trial_running = False
+            if self.__state == STATE_HALF_OPEN or \
+                    self.__failure_count >= self.__failure_threshold:
+                if self.__state != STATE_OPEN:
+                    print("Circuit opened after "
+                          f"{self.__failure_count} failed calls")
+                self.__state = STATE_OPEN
+                self.__opened_at = time.monotonic()
+
+
+class ResilientCaller:
+    """
+    Calls a function with a deadline, hedging slow attempts.
+
+    The call is attempted on a thread pool. If it has not returned once the
+    hedge percentile of the recent latencies has passed, or if it failed,
+    another attempt is started and the first result is used. If no attempt
+    succeeds before the deadline, CallFailedError is raised while the
+    attempts still running are abandoned. Every call is recorded by the
+    circuit breaker, which may refuse calls altogether.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, breaker: CircuitBreaker,
+                 deadline_seconds: float,
+                 hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+                 max_attempts: int = 2,
+                 initial_hedge_delay: Optional[float] = None):
+        """
+        Parameters:
+        executor (ThreadPoolExecutor): The pool the attempts run on.
+        breaker (CircuitBreaker): The circuit breaker of the service.
+        deadline_seconds (float): The latency budget of a call.
+        hedge_percentile (float): The percentile of the recent latencies
+                                  after which another attempt is started.
+        max_attempts (int): The maximum number of attempts of a call, 1 to
+                            never hedge or retry.
+        initial_hedge_delay (float, optional): The hedge delay until enough
+            latencies were recorded. Defaults to half the deadline.
+        """
+        self.__executor = executor
+        self.__breaker = breaker
+        self.__deadline_seconds = deadline_seconds
+        self.__hedge_percentile = hedge_percentile
+        self.__max_attempts = max_attempts
+        self.__initial_hedge_delay = deadline_seconds / 2 \
+            if initial_hedge_delay is None else initial_hedge_delay
+        self.__latency_tracker = LatencyTracker()
+
+    def get_deadline_seconds(self) -> float:
+        """
+        Returns the latency budget of a call.
+
+        Returns:
+            float: The deadline in seconds.
+        """
+        return self.__deadline_seconds
+
+    def get_hedge_delay(self) -> float:
+        """
+        Returns the time after which a call still running is hedged.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        hedge_delay = self.__latency_tracker.get_percentile(
+            self.__hedge_percentile)
+        if hedge_delay is None:
+            return self.__initial_hedge_delay
+        return hedge_delay
+
+    def __attempt(self, function: Callable[..., Any],
+                  *args: Any) -> Future:
+        start_time = time.monotonic()
+        future = self.__executor.submit(function, *args)
+
+        def record_latency(done_future: Future) -> None:
+            if not done_future.cancelled() and \
+                    done_future.exception() is None:
+                self.__latency_tracker.add(time.monotonic() - start_time)
+
+        future.add_done_callback(record_latency)
+        return future
+
+    def call(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Call a function within the deadline.
+
+        Parameters:
+        function (Callable): The function to call.
+        *args: The arguments of the function.
+
+        Returns:
+        Any: The return value of the first successful attempt.
+
+        Raises:
+        CircuitOpenError: If the circuit breaker refused the call.
+        DeadlineExceededError: If no attempt finished before the deadline.
+        CallFailedError: If every attempt failed.
+        """
+        if not self.__breaker.allow_request():
+            raise CircuitOpenError("Circuit is open")
+
+        start_time = time.monotonic()
+        deadline = start_time + self.__deadline_seconds
+        hedge_time = start_time + self.get_hedge_delay()
+        pending: List[Future] = [self.__attempt(function, *args)]
+        attempt_count = 1
+        last_error: Optional[BaseException] = None
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            can_hedge = attempt_count < self.__max_attempts
+            if can_hedge and (now >= hedge_time or not pending):
+                pending.append(self.__attempt(function, *args))
+                attempt_count += 1
+                continue
+
+            if not pending:
+                break
+
+            timeout = deadline - now
+            if can_hedge:
+                timeout = min(timeout, hedge_time - now)
+            done, _ = wait(pending, timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                pending.remove(future)
+                error = future.exception()
+                if error is None:
+                    self.__breaker.record_success()
+                    return future.result()
+                last_error = error
+
+        for future in pending:
+            future.cancel()
+        self.__breaker.record_failure()
+
+        if pending or last_error is None:
+            raise DeadlineExceededError(
+                f"No result within {self.__deadline_seconds:.1f} seconds")
+        raise CallFailedError(f"Call failed: {last_error}") from last_error
@@ -0,0 +1,261 @@
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Generator, Iterable, List, Optional
+
+from vosk import KaldiRecognizer
+
+from Models.audio_capture import RATE
+from Models.chatgpt_prompts import update_caregiver_summary, \
+    create_history_compactor, generate_response, generate_response_stream, \
+    generate_turn, summarize_conversation_history, TurnResult
+from Models.checkpoint import ConversationCheckpoint
+from Models.fair_scheduler import FairScheduler
+from Models.incremental_summary import IncrementalSummary
+from Models.model import CareBotModel
+from Models.resident_session import ResidentSession
+from Models.telemetry import telemetry
+from Models.sms_twilio import enqueue_mms, send_mms
+from Models.utilities import CUES, MAX_SAMPLE_VALUE, SAMPLE_RATE, \
+    render_tone
+from Models.voice_recognition import process_audio_stream, \
+    listen_for_keywords_callback, is_partial_wake_trigger, \
+    PartialKeywordTrigger, UtteranceContinuation, transcribe_continued, \
+    vosk_model
+from Models.voice_synthesis import synthesis_cache, tts_model_name, \
+    synthesize_waveform, get_output_sample_rate, waveform_to_pcm, \
+    waveform_to_wav_bytes, wav_bytes_to_waveform
+
+
+class ScheduledRecognizer:
+    """
+    The recognizer of a session, decoding its audio on the shared
+    recognition workers.
+
+    Only decoding audio runs on the workers. Reading the results is cheap
+    and is done by the session's own thread, once the decoding returned.
+    """
+
+    def __init__(self, session_id: str, scheduler: FairScheduler):
+        self.__session_id = session_id
+        self.__scheduler = scheduler
+        # Every session has its own recognizer on the shared Vosk model
+        self.__recognizer = KaldiRecognizer(vosk_model.get(), RATE)
+
+    def AcceptWaveform(self, data: bytes) -> bool:
+        return self.__scheduler.submit(
+            self.__session_id, self.__recognizer.AcceptWaveform,
+            data).result()
+
+    def Result(self) -> str:
+        return self.__recognizer.Result()
+
+    def PartialResult(self) -> str:
+        return self.__recognizer.PartialResult()
+
+    def FinalResult(self) -> str:
+        return self.__recognizer.FinalResult()
+
+    def Reset(self) -> None:
+        self.__recognizer.Reset()
+
+
+@telemetry.trace_methods("model")
+class SessionModel(CareBotModel):
+    """
+    The model of one room of the Care-Bot server.
+
+    The Vosk model, the TTS model, ChatGPT and the caregiver messages are
+    shared by every room. Each room has its own recognizer, history
+    compactor, caregiver summary and conversation checkpoint, and its audio
+    comes from and goes to its session instead of the microphone and the
+    speakers. Recognition and synthesis run on the shared workers, taking
+    turns between rooms.
+    """
+
+    def __init__(self, session: ResidentSession,
+                 recognition_scheduler: FairScheduler,
+                 synthesis_scheduler: FairScheduler,
+                 checkpoint_directory: str):
+        """
+        Parameters:
+        session (ResidentSession): The audio connection of the room.
+        recognition_scheduler (FairScheduler): Decodes the audio of every
+                                               room.
+        synthesis_scheduler (FairScheduler): Synthesizes the speech of every
+                                             room.
+        checkpoint_directory (str): The directory of the conversation
+                                    checkpoint of every room.
+        """
+        self.__session = session
+        self.__synthesis_scheduler = synthesis_scheduler
+        self.__checkpoint_directory = checkpoint_directory
+        self.__recognizer = ScheduledRecognizer(session.get_session_id(),
+                                                recognition_scheduler)
+        self.__partial_keyword_trigger = PartialKeywordTrigger()
+        self.__utterance_continuation = UtteranceContinuation()
+        self.__history_compactor = create_history_compactor()
+        self.__caregiver_summary = IncrementalSummary(
+            update_caregiver_summary)
+
+    def get_session(self) -> ResidentSession:
+        """
+        Returns the audio connection of the room.
+
+        Returns:
+            ResidentSession: The session.
+        """
+        return self.__session
+
+    def get_checkpoint(self) -> ConversationCheckpoint:
+        """
+        Returns the conversation checkpoint of the room, so a room that
+        reconnects resumes its conversation.
+
+        Returns:
+            ConversationCheckpoint: The checkpoint.
+        """
+        file_name = re.sub(r"[^A-Za-z0-9_-]", "_", self.__session.get_room())
+        return ConversationCheckpoint(
+            os.path.join(self.__checkpoint_directory, f"{file_name}.json"))
+
+    def save_conversation_checkpoint(
+            self, conversation_history: List[Dict[str, str]]):
+        self.get_checkpoint().save(conversation_history)
+
+    def load_conversation_checkpoint(self) -> List[Dict[str, str]]:
+        return self.get_checkpoint().load()
+
+    def clear_conversation_checkpoint(self):
+        self.get_checkpoint().clear()
+
+    def generate_response(
+            self, input_text: str,
+            conversation_history: List[Dict[str, str]],
+            is_save_conversation_history: bool = True):
+        return generate_response(input_text, conversation_history,
+                                 is_save_conversation_history,
+                                 self.__history_compactor)
+
+    def generate_response_stream(
+            self, input_text: str,
+            conversation_history: List[Dict[str, str]],
+            is_save_conversation_history: bool = True
+    ) -> Generator[str, None, None]:
+        return generate_response_stream(input_text, conversation_history,
+                                        is_save_conversation_history,
+                                        self.__history_compactor)
+
+    def generate_turn(
+            self, input_text: str,
+            conversation_history: List[Dict[str, str]]) -> TurnResult:
+        return generate_turn(input_text, conversation_history,
+                             compactor=self.__history_compactor)
+
+    def summarize_conversation_history(
+            self, conversation_history: List[Dict[str, str]]):
+        return summarize_conversation_history(conversation_history,
+                                              self.__history_compactor)
+
+    def update_caregiver_summary(
+            self, conversation_history: List[Dict[str, str]]):
+        self.__caregiver_summary.update(conversation_history)
+
+    def get_caregiver_summary(
+            self, conversation_history: List[Dict[str, str]]) -> str:
+        return self.__caregiver_summary.get(conversation_history)
+
+    def reset_caregiver_summary(self):
+        self.__caregiver_summary.reset()
+
+    def send_mms(self, message: str):
+        send_mms(f"Room {self.__session.get_room()}: {message}")
+
+    def enqueue_mms(self, message: str,
+                    on_sent: Optional[Callable[[], None]] = None) -> int:
+        return enqueue_mms(f"Room {self.__session.get_room()}: {message}",
+                           on_sent)
+
+    def transcribe_audio(self):
+        return transcribe_continued(
+            self.__utterance_continuation, frames=self.__session.frames(),
+            stream_recognizer=self.__recognizer)
+
+    def listen_for_keywords(self):
+        self.__utterance_continuation.discard()
+        return process_audio_stream(
+            listen_for_keywords_callback,
+            self.__partial_keyword_trigger if is_partial_wake_trigger
+            else None,
+            frames=self.__session.frames(),
+            stream_recognizer=self.__recognizer,
+            continuation=self.__utterance_continuation)
+
+    def beep(self, frequency: int, duration: int):
+        waveform = render_tone(frequency, duration)[:, 0] / MAX_SAMPLE_VALUE
+        self.__session.play(waveform_to_pcm(
+            waveform, SAMPLE_RATE, self.__session.get_sample_rate()))
+
+    def play_cue(self, name: str):
+        self.beep(*CUES[name])
+
+    def synthesize_pcm(self, text: str, is_cache: bool = False) -> bytes:
+        """
+        Synthesize speech for the room, on the shared synthesis workers
+        unless the speech is cached.
+
+        Parameters:
+        text (str): The text to synthesize.
+        is_cache (bool, optional): Store the synthesized audio in the
+                                   cache. Defaults to False.
+
+        Returns:
+        bytes: 16 bit mono frames at the sample rate of the session.
+        """
+        audio = synthesis_cache.get(str(tts_model_name), text)
+        if audio is not None:
+            waveform, sample_rate = wav_bytes_to_waveform(audio)
+        else:
+            waveform = self.__synthesis_scheduler.submit(
+                self.__session.get_session_id(), synthesize_waveform, text,
+                False).result()
+            sample_rate = get_output_sample_rate()
+            if is_cache:
+                synthesis_cache.put(
+                    str(tts_model_name), text,
+                    waveform_to_wav_bytes(waveform, sample_rate))
+
+        return waveform_to_pcm(waveform, sample_rate,
+                               self.__session.get_sample_rate())
+
+    def process_and_play_response(
+            self, message: str, is_cache: bool = False,
+            stop_event: Optional[threading.Event] = None):
+        self.__session.play(self.synthesize_pcm(message, is_cache),
+                            stop_event)
+
+    def process_and_play_stream(
+            self, sentences: Iterable[str],
+            start_time: Optional[float] = None,
+            stop_event: Optional[threading.Event] = None
+    ) -> Optional[float]:
+        # The room buffers the audio, so each sentence is sent as soon as it
+        # is synthesized and plays while the next one is synthesized
+        if start_time is None:
+            start_time = time.perf_counter()
+
+        first_audio_time: Optional[float] = None
+        for sentence in sentences:
+            if stop_event is not None and stop_event.is_set():
+                break
+
+            self.__session.send_audio(self.synthesize_pcm(sentence))
+            if first_audio_time is None:
+                first_audio_time = time.perf_counter()
+
+        self.__session.wait_for_playback(stop_event)
+
+        if first_audio_time is None:
+            return None
+        return first_audio_time - start_time
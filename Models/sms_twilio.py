@@ -1,16 +1,31 @@
 import os
+from typing import Callable, Optional
 
 from twilio.rest import Client
 
+from Models.lazy_resource import LazyResource
+from Models.outbox import MessageOutbox, TwilioMessagesClient, \
+    TWILIO_API_BASE_URL
+
 # Find your Account SID and Auth Token at twilio.com/console
 # and set the environment variables. See http://twil.io/secure
 account_sid = os.getenv('ACCOUNT_SID')
 auth_token = os.getenv('AUTH_TOKEN')
-client = Client(account_sid, auth_token)
+client: LazyResource[Client] = LazyResource(
+    "twilio_client", lambda: Client(account_sid, auth_token))
 
 twilio_phone_number = os.getenv('TWILIO_PHONE_NUMBER')
 caregiver_phone_number = os.getenv('CAREGIVER_PHONE_NUMBER')
 
+# Durable outbox of caregiver messages, sent in the background. The base URL
+# can point to a local stand-in of the Twilio API for testing.
+outbox = MessageOutbox(
+    os.getenv('OUTBOX_DATABASE_PATH', 'outbox.sqlite3'),
+    TwilioMessagesClient(
+        str(account_sid), str(auth_token),
+        os.getenv('TWILIO_API_BASE_URL', TWILIO_API_BASE_URL)),
+    str(twilio_phone_number), str(caregiver_phone_number))
+
 
 def send_mms(body: str) -> bool:
     """
@@ -22,12 +37,11 @@ def send_mms(body: str) -> bool:
     Returns:
     bool: True if the message was sent successfully, False otherwise.
     """
-    message = client.messages \
-        .create(
-            body=body,
-            from_=twilio_phone_number,
-            to=caregiver_phone_number
-        )
+    message = client.get().messages.create(
+        body=body,
+        from_=twilio_phone_number,
+        to=caregiver_phone_number
+    )
 
     # The status "queued", "sending", or "sent" can indicate success in
     # Twilio async process
@@ -35,3 +49,29 @@ def send_mms(body: str) -> bool:
         return True
     else:
         return False
+
+
+def enqueue_mms(body: str,
+                on_sent: Optional[Callable[[], None]] = None) -> int:
+    """
+    Store a message for the caregiver in the outbox and return immediately.
+    The message is sent by the outbox worker, which retries until it is
+    delivered, also across restarts.
+
+    Parameters:
+    body (str): The content of the message.
+    on_sent (Callable, optional): Called once the message has been sent.
+
+    Returns:
+    int: The id of the message in the outbox.
+    """
+    outbox.start()
+    return outbox.enqueue(body, on_sent)
+
+
+def start_outbox() -> None:
+    """
+    Start sending the messages of the outbox, including those left pending
+    by a previous run.
+    """
+    outbox.start()
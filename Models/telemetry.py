@@ -0,0 +1,650 @@
+import asyncio
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, ContextManager, Dict, List, Optional, \
+    Sequence, Tuple, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+C = TypeVar("C", bound=type)
+
+# Upper bounds of the buckets of the latency histograms, in seconds
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0)
+# Upper bounds of the buckets of the real-time factor histograms
+REAL_TIME_FACTOR_BUCKETS: Tuple[float, ...] = (
+    0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 4.0)
+
+# Seconds between two writes of the metrics file
+DEFAULT_FILE_INTERVAL_SECONDS = 15.0
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Returned instead of a span while telemetry is disabled
+NULL_SPAN: ContextManager[None] = nullcontext()
+
+
+def format_labels(labels: Labels, extra: str = "") -> str:
+    """
+    Format labels in the Prometheus text format.
+
+    Parameters:
+    labels (Labels): The label names and values.
+    extra (str): A label already formatted, e.g. the bucket of a histogram.
+
+    Returns:
+    str: The labels in braces, or nothing if there are none.
+    """
+    parts = [f'{name}="{escape_label_value(value)}"'
+             for name, value in labels]
+    if extra:
+        parts.append(extra)
+    if not parts:
+        return ""
+    return "{" + ",".join(parts) + "}"
+
+
+def escape_label_value(value: str) -> str:
+    """
+    Escape a label value for the Prometheus text format.
+
+    Parameters:
+    value (str): The value.
+
+    Returns:
+    str: The escaped value.
+    """
+    return value.replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    """
+    Format a sample value for the Prometheus text format.
+
+    Parameters:
+    value (float): The value.
+
+    Returns:
+    str: The value, without a fraction for whole numbers.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    A metric kept in memory, with a value for every combination of labels.
+    """
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.__name = name
+        self.__help_text = help_text
+        self.lock = threading.Lock()
+
+    def get_name(self) -> str:
+        """
+        Returns the name of the metric.
+
+        Returns:
+            str: The name.
+        """
+        return self.__name
+
+    def render(self) -> List[str]:
+        """
+        Returns the lines of the metric in the Prometheus text format.
+
+        Returns:
+            List[str]: The help, the type and the samples.
+        """
+        return [f"# HELP {self.__name} {self.__help_text}",
+                f"# TYPE {self.__name} {self.metric_type}"] + \
+            self.render_samples()
+
+    def render_samples(self) -> List[str]:
+        return []
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, e.g. the number of alerts sent.
+    """
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self.__values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """
+        Add to the counter.
+
+        Parameters:
+        amount (float): The amount to add.
+        **labels: The labels of the value to add to.
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.__values[key] = self.__values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        """
+        Returns the value of the counter.
+
+        Parameters:
+        **labels: The labels of the value.
+
+        Returns:
+        float: The value, 0 if it was never added to.
+        """
+        with self.lock:
+            return self.__values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render_samples(self) -> List[str]:
+        with self.lock:
+            values = sorted(self.__values.items())
+        return [f"{self.get_name()}{format_labels(labels)} "
+                f"{format_value(value)}" for labels, value in values]
+
+
+class Gauge(Metric):
+    """
+    A value that is set, e.g. the time a resource took to load.
+    """
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, help_text: str,
+                 read: Optional[Callable[[], Dict[str, float]]] = None,
+                 label_name: str = ""):
+        """
+        Parameters:
+        name (str): The name of the metric.
+        help_text (str): The description of the metric.
+        read (Callable, optional): Returns the values by label value when
+                                   the metrics are exported, for values
+                                   kept elsewhere, e.g. a cache's stats.
+        label_name (str): The name of the label of the values read.
+        """
+        super().__init__(name, help_text)
+        self.__values: Dict[Labels, float] = {}
+        self.__read = read
+        self.__label_name = label_name
+
+    def set(self, value: float, **labels: str) -> None:
+        """
+        Set the gauge.
+
+        Parameters:
+        value (float): The value.
+        **labels: The labels of the value.
+        """
+        with self.lock:
+            self.__values[tuple(sorted(labels.items()))] = value
+
+    def render_samples(self) -> List[str]:
+        with self.lock:
+            values = dict(self.__values)
+
+        if self.__read is not None:
+            try:
+                for label_value, value in self.__read().items():
+                    values[((self.__label_name, str(label_value)),)] = \
+                        float(value)
+            except Exception as error:
+                print(f"Reading {self.get_name()} failed:", error)
+
+        return [f"{self.get_name()}{format_labels(labels)} "
+                f"{format_value(value)}"
+                for labels, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values, e.g. latencies, in buckets.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, help_text: str,
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.__buckets = tuple(sorted(buckets))
+        # Count of each bucket, the sum and the count, by labels
+        self.__values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Record a value.
+
+        Parameters:
+        value (float): The value, e.g. a latency in seconds.
+        **labels: The labels of the distribution.
+        """
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.__buckets, value)
+        with self.lock:
+            counts, total = self.__values.setdefault(
+                key, ([0] * (len(self.__buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def get_count(self, **labels: str) -> int:
+        """
+        Returns the number of values recorded.
+
+        Parameters:
+        **labels: The labels of the distribution.
+
+        Returns:
+        int: The number of values.
+        """
+        with self.lock:
+            values = self.__values.get(tuple(sorted(labels.items())))
+            return 0 if values is None else sum(values[0])
+
+    def render_samples(self) -> List[str]:
+        with self.lock:
+            values = sorted((labels, list(counts), total[0])
+                            for labels, (counts, total)
+                            in self.__values.items())
+
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.__buckets + (float("inf"),),
+                                    counts):
+                cumulative += count
+                bucket = f'le="{format_value(bound)}"'
+                lines.append(f"{self.get_name()}_bucket"
+                             f"{format_labels(labels, bucket)} {cumulative}")
+            lines.append(f"{self.get_name()}_sum{format_labels(labels)} "
+                         f"{format_value(total)}")
+            lines.append(f"{self.get_name()}_count{format_labels(labels)} "
+                         f"{cumulative}")
+        return lines
+
+
+class NullMetric:
+    """
+    Stands in for every metric while telemetry is disabled, so recording a
+    value costs a single call that does nothing.
+    """
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        pass
+
+    def set(self, value: float, **labels: str) -> None:
+        pass
+
+    def observe(self, value: float, **labels: str) -> None:
+        pass
+
+
+NULL_METRIC = NullMetric()
+
+
+class Span:
+    """
+    Times a block of code and records its duration and errors.
+    """
+
+    __slots__ = ("__name", "__seconds", "__errors", "__start_time")
+
+    def __init__(self, name: str, seconds: Histogram, errors: Counter):
+        self.__name = name
+        self.__seconds = seconds
+        self.__errors = errors
+        self.__start_time = 0.0
+
+    def __enter__(self) -> "Span":
+        self.__start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.__seconds.observe(time.perf_counter() - self.__start_time,
+                               span=self.__name)
+        # Cancelled tasks and closed generators are not errors
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.__errors.inc(span=self.__name)
+
+
+class Telemetry:
+    """
+    Keeps the metrics of Care-Bot in memory and exports them in the
+    Prometheus text format.
+
+    Spans time the calls of the model and the handlers of the controller.
+    While telemetry is disabled, the metrics are NullMetrics, spans are a
+    shared null context manager and methods are not wrapped at all, so
+    instrumented code runs as if it was not.
+    """
+
+    def __init__(self, is_enabled: bool):
+        self.__is_enabled = is_enabled
+        self.__lock = threading.Lock()
+        self.__metrics: Dict[str, Metric] = {}
+        self.__span_seconds = Histogram(
+            "carebot_span_seconds",
+            "Duration of the model calls and controller handlers.")
+        self.__span_errors = Counter(
+            "carebot_span_errors_total",
+            "Model calls and controller handlers that raised an error.")
+        if is_enabled:
+            self.__register(self.__span_seconds)
+            self.__register(self.__span_errors)
+
+    def is_enabled(self) -> bool:
+        """
+        Returns whether metrics are recorded.
+
+        Returns:
+            bool: True if telemetry is enabled.
+        """
+        return self.__is_enabled
+
+    def __register(self, metric: Metric) -> Any:
+        with self.__lock:
+            return self.__metrics.setdefault(metric.get_name(), metric)
+
+    def counter(self, name: str, help_text: str) -> Any:
+        """
+        Returns a counter, created on first use.
+
+        Parameters:
+        name (str): The name of the metric, ending with _total.
+        help_text (str): The description of the metric.
+
+        Returns:
+        Counter: The counter, or a NullMetric if telemetry is disabled.
+        """
+        if not self.__is_enabled:
+            return NULL_METRIC
+        return self.__register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str,
+              read: Optional[Callable[[], Dict[str, float]]] = None,
+              label_name: str = "") -> Any:
+        """
+        Returns a gauge, created on first use.
+
+        Parameters:
+        name (str): The name of the metric.
+        help_text (str): The description of the metric.
+        read (Callable, optional): Returns values kept elsewhere by label
+                                   value, read when the metrics are
+                                   exported.
+        label_name (str): The name of the label of the values read.
+
+        Returns:
+        Gauge: The gauge, or a NullMetric if telemetry is disabled.
+        """
+        if not self.__is_enabled:
+            return NULL_METRIC
+        return self.__register(Gauge(name, help_text, read, label_name))
+
+    def histogram(self, name: str, help_text: str,
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Any:
+        """
+        Returns a histogram, created on first use.
+
+        Parameters:
+        name (str): The name of the metric.
+        help_text (str): The description of the metric.
+        buckets (Sequence[float]): The upper bounds of the buckets.
+
+        Returns:
+        Histogram: The histogram, or a NullMetric if telemetry is disabled.
+        """
+        if not self.__is_enabled:
+            return NULL_METRIC
+        return self.__register(Histogram(name, help_text, buckets))
+
+    def span(self, name: str) -> ContextManager[Any]:
+        """
+        Returns a context manager timing a block of code.
+
+        Parameters:
+        name (str): The name of the span, e.g. 'model.transcribe_audio'.
+
+        Returns:
+        ContextManager: The span.
+        """
+        if not self.__is_enabled:
+            return NULL_SPAN
+        return Span(name, self.__span_seconds, self.__span_errors)
+
+    def traced(self, name: str) -> Callable[[F], F]:
+        """
+        Returns a decorator running every call of a function or coroutine
+        function in a span. The function is returned unchanged if telemetry
+        is disabled.
+
+        Parameters:
+        name (str): The name of the span.
+
+        Returns:
+        Callable: The decorator.
+        """
+        def decorate(function: F) -> F:
+            if not self.__is_enabled:
+                return function
+
+            if asyncio.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def traced_coroutine(*args: Any, **kwargs: Any) -> Any:
+                    with self.span(name):
+                        return await function(*args, **kwargs)
+                return traced_coroutine  # type: ignore[return-value]
+
+            @functools.wraps(function)
+            def traced_function(*args: Any, **kwargs: Any) -> Any:
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return traced_function  # type: ignore[return-value]
+
+        return decorate
+
+    def trace_methods(self, prefix: str) -> Callable[[C], C]:
+        """
+        Returns a class decorator running every public method defined by
+        the class in a span named after the prefix and the method.
+
+        Parameters:
+        prefix (str): The prefix of the span names, e.g. 'model'.
+
+        Returns:
+        Callable: The class decorator.
+        """
+        def decorate(cls: C) -> C:
+            if not self.__is_enabled:
+                return cls
+
+            for attribute_name, attribute in list(vars(cls).items()):
+                if attribute_name.startswith("_"):
+                    continue
+                span_name = f"{prefix}.{attribute_name}"
+                if isinstance(attribute, staticmethod):
+                    setattr(cls, attribute_name, staticmethod(
+                        self.traced(span_name)(attribute.__func__)))
+                elif inspect.isfunction(attribute):
+                    setattr(cls, attribute_name,
+                            self.traced(span_name)(attribute))
+            return cls
+
+        return decorate
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+        with self.__lock:
+            metrics = sorted(self.__metrics.values(),
+                             key=lambda metric: metric.get_name())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class TelemetryServer(ThreadingHTTPServer):
+    """
+    A local HTTP endpoint serving the metrics in the Prometheus text format,
+    for Prometheus to scrape.
+    """
+
+    def __init__(self, metrics: Telemetry,
+                 address: Tuple[str, int] = ("127.0.0.1", 0)):
+        self.__thread: Optional[threading.Thread] = None
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler) -> None:
+                data = metrics.render().encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type",
+                                    "text/plain; version=0.0.4")
+                handler.send_header("Content-Length", str(len(data)))
+                handler.end_headers()
+                handler.wfile.write(data)
+
+            def log_message(handler, *args) -> None:
+                pass
+
+        super().__init__(address, Handler)
+
+    def get_url(self) -> str:
+        """
+        Returns the URL of the metrics.
+
+        Returns:
+            str: The URL.
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self) -> None:
+        """
+        Serve the metrics on a background thread.
+        """
+        self.__thread = threading.Thread(
+            target=self.serve_forever, args=(0.5,), name="telemetry_server",
+            daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop serving the metrics and close the server.
+        """
+        self.shutdown()
+        self.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+
+class TelemetryFileWriter:
+    """
+    Writes the metrics in the Prometheus text format to a file at a regular
+    interval, e.g. for the textfile collector of the Prometheus node
+    exporter. The file is replaced atomically, so it is never read half
+    written.
+    """
+
+    def __init__(self, metrics: Telemetry, path: str,
+                 interval_seconds: float = DEFAULT_FILE_INTERVAL_SECONDS):
+        self.__metrics = metrics
+        self.__path = path
+        self.__interval_seconds = interval_seconds
+        self.__stop_event = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def write(self) -> None:
+        """
+        Write the metrics now. Errors are reported and otherwise ignored.
+        """
+        temporary_path = self.__path + ".tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                file.write(self.__metrics.render())
+            os.replace(temporary_path, self.__path)
+        except OSError as error:
+            print("Writing the metrics failed:", error)
+
+    def start(self) -> None:
+        """
+        Write the metrics on a background thread until stopped.
+        """
+        self.__thread = threading.Thread(
+            target=self.__work, name="telemetry_file", daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop writing, after writing the metrics a last time.
+        """
+        self.__stop_event.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __work(self) -> None:
+        while not self.__stop_event.wait(self.__interval_seconds):
+            self.write()
+        self.write()
+
+
+# Set TELEMETRY to 'true' to record the metrics
+telemetry = Telemetry(os.getenv('TELEMETRY', 'false').lower() == 'true')
+
+export_lock = threading.Lock()
+is_export_started = False
+
+
+def start_telemetry_export() -> None:
+    """
+    Start exporting the metrics to the local port set by TELEMETRY_PORT
+    and to the file set by TELEMETRY_FILE, if telemetry is enabled. Only
+    the first call starts the export, since Streamlit runs the script again
+    on every restart.
+    """
+    global is_export_started
+
+    if not telemetry.is_enabled():
+        return
+
+    with export_lock:
+        if is_export_started:
+            return
+        is_export_started = True
+
+    port = os.getenv('TELEMETRY_PORT', '')
+    if port:
+        try:
+            server = TelemetryServer(telemetry, ("127.0.0.1", int(port)))
+        except OSError as error:
+            print("Serving the metrics failed:", error)
+        else:
+            server.start()
+            print(f"Serving the metrics at {server.get_url()}")
+
+    file_path = os.getenv('TELEMETRY_FILE', '')
+    if file_path:
+        TelemetryFileWriter(telemetry, file_path, float(os.getenv(
+            'TELEMETRY_FILE_INTERVAL_SECONDS',
+            str(DEFAULT_FILE_INTERVAL_SECONDS)))).start()
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Default limits of the synthesized audio cache
+DEFAULT_MAX_MEMORY_ENTRIES = 32
+DEFAULT_MAX_DISK_BYTES = 100 * 1024 * 1024
+
+CACHE_FILE_EXTENSION = ".wav"
+
+
+class SynthesisCache:
+    """
+    A cache of synthesized audio keyed by (TTS model name, text).
+
+    Recently used audio is kept in memory and every entry is also stored on
+    disk, so it survives restarts. Both tiers evict the least recently used
+    entries: the memory tier once it holds more than max_memory_entries and
+    the disk tier once its files exceed max_disk_bytes.
+
+    The cache directory is created when the first entry is stored, so
+    creating a cache leaves nothing on disk.
+    """
+
+    def __init__(self, cache_directory: str,
+                 max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES,
+                 max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self.__cache_directory = cache_directory
+        self.__max_memory_entries = max_memory_entries
+        self.__max_disk_bytes = max_disk_bytes
+        self.__memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """
+        Returns the cache key of a text synthesized with a TTS model.
+
+        Parameters:
+        model_name (str): The name of the TTS model.
+        text (str): The synthesized text.
+
+        Returns:
+        str: A hexadecimal digest identifying the (model name, text) pair.
+        """
+        return hashlib.sha256(
+            f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def __get_file_path(self, key: str) -> str:
+        return os.path.join(self.__cache_directory,
+                            key + CACHE_FILE_EXTENSION)
+
+    def __remember(self, key: str, audio: bytes) -> None:
+        """
+        Store audio in the memory tier, evicting the least recently used
+        entries. Must be called with the lock held.
+        """
+        self.__memory[key] = audio
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.__max_memory_entries:
+            self.__memory.popitem(last=False)
+
+    def __evict_disk(self) -> None:
+        """
+        Delete the least recently used files until the disk tier fits its
+        size limit. Must be called with the lock held.
+        """
+        entries = []
+        for file_name in os.listdir(self.__cache_directory):
+            if not file_name.endswith(CACHE_FILE_EXTENSION):
+                continue
+            file_path = os.path.join(self.__cache_directory, file_name)
+            try:
+                status = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            entries.append((status.st_mtime, status.st_size, file_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, file_path in sorted(entries):
+            if total_size <= self.__max_disk_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def get(self, model_name: str, text: str) -> Optional[bytes]:
+        """
+        Returns the cached audio of a text, from memory or from disk.
+
+        Parameters:
+        model_name (str): The name of the TTS model.
+        text (str): The synthesized text.
+
+        Returns:
+        Optional[bytes]: The audio file contents, or None if it is not
+                         cached.
+        """
+        key = self.make_key(model_name, text)
+
+        with self.__lock:
+            audio = self.__memory.get(key)
+            if audio is not None:
+                self.__memory.move_to_end(key)
+                return audio
+
+            file_path = self.__get_file_path(key)
+            try:
+                with open(file_path, "rb") as audio_file:
+                    audio = audio_file.read()
+                # Mark the file as recently used for the disk eviction
+                os.utime(file_path)
+            except FileNotFoundError:
+                return None
+
+            self.__remember(key, audio)
+            return audio
+
+    def put(self, model_name: str, text: str, audio: bytes) -> None:
+        """
+        Store the audio of a text in memory and on disk.
+
+        Parameters:
+        model_name (str): The name of the TTS model.
+        text (str): The synthesized text.
+        audio (bytes): The audio file contents.
+        """
+        key = self.make_key(model_name, text)
+
+        with self.__lock:
+            self.__remember(key, audio)
+
+            os.makedirs(self.__cache_directory, exist_ok=True)
+
+            # Write to a temporary file first so a partially written file is
+            # never read back
+            file_path = self.__get_file_path(key)
+            temporary_file_path = f"{file_path}.{threading.get_ident()}.tmp"
+            with open(temporary_file_path, "wb") as audio_file:
+                audio_file.write(audio)
+            os.replace(temporary_file_path, file_path)
+
+            self.__evict_disk()
+
+    def contains(self, model_name: str, text: str) -> bool:
+        """
+        Check if the audio of a text is cached, in memory or on disk.
+
+        Parameters:
+        model_name (str): The name of the TTS model.
+        text (str): The synthesized text.
+
+        Returns:
+        bool: True if the audio is cached.
+        """
+        key = self.make_key(model_name, text)
+        with self.__lock:
+            return key in self.__memory or \
+                os.path.exists(self.__get_file_path(key))
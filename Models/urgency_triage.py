@@ -0,0 +1,269 @@
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+from Models.keyword_recognition import has_keyword
+
+# Verdicts of the local urgency triage
+TRIAGE_URGENT = "urgent"
+TRIAGE_BENIGN = "benign"
+TRIAGE_UNCERTAIN = "uncertain"
+
+# High precision phrases that always indicate an emergency
+EMERGENCY_PATTERNS: List[str] = [
+    # Not idioms like "I fell asleep" or "I fell in love"
+    r"\bi(?:'ve| have| just)? (?:fell|fallen)\b"
+    r"(?! (?:asleep|in love|for (?:it|that)|behind|silent|quiet|short))",
+    r"\bi (?:can't|cannot|can not) (?:breathe?|get up)\b",
+    r"\bchest (?:hurts|pain|is hurting)\b",
+    r"\bheart attack\b",
+    r"\bhaving a stroke\b",
+    r"\bi'm bleeding\b|\bi am bleeding\b",
+    r"\bi'm choking\b|\bi am choking\b",
+    r"\bcan't stop (?:vomiting|bleeding|shaking)\b",
+    r"\bcall (?:an ambulance|911)\b",
+]
+
+# Word stems that may indicate a need for assistance even though they are
+# not wake keywords. Utterances containing any of these stems are never
+# considered benign, and are urgent when the LLM can not be reached.
+CONCERN_STEMS: List[str] = [
+    "ache", "afraid", "alone", "ambulance", "anxi", "bathroom", "blood",
+    "bleed", "breath", "broke", "can't", "cannot", "cant", "chest", "chok",
+    "confus", "dizz", "faint", "fell", "fever", "fuzzy", "headache", "heart",
+    "hospital", "hurt", "injur", "killing", "lonely", "lost", "medic", "numb",
+    "overwhelm", "pain", "pill", "scared", "sick", "slip", "someone",
+    "stomach", "stroke", "threw up", "throw up", "toilet", "unsteady",
+    "vomit", "washroom", "weak",
+]
+
+# Words of greetings and small talk. An utterance is benign only if every
+# one of its words is in this vocabulary, so anything unrecognized, e.g.
+# "I slipped in the shower", is left to the LLM. Words that can turn small
+# talk into a request for help, like "get", "not", "someone" or "call", are
+# left out on purpose. The wake words, e.g. "care bot", are keywords, which
+# are never benign, so they are left out as well.
+BENIGN_VOCABULARY: List[str] = [
+    # Greetings and acknowledgements
+    "hi", "hello", "hey", "good", "morning", "afternoon", "evening", "night",
+    "bye", "goodbye", "thanks", "thank", "yes", "yeah", "sure", "please",
+    "okay", "ok", "alright", "chatgpt",
+    # Function words
+    "i", "i'm", "im", "i'll", "i've", "me", "my", "we", "we'll", "you",
+    "your", "it", "it's", "its", "this", "that", "that's", "the", "a", "an",
+    "some", "to", "for", "of", "in", "on", "at", "with", "and", "or",
+    "about", "up", "away", "am", "is", "are", "be", "been", "was", "will",
+    "would", "might", "do", "doing", "how", "what", "what's", "since",
+    "while", "last", "such", "so", "very", "really", "just", "bit", "little",
+    # Time and weather
+    "right", "soon", "later", "today", "tonight", "time", "day",
+    "weather", "outside", "beautiful", "lovely", "nice", "sunny", "warm",
+    # Feelings and plans
+    "fine", "great", "well", "happy", "tired", "sleepy", "bored", "hungry",
+    "think", "going", "planning", "looking", "forward", "want", "like",
+    "love", "enjoy", "craving", "feel", "feeling", "keep", "mind", "active",
+    # Activities
+    "sleep", "nap", "take", "watch", "watching", "movie", "tv",
+    "television", "show", "listen", "music", "song", "songs", "read",
+    "reading", "book", "books", "newspaper", "puzzle", "puzzles",
+    "crossword", "write", "letter", "spoke", "friend", "friends", "family",
+    "daughter", "son", "grandchildren", "visit", "tidy", "desk",
+    "fold", "laundry", "put", "walk", "garden", "relax", "knit", "knitting",
+    "paint", "game", "games", "cards", "play", "bingo", "joke", "story",
+    "tell", "lunch", "dinner", "breakfast", "snack", "tea", "coffee", "ice",
+    "cream", "cookie", "cake",
+]
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize an utterance for lexicon matching by lower casing it and
+    replacing typographic apostrophes.
+
+    Parameters:
+    text (str): The utterance to normalize.
+
+    Returns:
+    str: The normalized utterance.
+    """
+    return text.lower().replace("’", "'")
+
+
+class UrgencyTriage:
+    """
+    Local triage in front of the LLM urgency classification.
+
+    Clear emergencies are recognized with a high precision lexicon and
+    clearly benign utterances, made only of small talk words and containing
+    neither a wake keyword nor a concern stem, are recognized without a
+    remote call. Everything else is left to the LLM.
+    """
+
+    def __init__(self,
+                 emergency_patterns: Optional[Iterable[str]] = None,
+                 concern_stems: Optional[Iterable[str]] = None,
+                 benign_vocabulary: Optional[Iterable[str]] = None,
+                 is_emergency_enabled: bool = True,
+                 is_benign_enabled: bool = True):
+        if emergency_patterns is None:
+            emergency_patterns = EMERGENCY_PATTERNS
+        if concern_stems is None:
+            concern_stems = CONCERN_STEMS
+        if benign_vocabulary is None:
+            benign_vocabulary = BENIGN_VOCABULARY
+
+        self.__emergency_pattern = re.compile(
+            "|".join(f"(?:{pattern})" for pattern in emergency_patterns))
+        self.__concern_pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(stem) for stem in concern_stems)
+            + r")")
+        self.__benign_vocabulary = frozenset(benign_vocabulary)
+        self.__is_emergency_enabled = is_emergency_enabled
+        self.__is_benign_enabled = is_benign_enabled
+        self.__counters: Dict[str, int] = {
+            TRIAGE_URGENT: 0,
+            TRIAGE_BENIGN: 0,
+            TRIAGE_UNCERTAIN: 0,
+        }
+
+    def is_emergency(self, text: str) -> bool:
+        """
+        Check if the text matches the emergency lexicon.
+
+        Parameters:
+        text (str): The utterance to check.
+
+        Returns:
+        bool: True if the utterance is a clear emergency.
+        """
+        return bool(self.__emergency_pattern.search(normalize_text(text)))
+
+    def has_concern(self, text: str) -> bool:
+        """
+        Check if the text contains a wake keyword or a concern stem.
+
+        Parameters:
+        text (str): The utterance to check.
+
+        Returns:
+        bool: True if the utterance may need assistance.
+        """
+        normalized_text = normalize_text(text)
+        return bool(self.__concern_pattern.search(normalized_text)) or \
+            has_keyword(normalized_text)
+
+    def is_benign(self, text: str) -> bool:
+        """
+        Check if every word of the text is in the benign vocabulary and the
+        text contains neither a wake keyword nor a concern stem.
+
+        Parameters:
+        text (str): The utterance to check.
+
+        Returns:
+        bool: True if the utterance is clearly benign.
+        """
+        words = re.findall(r"[a-z']+", normalize_text(text))
+        return len(words) != 0 and \
+            all(word.strip("'") in self.__benign_vocabulary
+                for word in words) and \
+            not self.has_concern(text)
+
+    def is_urgent_offline(self, text: str) -> bool:
+        """
+        The verdict used when the LLM can not be reached in time. Any
+        emergency, wake keyword or concern stem is urgent, and only small
+        talk recognized by the benign vocabulary is not, so a Resident in
+        danger is not missed. Not counted in the triage counters.
+
+        Parameters:
+        text (str): The utterance to check.
+
+        Returns:
+        bool: True unless the utterance is clearly benign.
+        """
+        return self.is_emergency(text) or self.has_concern(text) or \
+            not self.is_benign(text)
+
+    def triage(self, text: str) -> str:
+        """
+        Triage an utterance and count the verdict.
+
+        Parameters:
+        text (str): The utterance to triage.
+
+        Returns:
+        str: TRIAGE_URGENT if the utterance is a clear emergency,
+             TRIAGE_BENIGN if it is clearly benign and TRIAGE_UNCERTAIN if
+             the LLM has to decide.
+        """
+        if self.__is_emergency_enabled and self.is_emergency(text):
+            verdict = TRIAGE_URGENT
+        elif self.__is_benign_enabled and self.is_benign(text):
+            verdict = TRIAGE_BENIGN
+        else:
+            verdict = TRIAGE_UNCERTAIN
+
+        self.__counters[verdict] += 1
+        return verdict
+
+    def get_counters(self) -> Dict[str, int]:
+        """
+        Returns the number of utterances triaged with each verdict.
+
+        Returns:
+            Dict[str, int]: The count of each verdict.
+        """
+        return dict(self.__counters)
+
+    def get_avoided_llm_calls(self) -> int:
+        """
+        Returns the number of LLM urgency calls avoided by the triage.
+
+        Returns:
+            int: The number of utterances triaged as urgent or benign.
+        """
+        return self.__counters[TRIAGE_URGENT] + self.__counters[TRIAGE_BENIGN]
+
+    def report_recall(self, urgent_phrases: Iterable[str],
+                      non_urgent_phrases: Iterable[str]) -> Dict[str, float]:
+        """
+        Report how the triage performs on labelled phrases without counting
+        them in the triage counters.
+
+        Parameters:
+        urgent_phrases (Iterable[str]): Phrases that need urgent assistance.
+        non_urgent_phrases (Iterable[str]): Phrases that do not.
+
+        Returns:
+        Dict[str, float]: 'recall' is the fraction of urgent phrases that are
+            not dismissed as benign, 'emergency_false_positives' the fraction
+            of non urgent phrases matching the emergency lexicon and
+            'benign_rate' the fraction of non urgent phrases that skip the
+            LLM.
+        """
+        urgent_phrases = list(urgent_phrases)
+        non_urgent_phrases = list(non_urgent_phrases)
+
+        kept_urgent = [phrase for phrase in urgent_phrases
+                       if self.is_emergency(phrase)
+                       or not self.is_benign(phrase)]
+        false_emergencies = [phrase for phrase in non_urgent_phrases
+                             if self.is_emergency(phrase)]
+        benign = [phrase for phrase in non_urgent_phrases
+                  if not self.is_emergency(phrase)
+                  and self.is_benign(phrase)]
+
+        return {
+            "recall": len(kept_urgent) / max(len(urgent_phrases), 1),
+            "emergency_false_positives":
+                len(false_emergencies) / max(len(non_urgent_phrases), 1),
+            "benign_rate": len(benign) / max(len(non_urgent_phrases), 1),
+        }
+
+
+# Set URGENCY_TRIAGE to 'false' to send every utterance to the LLM
+is_urgency_triage_enabled = \
+    os.getenv('URGENCY_TRIAGE', 'true').lower() == 'true'
+urgency_triage = UrgencyTriage(is_emergency_enabled=is_urgency_triage_enabled,
+                               is_benign_enabled=is_urgency_triage_enabled)
@@ -1,47 +1,169 @@
 import os
 import sys
+import threading
+from collections import OrderedDict
 from contextlib import contextmanager
+from typing import Callable, Dict, Optional, TextIO, Tuple
 
 import numpy as np
 import pygame
 
-# Initialize the mixer module for audio playback
-pygame.mixer.init()
+from Models.lazy_resource import LazyResource
 
 
-def beep(frequency: int, duration: int) -> None:
+# Constants
+SAMPLE_RATE = 44100  # Sample rate in Hertz
+CHANNELS = 2  # Number of audio channels
+BITS_PER_SAMPLE = 16  # Number of bits per audio sample
+# Maximum value for a sample
+MAX_SAMPLE_VALUE = 2 ** (BITS_PER_SAMPLE - 1) - 1
+# Conversion factor from milliseconds to seconds
+MILLISECONDS_TO_SECONDS = 1000.0
+
+# Maximum number of pre-rendered sounds kept in the sound bank
+SOUND_BANK_SIZE = 32
+
+# Named audio cues as (frequency in Hertz, duration in milliseconds)
+CUES: Dict[str, Tuple[int, int]] = {
+    "listen": (800, 200),
+    "ready": (660, 150),
+    "alert": (1200, 400),
+    "error": (300, 500),
+}
+
+
+def init_mixer():
     """
-    Play a beep sound at a specified frequency and duration.
+    Initialize the mixer module for audio playback.
+
+    Returns:
+    module: The pygame.mixer module.
+    """
+    pygame.mixer.init()
+    return pygame.mixer
+
+
+# Initialized on first use, or in the background at startup
+mixer: LazyResource = LazyResource(
+    "mixer", init_mixer,
+    check=lambda mixer_module: mixer_module.get_init() is not None)
+
+
+def render_tone(frequency: int, duration: int) -> np.ndarray:
+    """
+    Render a sine tone as a stereo 16 bit sample buffer.
+
+    The samples are computed with a single vectorized NumPy operation.
 
     Parameters:
-    frequency (int): The frequency of the beep in Hertz.
-    duration (int): The duration of the beep in milliseconds.
+    frequency (int): The frequency of the tone in Hertz.
+    duration (int): The duration of the tone in milliseconds.
+
+    Returns:
+    np.ndarray: An array of shape (samples, CHANNELS) of int16 samples.
+    """
+    n_samples = int(round(duration * SAMPLE_RATE / MILLISECONDS_TO_SECONDS))
+    t = np.arange(n_samples) / SAMPLE_RATE  # time of each sample in seconds
+
+    samples = np.round(
+        MAX_SAMPLE_VALUE * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+    # Same sound for the left and right channels
+    return np.repeat(samples[:, np.newaxis], CHANNELS, axis=1)
+
+
+def make_tone_sound(frequency: int, duration: int) -> pygame.mixer.Sound:
+    """
+    Render a tone as a sound the mixer can play.
+
+    Parameters:
+    frequency (int): The frequency of the tone in Hertz.
+    duration (int): The duration of the tone in milliseconds.
+
+    Returns:
+    pygame.mixer.Sound: The sound of the tone.
     """
-    # Constants
-    sample_rate = 44100  # Sample rate in Hertz
+    mixer.get()
+    return pygame.sndarray.make_sound(render_tone(frequency, duration))
 
-    # Conversion factor from milliseconds to seconds
-    milliseconds_to_seconds = 1000.0
 
-    channels = 2  # Number of audio channels
-    bits_per_sample = 16  # Number of bits per audio sample
-    # Maximum value for a sample
-    max_sample_value = 2 ** (bits_per_sample - 1) - 1
+class SoundBank:
+    """
+    A least recently used cache of pre-rendered tones, keyed by
+    (frequency, duration), so repeated cues are played without synthesis.
+    """
 
-    # Generate a sound buffer with the given frequency
-    n_samples = int(round(duration * sample_rate / milliseconds_to_seconds))
-    buf = np.zeros((n_samples, channels), dtype=np.int16)
+    def __init__(self, max_size: int = SOUND_BANK_SIZE,
+                 make_sound: Optional[
+                     Callable[[int, int], pygame.mixer.Sound]] = None):
+        """
+        Parameters:
+        max_size (int): The maximum number of sounds kept.
+        make_sound (Callable, optional): Renders the sound of a tone from
+                                         its frequency and duration.
+                                         Defaults to make_tone_sound.
+        """
+        self.__max_size = max_size
+        self.__make_sound = make_tone_sound if make_sound is None \
+            else make_sound
+        self.__sounds: "OrderedDict[Tuple[int, int], pygame.mixer.Sound]" = \
+            OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get_sound(self, frequency: int, duration: int) -> pygame.mixer.Sound:
+        """
+        Returns the sound of a tone, rendering it if it is not in the bank.
+
+        Parameters:
+        frequency (int): The frequency of the tone in Hertz.
+        duration (int): The duration of the tone in milliseconds.
+
+        Returns:
+        pygame.mixer.Sound: The sound of the tone.
+        """
+        key = (frequency, duration)
+        with self.__lock:
+            sound = self.__sounds.get(key)
+            if sound is not None:
+                self.__sounds.move_to_end(key)
+                return sound
+
+        sound = self.__make_sound(frequency, duration)
+
+        with self.__lock:
+            self.__sounds[key] = sound
+            self.__sounds.move_to_end(key)
+            while len(self.__sounds) > self.__max_size:
+                self.__sounds.popitem(last=False)
+
+        return sound
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__sounds)
+
+
+sound_bank = SoundBank()
+
+
+def prerender_cues() -> None:
+    """
+    Pre-render every registered cue in the sound bank, so playing them at
+    runtime costs no synthesis.
+    """
+    for frequency, duration in CUES.values():
+        sound_bank.get_sound(frequency, duration)
 
-    for s in range(n_samples):
-        t = float(s) / sample_rate  # time in seconds
 
-        # Generate the sound for both left and right channels
-        sample_value = int(
-            round(max_sample_value * np.sin(2 * np.pi * frequency * t)))
-        buf[s][0] = sample_value  # left channel
-        buf[s][1] = sample_value  # right channel
+def beep(frequency: int, duration: int) -> None:
+    """
+    Play a beep sound at a specified frequency and duration.
 
-    sound = pygame.sndarray.make_sound(buf)
+    Parameters:
+    frequency (int): The frequency of the beep in Hertz.
+    duration (int): The duration of the beep in milliseconds.
+    """
+    sound = sound_bank.get_sound(frequency, duration)
 
     # Play the sound
     sound.play(-1)
@@ -49,6 +171,18 @@ def beep(frequency: int, duration: int) -> None:
     sound.stop()
 
 
+def play_cue(name: str) -> None:
+    """
+    Play a registered audio cue.
+
+    Parameters:
+    name (str): The name of the cue, e.g. "listen", "ready", "alert" or
+                "error".
+    """
+    frequency, duration = CUES[name]
+    beep(frequency, duration)
+
+
 def remove_temp_files(file_path: str) -> None:
     """
     Remove temporary files created during the process.
@@ -59,6 +193,13 @@ def remove_temp_files(file_path: str) -> None:
     os.remove(file_path)
 
 
+# Guards the redirection of stdout, which is shared by every thread
+stdout_lock = threading.Lock()
+# Number of blocks suppressing stdout, and what to restore after the last
+stdout_suppressions = 0
+suppressed_stdout: Optional[Tuple[TextIO, TextIO]] = None
+
+
 @contextmanager
 def suppress_stdout():
     """
@@ -74,14 +215,28 @@ def suppress_stdout():
     enclosed code block. After the code block execution, stdout is
     restored to its original state.
 
+    Blocks may overlap on several threads: stdout is redirected by the
+    first one and only restored once the last one ends.
+
     Example:
         with suppress_stdout():
             print("This will not be printed")
     """
-    with open(os.devnull, "w") as devnull:
-        old_stdout = sys.stdout
-        sys.stdout = devnull
-        try:
-            yield
-        finally:
-            sys.stdout = old_stdout
+    global stdout_suppressions, suppressed_stdout
+
+    with stdout_lock:
+        if stdout_suppressions == 0:
+            devnull = open(os.devnull, "w")
+            suppressed_stdout = (sys.stdout, devnull)
+            sys.stdout = devnull
+        stdout_suppressions += 1
+    try:
+        yield
+    finally:
+        with stdout_lock:
+            stdout_suppressions -= 1
+            if stdout_suppressions == 0 and suppressed_stdout is not None:
+                old_stdout, devnull = suppressed_stdout
+                suppressed_stdout = None
+                sys.stdout = old_stdout
+                devnull.close()
@@ -0,0 +1,157 @@
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, List
+
+import numpy as np
+
+from Models.audio_capture import RATE
+
+# Number of samples in each analysis frame, 16 milliseconds at 16 kHz
+ANALYSIS_FRAME_SAMPLES = 256
+
+# A frame is speech when its RMS energy exceeds the noise floor by this
+# ratio and the minimum energy, and its zero crossing rate is below the
+# maximum, which rejects hiss and other broadband noise
+ENERGY_RATIO = 3.0
+MIN_SPEECH_RMS = 200.0
+MAX_SPEECH_ZERO_CROSSING_RATE = 0.35
+# Speed at which the noise floor follows the energy of non-speech chunks
+NOISE_FLOOR_ADAPTATION = 0.05
+INITIAL_NOISE_FLOOR_RMS = 100.0
+
+# Chunks forwarded before speech starts, so the recognizer hears the first
+# syllable, and after speech ends, so it sees the trailing silence it needs
+# to end the utterance
+PRE_ROLL_CHUNKS = 2
+HANGOVER_CHUNKS = 6
+
+
+class VoiceActivityDetector:
+    """
+    A cheap energy and zero crossing rate voice activity detector for 16 bit
+    mono audio chunks, vectorized with NumPy.
+
+    gate() only forwards chunks that contain speech, together with a short
+    pre-roll before and a hangover after the speech, and counts the seconds
+    of audio that were forwarded to the recognizer and skipped.
+    """
+
+    def __init__(self, sample_rate: int = RATE,
+                 pre_roll_chunks: int = PRE_ROLL_CHUNKS,
+                 hangover_chunks: int = HANGOVER_CHUNKS,
+                 energy_ratio: float = ENERGY_RATIO,
+                 min_speech_rms: float = MIN_SPEECH_RMS):
+        self.__sample_rate = sample_rate
+        self.__hangover_chunks = hangover_chunks
+        self.__energy_ratio = energy_ratio
+        self.__min_speech_rms = min_speech_rms
+        self.__noise_floor_rms = INITIAL_NOISE_FLOOR_RMS
+        self.__pre_roll: Deque[bytes] = deque(maxlen=pre_roll_chunks)
+        self.__hangover_remaining = 0
+        self.__decoded_seconds = 0.0
+        self.__skipped_seconds = 0.0
+
+    def is_speech(self, data: bytes) -> bool:
+        """
+        Check if an audio chunk contains speech, and adapt the noise floor to
+        chunks that do not.
+
+        Parameters:
+        data (bytes): A chunk of 16 bit mono samples.
+
+        Returns:
+        bool: True if any analysis frame of the chunk is speech.
+        """
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        n_frames = len(samples) // ANALYSIS_FRAME_SAMPLES
+        if n_frames == 0:
+            return False
+
+        frames = samples[:n_frames * ANALYSIS_FRAME_SAMPLES].reshape(
+            n_frames, ANALYSIS_FRAME_SAMPLES)
+
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        zero_crossing_rate = np.count_nonzero(
+            np.diff(np.signbit(frames), axis=1), axis=1) / \
+            ANALYSIS_FRAME_SAMPLES
+
+        threshold = max(self.__min_speech_rms,
+                        self.__noise_floor_rms * self.__energy_ratio)
+        is_speech = bool(np.any(
+            (rms > threshold)
+            & (zero_crossing_rate < MAX_SPEECH_ZERO_CROSSING_RATE)))
+
+        if not is_speech:
+            self.__noise_floor_rms += NOISE_FLOOR_ADAPTATION * \
+                (float(np.median(rms)) - self.__noise_floor_rms)
+
+        return is_speech
+
+    def process(self, data: bytes) -> List[bytes]:
+        """
+        Process an audio chunk and return the chunks to forward to the
+        recognizer.
+
+        Parameters:
+        data (bytes): A chunk of 16 bit mono samples.
+
+        Returns:
+        List[bytes]: The buffered pre-roll and the chunk if it contains
+                     speech or falls within the hangover, otherwise nothing.
+        """
+        if self.is_speech(data):
+            forwarded = list(self.__pre_roll) + [data]
+            self.__pre_roll.clear()
+            self.__hangover_remaining = self.__hangover_chunks
+        elif self.__hangover_remaining > 0:
+            forwarded = [data]
+            self.__hangover_remaining -= 1
+        else:
+            if len(self.__pre_roll) == self.__pre_roll.maxlen:
+                # The oldest pre-roll chunk will never be forwarded
+                self.__skipped_seconds += self.__seconds(self.__pre_roll[0])
+            self.__pre_roll.append(data)
+            return []
+
+        self.__decoded_seconds += sum(map(self.__seconds, forwarded))
+        return forwarded
+
+    def __seconds(self, data: bytes) -> float:
+        """
+        Returns the duration of a chunk of 16 bit mono samples in seconds.
+        """
+        return len(data) / 2 / self.__sample_rate
+
+    def reset(self) -> None:
+        """
+        Forget the pre-roll and hangover, e.g. when the audio stream is not
+        contiguous with the previous chunks. The noise floor is kept.
+        """
+        self.__skipped_seconds += sum(map(self.__seconds, self.__pre_roll))
+        self.__pre_roll.clear()
+        self.__hangover_remaining = 0
+
+    def gate(self, frames: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Iterate over the chunks of an audio stream that should be decoded.
+
+        Parameters:
+        frames (Iterable[bytes]): The audio chunks.
+
+        Yields:
+        bytes: The chunks containing speech, with pre-roll and hangover.
+        """
+        self.reset()
+        for data in frames:
+            yield from self.process(data)
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Returns the seconds of audio forwarded to the recognizer and skipped.
+
+        Returns:
+            Dict[str, float]: 'decoded_seconds' and 'skipped_seconds'.
+        """
+        return {
+            "decoded_seconds": self.__decoded_seconds,
+            "skipped_seconds": self.__skipped_seconds,
+        }
@@ -1,57 +1,307 @@
-import pyaudio
+import itertools
 import json
 import os
-from typing import Callable
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, \
+    Tuple
 from vosk import KaldiRecognizer, Model
-from Models.keyword_recognition import has_keyword
+from Models.audio_capture import capture_service, RATE, RING_BUFFER_CHUNKS
+from Models.barge_in import BargeInMonitor
+from Models.keyword_recognition import has_keyword, get_keyword_matcher
+from Models.lazy_resource import LazyResource
+from Models.telemetry import telemetry
+from Models.voice_activity import PRE_ROLL_CHUNKS, VoiceActivityDetector
 
-# Constants for audio settings
-FORMAT = pyaudio.paInt16
-CHANNELS = 1
-RATE = 16000
-FRAMES_PER_BUFFER = 8192
-READ_BUFFER_SIZE = 4096
+# Number of consecutive partial results that must contain a keyword before
+# an early wake-word trigger fires
+PARTIAL_DEBOUNCE_RESULTS = 2
+# Seconds after an early trigger during which no new trigger fires, so the
+# rest of the same utterance does not trigger again
+PARTIAL_REFRACTORY_SECONDS = 2.0
 
+# Seconds of silence decoded to warm up the recognizer
+WARM_UP_SECONDS = 0.5
+
+
+def warm_up_recognizer(warm_recognizer: KaldiRecognizer) -> None:
+    """
+    Decode a short silence, so the first utterance does not pay for the
+    recognizer's first decode.
+
+    Parameters:
+    warm_recognizer (KaldiRecognizer): The recognizer to warm up.
+    """
+    # 16 bit samples
+    warm_recognizer.AcceptWaveform(bytes(int(RATE * WARM_UP_SECONDS) * 2))
+    warm_recognizer.Reset()
+
+
+def check_recognizer(checked_recognizer: KaldiRecognizer) -> bool:
+    """
+    Check that a recognizer still decodes, leaving it in a clean state.
+
+    Parameters:
+    checked_recognizer (KaldiRecognizer): The recognizer to check.
+
+    Returns:
+    bool: True if the recognizer decoded a short silence.
+    """
+    warm_up_recognizer(checked_recognizer)
+    return True
+
+
+# The model and the shared full recognizer are loaded on first use, or in
+# the background at startup
 vosk_model_path = os.getenv(r'VOSK_MODEL_PATH')
-model = Model(vosk_model_path)
-recognizer = KaldiRecognizer(model, 16000)
+vosk_model: LazyResource[Model] = LazyResource(
+    "vosk_model", lambda: Model(vosk_model_path))
+recognizer: LazyResource[KaldiRecognizer] = LazyResource(
+    "recognizer", lambda: KaldiRecognizer(vosk_model.get(), RATE),
+    warm_up_recognizer, check_recognizer)
 
+# Set PARTIAL_WAKE_TRIGGER to 'true' to detect keywords in partial results
+is_partial_wake_trigger = \
+    os.getenv('PARTIAL_WAKE_TRIGGER', 'false').lower() == 'true'
 
-def process_audio_stream(callback: Callable[[str], bool]) -> str:
+# Set LOW_POWER_IDLE to 'true' to listen for keywords with a recognizer
+# restricted to the keyword vocabulary
+is_low_power_idle = os.getenv('LOW_POWER_IDLE', 'false').lower() == 'true'
+idle_recognizer: LazyResource[KaldiRecognizer] = LazyResource(
+    "idle_recognizer",
+    lambda: KaldiRecognizer(vosk_model.get(), RATE, build_keyword_grammar()),
+    warm_up_recognizer, check_recognizer)
+
+# Set VAD_GATING to 'true' to only decode idle audio that contains speech
+is_vad_gating = os.getenv('VAD_GATING', 'false').lower() == 'true'
+voice_activity_detector = VoiceActivityDetector()
+
+# Listens for the Resident barging in while Care-Bot speaks, with its own
+# full recognizer so it never disturbs the shared one
+barge_in_monitor = BargeInMonitor(
+    lambda: KaldiRecognizer(vosk_model.get(), RATE), capture_service.frames)
+
+
+decode_seconds = telemetry.histogram(
+    "carebot_asr_decode_seconds",
+    "Time to decode each audio chunk, on the server including the wait "
+    "for a recognition worker.")
+decoded_audio_seconds = telemetry.counter(
+    "carebot_asr_audio_seconds_total", "Duration of the audio decoded.")
+
+
+def accept_waveform(stream_recognizer: KaldiRecognizer, data: bytes) -> bool:
+    """
+    Feed an audio chunk to a recognizer, recording the decode time in the
+    metrics.
+
+    Parameters:
+    stream_recognizer (KaldiRecognizer): The recognizer.
+    data (bytes): The 16 bit mono audio chunk.
+
+    Returns:
+    bool: True if the chunk completed an utterance.
+    """
+    if not telemetry.is_enabled():
+        return stream_recognizer.AcceptWaveform(data)
+
+    start_time = time.perf_counter()
+    is_utterance_complete = stream_recognizer.AcceptWaveform(data)
+    decode_seconds.observe(time.perf_counter() - start_time)
+    decoded_audio_seconds.inc(len(data) / (2 * RATE))
+    return is_utterance_complete
+
+
+class UtteranceContinuation:
+    """
+    The rest of an utterance whose keyword triggered early.
+
+    After an early trigger the keyword text is returned at once, and the
+    recognizer that decoded the beginning of the utterance is held here, not
+    reset, with the audio chunks that follow. The next transcription picks
+    the utterance up where the trigger left it, so what the Resident says
+    after the keyword is not lost.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__pending: Optional[Tuple[KaldiRecognizer,
+                                       Iterator[bytes]]] = None
+
+    def hold(self, stream_recognizer: KaldiRecognizer,
+             frames: Iterator[bytes]) -> None:
+        """
+        Hold the rest of an utterance, discarding the one held before.
+
+        Parameters:
+        stream_recognizer (KaldiRecognizer): The recognizer that decoded the
+                          beginning of the utterance.
+        frames (Iterator[bytes]): The audio chunks that follow.
+        """
+        self.discard()
+        with self.__lock:
+            self.__pending = (stream_recognizer, frames)
+
+    def take(self) -> Optional[Tuple[KaldiRecognizer, Iterator[bytes]]]:
+        """
+        Returns the held recognizer and audio chunks, which are no longer
+        held, or None if no utterance is held.
+        """
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = None
+            return pending
+
+    def discard(self) -> None:
+        """
+        Drop the held utterance, if any, resetting its recognizer.
+        """
+        pending = self.take()
+        if pending is None:
+            return
+        stream_recognizer, frames = pending
+        stream_recognizer.Reset()
+        close = getattr(frames, "close", None)
+        if close is not None:
+            close()
+
+
+def process_audio_stream(
+        callback: Callable[[str], bool],
+        partial_callback: Optional[Callable[[str], bool]] = None,
+        frames: Optional[Iterable[bytes]] = None,
+        stream_recognizer: Optional[KaldiRecognizer] = None,
+        continuation: Optional[UtteranceContinuation] = None) -> str:
     """
      Process audio input from the default microphone, uses a callback function
      to determine what to do with the transcribed text, and returns all
      transcribed text.
 
+     The audio is read from the shared capture service, which keeps the
+     microphone open between calls.
+
      Parameters:
      callback (function): A function to call with the transcribed text. It
                           should return True to continue processing, or False
                           to stop.
+     partial_callback (function, optional): A function to call with the
+                          partial hypothesis after every chunk that does not
+                          complete an utterance. It should return True to
+                          continue processing, or False to stop at once, in
+                          which case the partial hypothesis is returned.
+     frames (Iterable[bytes], optional): The audio chunks to process instead
+                          of the microphone, e.g. recorded audio.
+     stream_recognizer (KaldiRecognizer, optional): The recognizer to use
+                          instead of the shared one.
+     continuation (UtteranceContinuation, optional): Where the rest of the
+                          utterance is held when the partial callback stops
+                          processing. Without it the rest of the utterance
+                          is dropped.
 
      Returns:
      str: All transcribed text concatenated together.
      """
-    mic = pyaudio.PyAudio()
-    stream = mic.open(format=FORMAT, channels=CHANNELS, rate=RATE,
-                      input=True, frames_per_buffer=FRAMES_PER_BUFFER)
-    stream.start_stream()
+    if frames is None:
+        frames = capture_service.frames()
+    if stream_recognizer is None:
+        stream_recognizer = recognizer.get()
 
+    # An iterator, so the chunks after an early trigger can be held
+    frames = iter(frames)
     formatted_text = ""
 
-    try:
-        while True:
-            data = stream.read(READ_BUFFER_SIZE)
-            if recognizer.AcceptWaveform(data):
-                result = json.loads(recognizer.Result())
-                formatted_text = result.get('text', '')
+    for data in frames:
+        if accept_waveform(stream_recognizer, data):
+            formatted_text = json.loads(stream_recognizer.Result()).get(
+                'text', '')
+
+            # Call the callback function with the transcribed text
+            if not callback(formatted_text):
+                break
+
+        elif partial_callback is not None:
+            partial_text = json.loads(
+                stream_recognizer.PartialResult()).get('partial', '')
+
+            if not partial_callback(partial_text):
+                formatted_text = partial_text
+                if continuation is not None:
+                    continuation.hold(stream_recognizer, frames)
+                else:
+                    stream_recognizer.Reset()
+                break
+
+    return formatted_text
+
+
+def build_keyword_grammar() -> str:
+    """
+    Build a Vosk grammar made of the words of every keyword surface form and
+    "[unk]", which stands for any other word.
+
+    Returns:
+        str: The grammar as a JSON list of phrases.
+    """
+    words = sorted({word for form in get_keyword_matcher().get_vocabulary()
+                    for word in form.split()})
+    return json.dumps(words + ["[unk]"])
+
+
+def get_idle_recognizer() -> KaldiRecognizer:
+    """
+    Returns the recognizer used while idle, creating it on first use.
+
+    It shares the Vosk model with the full recognizer but only decodes the
+    keyword grammar, which takes far less CPU than large vocabulary
+    decoding. The model must support runtime grammars, as the small Vosk
+    models do.
+
+    Returns:
+        KaldiRecognizer: The grammar restricted recognizer.
+    """
+    return idle_recognizer.get()
+
+
+def get_asr_resources() -> List[LazyResource]:
+    """
+    Returns the speech recognition resources needed to listen for keywords
+    and transcribe, in loading order.
+
+    Returns:
+        List[LazyResource]: The Vosk model and the recognizers.
+    """
+    resources: List[LazyResource] = [vosk_model, recognizer]
+    if is_low_power_idle:
+        resources.append(idle_recognizer)
+    return resources
+
+
+def transcribe_frames(frames: Iterable[bytes],
+                      stream_recognizer: Optional[KaldiRecognizer] = None
+                      ) -> str:
+    """
+    Transcribe already captured audio chunks.
+
+    Parameters:
+    frames (Iterable[bytes]): The audio chunks to transcribe.
+    stream_recognizer (KaldiRecognizer, optional): The recognizer to use
+                      instead of the shared full recognizer.
+
+    Returns:
+        str: The transcribed text of every utterance in the chunks.
+    """
+    if stream_recognizer is None:
+        stream_recognizer = recognizer.get()
 
-                # Call the callback function with the transcribed text
-                if not callback(formatted_text):
-                    break
-    finally:
-        stream.close()
-        mic.terminate()
-        return formatted_text
+    texts: List[str] = []
+    for data in frames:
+        if accept_waveform(stream_recognizer, data):
+            texts.append(json.loads(stream_recognizer.Result()).get(
+                'text', ''))
+    texts.append(json.loads(stream_recognizer.FinalResult()).get('text', ''))
+
+    return " ".join(text for text in texts if len(text) != 0)
 
 
 def transcribe_audio_callback(text: str) -> bool:
@@ -85,23 +335,211 @@ def listen_for_keywords_callback(text: str) -> bool:
     return True  # Continue processing
 
 
+class PartialKeywordTrigger:
+    """
+    Partial result callback for early wake-word detection.
+
+    It fires once a keyword has been present in PARTIAL_DEBOUNCE_RESULTS
+    consecutive partial hypotheses, and not again during the following
+    PARTIAL_REFRACTORY_SECONDS, to debounce unstable hypotheses.
+    """
+
+    def __init__(self, debounce_results: int = PARTIAL_DEBOUNCE_RESULTS,
+                 refractory_seconds: float = PARTIAL_REFRACTORY_SECONDS):
+        self.__debounce_results = debounce_results
+        self.__refractory_seconds = refractory_seconds
+        self.__keyword_results = 0
+        self.__last_trigger_time: Optional[float] = None
+
+    def __call__(self, text: str) -> bool:
+        """
+        Parameters:
+        text (str): The partial hypothesis.
+
+        Returns:
+        bool: True to continue processing, False to stop if the trigger fires.
+        """
+        if not has_keyword(text):
+            self.__keyword_results = 0
+            return True
+
+        self.__keyword_results += 1
+        if self.__keyword_results < self.__debounce_results:
+            return True
+
+        now = time.monotonic()
+        if self.__last_trigger_time is not None and \
+                now - self.__last_trigger_time < self.__refractory_seconds:
+            return True
+
+        self.__keyword_results = 0
+        self.__last_trigger_time = now
+        print(f"Keyword detected in partial text: {text}")
+        return False  # Stop processing if a keyword is detected
+
+
+partial_keyword_trigger = PartialKeywordTrigger()
+
+# The rest of the utterance whose keyword last triggered early
+utterance_continuation = UtteranceContinuation()
+
+
+def transcribe_continued(continuation: UtteranceContinuation,
+                         frames: Optional[Iterable[bytes]] = None,
+                         stream_recognizer: Optional[KaldiRecognizer] = None
+                         ) -> str:
+    """
+    Transcribe the next utterance, first finishing the utterance held by a
+    continuation, if any.
+
+    Parameters:
+    continuation (UtteranceContinuation): The held utterance.
+    frames (Iterable[bytes], optional): The audio chunks to process if no
+                                        utterance is held.
+    stream_recognizer (KaldiRecognizer, optional): The recognizer to use if
+                                                   no utterance is held.
+
+    Returns:
+        str: transcribed text.
+    """
+    pending = continuation.take()
+    if pending is not None:
+        stream_recognizer, frames = pending
+    return process_audio_stream(transcribe_audio_callback, frames=frames,
+                                stream_recognizer=stream_recognizer)
+
+
 def transcribe_audio() -> str:
     """
     Transcribe audio input from the default microphone using Vosk local speech
-    recognition.
+    recognition. After an early keyword trigger, this is the rest of the
+    utterance that contained the keyword.
 
     Returns:
         str: transcribed text.
     """
-    return process_audio_stream(transcribe_audio_callback)
+    return transcribe_continued(utterance_continuation)
+
+
+def get_idle_frames(is_gated: bool) -> Iterable[bytes]:
+    """
+    Returns the microphone audio chunks to decode while listening for
+    keywords.
+
+    Parameters:
+    is_gated (bool): Only return the chunks containing speech, with a short
+                     pre-roll and hangover, as detected by the voice
+                     activity detector. The detector starts with the last
+                     already captured chunks as its pre-roll, so speech that
+                     began just before listening resumed is not cut.
+
+    Returns:
+        Iterable[bytes]: The audio chunks.
+    """
+    if is_gated:
+        return voice_activity_detector.gate(
+            capture_service.frames(PRE_ROLL_CHUNKS))
+    return capture_service.frames()
 
 
-def listen_for_keywords() -> str:
+def listen_for_keywords_low_power(is_early_trigger: bool,
+                                  is_gated: bool) -> str:
+    """
+    Listens for keywords with the grammar restricted idle recognizer, then
+    transcribes the utterance that contained the keyword with the full
+    recognizer.
+
+    Parameters:
+    is_early_trigger (bool): Also detect keywords in partial results.
+    is_gated (bool): Only decode audio that contains speech.
+
+    Returns
+        str: the transcribed text up to the point a keyword was detected.
+    """
+    # Chunks of the utterance being decoded, re-decoded after a trigger
+    utterance_frames: Deque[bytes] = deque(maxlen=RING_BUFFER_CHUNKS)
+
+    def recorded_frames() -> Iterator[bytes]:
+        for data in get_idle_frames(is_gated):
+            utterance_frames.append(data)
+            yield data
+
+    def keyword_callback(text: str) -> bool:
+        is_continue = listen_for_keywords_callback(text)
+        if is_continue:
+            # The utterance ended without a keyword
+            utterance_frames.clear()
+        return is_continue
+
+    idle_continuation = UtteranceContinuation()
+    keyword_text = process_audio_stream(
+        keyword_callback,
+        partial_keyword_trigger if is_early_trigger else None,
+        frames=recorded_frames(),
+        stream_recognizer=get_idle_recognizer(),
+        continuation=idle_continuation)
+    keyword_text = " ".join(
+        word for word in keyword_text.split() if word != "[unk]")
+
+    pending = idle_continuation.take()
+    if pending is not None:
+        # Triggered early: the full recognizer decodes the utterance so far
+        # and the rest of it when the next transcription starts
+        idle_stream_recognizer, frames = pending
+        idle_stream_recognizer.Reset()
+        utterance_continuation.hold(
+            recognizer.get(),
+            itertools.chain(list(utterance_frames), frames))
+        return keyword_text
+
+    transcribed_text = transcribe_frames(utterance_frames)
+    if len(transcribed_text) != 0:
+        return transcribed_text
+
+    return keyword_text
+
+
+def listen_for_keywords(is_early_trigger: Optional[bool] = None,
+                        is_low_power: Optional[bool] = None,
+                        is_gated: Optional[bool] = None) -> str:
     """
     Continuously listens until a keyword or set of keywords are spoken in a
     sentence.
 
+    Parameters:
+    is_early_trigger (bool, optional): Also detect keywords in the partial
+        hypothesis of every chunk, so a keyword triggers while the Resident
+        is still speaking instead of after the end of the utterance. The
+        text heard up to the keyword is returned at once, and the next
+        transcribe_audio call returns the whole utterance. Defaults to the
+        PARTIAL_WAKE_TRIGGER environment variable.
+    is_low_power (bool, optional): Listen with the grammar restricted idle
+        recognizer and switch to the full recognizer after a trigger.
+        Defaults to the LOW_POWER_IDLE environment variable.
+    is_gated (bool, optional): Only decode audio that contains speech, as
+        detected by the voice activity detector. Conversational turns are
+        never gated, since they rely on the recognizer ending an utterance
+        of silence to notice that the Resident did not reply. Defaults to the
+        VAD_GATING environment variable.
+
     Returns
         str: the transcribed text up to the point a keyword was detected.
     """
-    return process_audio_stream(listen_for_keywords_callback)
+    if is_early_trigger is None:
+        is_early_trigger = is_partial_wake_trigger
+    if is_low_power is None:
+        is_low_power = is_low_power_idle
+    if is_gated is None:
+        is_gated = is_vad_gating
+
+    # An utterance left over from the last trigger is not continued
+    utterance_continuation.discard()
+
+    if is_low_power:
+        return listen_for_keywords_low_power(is_early_trigger, is_gated)
+
+    return process_audio_stream(
+        listen_for_keywords_callback,
+        partial_keyword_trigger if is_early_trigger else None,
+        frames=get_idle_frames(is_gated),
+        continuation=utterance_continuation)
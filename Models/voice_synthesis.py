@@ -1,11 +1,72 @@
+import io
 import os
+import queue
+import threading
+import time
+import wave
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
 import pygame
-from TTS.api import TTS
 
-from Models.utilities import remove_temp_files, suppress_stdout
+from Models.lazy_resource import LazyResource
+from Models.telemetry import telemetry, REAL_TIME_FACTOR_BUCKETS
+from Models.tts_cache import SynthesisCache
+from Models.utilities import mixer, suppress_stdout, MAX_SAMPLE_VALUE
+
+# Text synthesized to warm up the TTS model
+WARM_UP_TEXT = "Hello."
+
+
+def load_tts():
+    """
+    Load the TTS model.
+
+    Returns:
+    TTS: The Coqui TTS model named by TTS_MODEL_NAME.
+    """
+    # Imported here, since importing the TTS package alone takes seconds
+    from TTS.api import TTS
+
+    return TTS(model_name=tts_model_name)
+
 
+def warm_up_tts(warm_tts) -> None:
+    """
+    Synthesize a short text, so the first reply does not pay for the
+    model's first inference.
+
+    The TTS logging is not suppressed, since suppressing stdout would also
+    hide the output of the resources loading on other threads.
+
+    Parameters:
+    warm_tts (TTS): The TTS model to warm up.
+    """
+    warm_tts.tts(text=WARM_UP_TEXT)
+
+
+# Loaded on first use, or in the background at startup
 tts_model_name = os.getenv('TTS_MODEL_NAME')
-tts = TTS(model_name=tts_model_name)
+tts: LazyResource = LazyResource(
+    "tts", load_tts, warm_up_tts,
+    check=lambda checked_tts: checked_tts.synthesizer is not None)
+
+# The TTS model is not thread safe, so syntheses take turns, e.g. the
+# prewarming of the fixed phrases in the background and the replies
+synthesis_lock = threading.Lock()
+
+# Synthesized audio of fixed phrases, kept in memory and on disk
+synthesis_cache = SynthesisCache(
+    os.getenv('TTS_CACHE_DIRECTORY', 'tts_cache'),
+    max_disk_bytes=int(os.getenv('TTS_CACHE_MAX_MB', '100')) * 1024 * 1024)
+
+# Set TTS_DEBUG_OUTPUT_FILE to 'true' to synthesize through output/output.wav
+# and keep the file for inspection instead of playing from memory
+is_debug_output_file = \
+    os.getenv('TTS_DEBUG_OUTPUT_FILE', 'false').lower() == 'true'
+
+# Times per second to check if the audio is still playing
+CHECK_AUDIO_FREQUENCY = 10
 
 
 def synthesize_speech(text: str, output_directory: str = "output",
@@ -23,55 +84,380 @@ def synthesize_speech(text: str, output_directory: str = "output",
     """
 
     # do not output the tts logging to stdOut
-    with suppress_stdout():
+    with synthesis_lock, suppress_stdout():
         # Create the output directory if it doesn't exist
         os.makedirs(output_directory, exist_ok=True)
 
         output_file_path = os.path.join(output_directory, filename)
 
         # Use the TTS Models to synthesize the text into an audio file
-        tts.tts_to_file(text=text, file_path=output_file_path)
+        tts.get().tts_to_file(text=text, file_path=output_file_path)
 
         return output_file_path
 
 
-def play_audio_file(file_path: str) -> None:
+def play_audio_file(file_path: str,
+                    stop_event: Optional[threading.Event] = None) -> None:
     """
     Plays an audio file
 
     Parameters:
     file_path (str): The path of the file to play.
+    stop_event (threading.Event, optional): Stops the playback when set.
     """
-
-    # Times per second to check if the audio is still playing
-    check_audio_frequency = 10
-
     pygame.mixer.init()
     pygame.mixer.music.load(file_path)
     pygame.mixer.music.play()
 
     # Allow the audio to play for the duration of the file
     while pygame.mixer.music.get_busy():
-        pygame.time.Clock().tick(check_audio_frequency)
+        if stop_event is not None and stop_event.is_set():
+            pygame.mixer.music.stop()
+            break
+        pygame.time.Clock().tick(CHECK_AUDIO_FREQUENCY)
+
 
+synthesis_seconds = telemetry.histogram(
+    "carebot_tts_seconds", "Duration of the speech syntheses.")
+synthesis_real_time_factor = telemetry.histogram(
+    "carebot_tts_real_time_factor",
+    "Synthesis time divided by the duration of the speech synthesized.",
+    REAL_TIME_FACTOR_BUCKETS)
 
-def process_and_play_response(response_text: str) -> None:
+
+def synthesize_waveform(text: str, is_quiet: bool = True) -> np.ndarray:
     """
-    Process the response text, synthesize speech, save to a temporary file,
-    and play the audio.
+    Synthesize speech from text into memory.
+
+    Parameters:
+    text (str): The text to synthesize.
+    is_quiet (bool, optional): Suppress the TTS logging. Since stdout is
+                               suppressed for the whole process, the server
+                               synthesizing for many rooms keeps it.
+                               Defaults to True.
+
+    Returns:
+    np.ndarray: The mono waveform as float32 samples between -1 and 1, at
+                the output sample rate of the TTS model.
+    """
+    start_time = time.perf_counter()
+    with synthesis_lock:
+        if not is_quiet:
+            waveform = np.asarray(tts.get().tts(text=text), dtype=np.float32)
+        else:
+            # do not output the tts logging to stdOut
+            with suppress_stdout():
+                waveform = np.asarray(tts.get().tts(text=text),
+                                      dtype=np.float32)
+
+    if telemetry.is_enabled():
+        seconds = time.perf_counter() - start_time
+        synthesis_seconds.observe(seconds)
+        audio_seconds = len(waveform) / get_output_sample_rate()
+        if audio_seconds > 0:
+            synthesis_real_time_factor.observe(seconds / audio_seconds)
+
+    return waveform
+
+
+def get_output_sample_rate() -> int:
+    """
+    Returns the sample rate of the waveforms produced by the TTS model.
+
+    Returns:
+    int: The sample rate in Hertz.
+    """
+    return int(tts.get().synthesizer.output_sample_rate)
+
+
+def resample_waveform(waveform: np.ndarray, sample_rate: int,
+                      output_rate: int) -> np.ndarray:
+    """
+    Resample a waveform by linear interpolation.
+
+    Parameters:
+    waveform (np.ndarray): The mono waveform.
+    sample_rate (int): The sample rate of the waveform in Hertz.
+    output_rate (int): The sample rate to resample to in Hertz.
+
+    Returns:
+    np.ndarray: The waveform at the output rate.
+    """
+    if sample_rate == output_rate or len(waveform) == 0:
+        return waveform
+
+    n_samples = int(round(len(waveform) * output_rate / sample_rate))
+    return np.interp(np.arange(n_samples) / output_rate,
+                     np.arange(len(waveform)) / sample_rate, waveform)
+
+
+def waveform_to_pcm(waveform: np.ndarray, sample_rate: int,
+                    output_rate: int) -> bytes:
+    """
+    Convert a waveform to raw 16 bit mono PCM, e.g. to send it to a room
+    of the server.
+
+    Parameters:
+    waveform (np.ndarray): The mono waveform as float samples between -1
+                           and 1.
+    sample_rate (int): The sample rate of the waveform in Hertz.
+    output_rate (int): The sample rate of the PCM in Hertz.
+
+    Returns:
+    bytes: The PCM frames.
+    """
+    waveform = resample_waveform(waveform, sample_rate, output_rate)
+    return np.round(np.clip(waveform, -1.0, 1.0)
+                    * MAX_SAMPLE_VALUE).astype(np.int16).tobytes()
+
+
+def wav_bytes_to_waveform(audio: bytes) -> Tuple[np.ndarray, int]:
+    """
+    Decode the contents of a mono 16 bit WAV file, e.g. from the synthesis
+    cache.
+
+    Parameters:
+    audio (bytes): The WAV file contents.
+
+    Returns:
+    Tuple[np.ndarray, int]: The waveform as float32 samples between -1 and
+                            1, and its sample rate in Hertz.
+    """
+    with wave.open(io.BytesIO(audio), "rb") as wav_file:
+        sample_rate = wav_file.getframerate()
+        samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()),
+                                dtype=np.int16)
+
+    return samples.astype(np.float32) / MAX_SAMPLE_VALUE, sample_rate
+
+
+def waveform_to_sound(waveform: np.ndarray,
+                      sample_rate: int) -> pygame.mixer.Sound:
+    """
+    Convert a waveform to a sound that can be played by the mixer, without
+    any filesystem I/O.
+
+    The waveform is resampled to the mixer frequency and copied to every
+    mixer channel.
+
+    Parameters:
+    waveform (np.ndarray): The mono waveform as float samples between -1
+                           and 1.
+    sample_rate (int): The sample rate of the waveform in Hertz.
+
+    Returns:
+    pygame.mixer.Sound: The sound of the waveform.
+    """
+    mixer.get()
+    mixer_frequency, _, mixer_channels = pygame.mixer.get_init()
+
+    waveform = resample_waveform(waveform, sample_rate, mixer_frequency)
+    samples = np.round(np.clip(waveform, -1.0, 1.0)
+                       * MAX_SAMPLE_VALUE).astype(np.int16)
+
+    if mixer_channels > 1:
+        samples = np.repeat(samples[:, np.newaxis], mixer_channels, axis=1)
+
+    return pygame.sndarray.make_sound(np.ascontiguousarray(samples))
+
+
+def waveform_to_wav_bytes(waveform: np.ndarray, sample_rate: int) -> bytes:
+    """
+    Encode a waveform as the contents of a mono 16 bit WAV file.
+
+    Parameters:
+    waveform (np.ndarray): The mono waveform as float samples between -1
+                           and 1.
+    sample_rate (int): The sample rate of the waveform in Hertz.
+
+    Returns:
+    bytes: The WAV file contents.
+    """
+    samples = np.round(np.clip(waveform, -1.0, 1.0)
+                       * MAX_SAMPLE_VALUE).astype(np.int16)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+
+    return buffer.getvalue()
+
+
+def play_sound(sound: pygame.mixer.Sound,
+               stop_event: Optional[threading.Event] = None) -> None:
+    """
+    Plays a sound and waits until it has finished playing.
+
+    Parameters:
+    sound (pygame.mixer.Sound): The sound to play.
+    stop_event (threading.Event, optional): Stops the playback when set.
+    """
+    if stop_event is not None and stop_event.is_set():
+        return
+
+    channel = sound.play()
+
+    # Allow the audio to play for the duration of the sound
+    while channel is not None and channel.get_busy():
+        if stop_event is not None and stop_event.is_set():
+            channel.stop()
+            break
+        pygame.time.Clock().tick(CHECK_AUDIO_FREQUENCY)
+
+
+def synthesize_sound(text: str, is_cache: bool = False) -> pygame.mixer.Sound:
+    """
+    Synthesize speech from text into a playable sound, in memory.
+
+    Audio found in the synthesis cache is decoded from memory without
+    synthesizing it again.
+
+    Parameters:
+    text (str): The text to synthesize.
+    is_cache (bool, optional): Store the synthesized audio in the cache.
+                               Defaults to False.
+
+    Returns:
+    pygame.mixer.Sound: The sound of the synthesized speech.
+    """
+    audio = synthesis_cache.get(str(tts_model_name), text)
+    if audio is not None:
+        mixer.get()
+        return pygame.mixer.Sound(file=io.BytesIO(audio))
+
+    waveform = synthesize_waveform(text)
+    sample_rate = get_output_sample_rate()
+
+    if is_cache:
+        synthesis_cache.put(str(tts_model_name), text,
+                            waveform_to_wav_bytes(waveform, sample_rate))
+
+    return waveform_to_sound(waveform, sample_rate)
+
+
+def is_synthesis_ready(text: str) -> bool:
+    """
+    Check if a text can be spoken without waiting for the TTS model to load.
+
+    Parameters:
+    text (str): The text to speak.
+
+    Returns:
+    bool: True if the TTS model is loaded or the text is cached.
+    """
+    return tts.is_loaded() or \
+        synthesis_cache.contains(str(tts_model_name), text)
+
+
+def prewarm_synthesis_cache(phrases: Iterable[str]) -> None:
+    """
+    Synthesize the phrases that are not cached yet, so speaking them never
+    reaches the TTS model.
+
+    Parameters:
+    phrases (Iterable[str]): The fixed phrases to cache.
+    """
+    for phrase in phrases:
+        if not synthesis_cache.contains(str(tts_model_name), phrase):
+            synthesis_cache.put(
+                str(tts_model_name), phrase,
+                waveform_to_wav_bytes(synthesize_waveform(phrase),
+                                      get_output_sample_rate()))
+
+
+def process_and_play_response(
+        response_text: str, is_cache: bool = False,
+        stop_event: Optional[threading.Event] = None) -> None:
+    """
+    Process the response text, synthesize speech in memory and play the
+    audio.
+
+    When TTS_DEBUG_OUTPUT_FILE is enabled, the speech is instead synthesized
+    to output/output.wav, which is kept after playing.
 
     Parameters:
     response_text (str): The text to synthesize and play as audio.
+    is_cache (bool, optional): Store the synthesized audio in the cache.
+                               Intended for fixed phrases. Defaults to
+                               False.
+    stop_event (threading.Event, optional): Stops the playback when set,
+                               e.g. to interrupt the reply. Speech that is
+                               still being synthesized is not played.
     """
-    output_file_path = None
-    try:
-        # Synthesize the speech and get the path to the audio file
-        output_file_path = synthesize_speech(response_text)
+    if is_debug_output_file:
+        play_audio_file(synthesize_speech(response_text), stop_event)
+        return
 
-        # Play the synthesized speech
-        play_audio_file(output_file_path)
+    play_sound(synthesize_sound(response_text, is_cache), stop_event)
 
+
+def process_and_play_stream(sentences: Iterable[str],
+                            start_time: Optional[float] = None,
+                            stop_event: Optional[threading.Event] = None
+                            ) -> Optional[float]:
+    """
+    Synthesize and play a response that arrives one sentence at a time.
+
+    Each sentence is synthesized in memory as soon as it is received and
+    queued for playback on a separate thread, so the first sentence is heard
+    while later sentences are still being received and synthesized.
+
+    Parameters:
+    sentences (Iterable[str]): The sentences to synthesize, in speaking order.
+    start_time (float, optional): The time.perf_counter() value the turn
+                                  started at. Defaults to the time this
+                                  function is called.
+    stop_event (threading.Event, optional): Stops the playback and the
+                                  synthesis of further sentences when set.
+
+    Returns:
+    Optional[float]: The time to first audio in seconds, or None if nothing
+                     was played.
+    """
+    if start_time is None:
+        start_time = time.perf_counter()
+
+    playback_queue: "queue.Queue[Optional[pygame.mixer.Sound]]" = \
+        queue.Queue()
+    first_audio_times: List[float] = []
+    playback_errors: List[BaseException] = []
+
+    def playback_worker() -> None:
+        while True:
+            sound = playback_queue.get()
+            if sound is None:
+                break
+
+            try:
+                if not playback_errors and \
+                        not (stop_event is not None and stop_event.is_set()):
+                    if not first_audio_times:
+                        first_audio_times.append(time.perf_counter())
+                    play_sound(sound, stop_event)
+            except Exception as error:
+                playback_errors.append(error)
+
+    playback_thread = threading.Thread(target=playback_worker, daemon=True)
+    playback_thread.start()
+
+    try:
+        for sentence in sentences:
+            if playback_errors or \
+                    (stop_event is not None and stop_event.is_set()):
+                break
+
+            playback_queue.put(synthesize_sound(sentence))
     finally:
-        # Delete the file after playing
-        if output_file_path is not None:
-            remove_temp_files(output_file_path)
+        playback_queue.put(None)
+        playback_thread.join()
+
+    if playback_errors:
+        raise playback_errors[0]
+
+    if not first_audio_times:
+        return None
+
+    return first_audio_times[0] - start_time
@@ -1,4 +1,6 @@
 import textwrap
+from typing import Callable
+
 import streamlit as st
 
 
@@ -157,3 +159,31 @@ class CareBotView:
 
             if 'message_placeholders' not in st.session_state:
                 st.session_state['message_placeholders'] = []
+
+
+class SessionView(CareBotView):
+    """
+    The view of one room of the Care-Bot server, which sends the messages
+    to the room instead of displaying them in Streamlit.
+    """
+
+    def __init__(self, send_text: Callable[[str, bool], None]):
+        """
+        Parameters:
+        send_text (Callable): Sends a message and whether it is what the
+                              Resident said to the room.
+        """
+        super().__init__()
+        self.__send_text = send_text
+
+    def display_streamlit_message(self, message_text: str,
+                                  is_user: bool = True) -> None:
+        """
+        Sends a message to the room.
+
+        Parameters:
+        message_text (str): The text of the message.
+        is_user (bool, optional): Whether the message is from the user.
+                                  Defaults to True.
+        """
+        self.__send_text(message_text, is_user)
@@ -0,0 +1,112 @@
+"""
+Measures the time from the Resident saying "help" while Care-Bot speaks a
+reply to the moment the alert can start, with and without barge-in, and
+checks that Care-Bot's own speech does not trigger a barge-in.
+
+Each WAV file should be a 16 bit mono recording at 16 kHz of the microphone
+while Care-Bot plays a reply, next to a JSON file with the same name:
+
+    {"reply": "The reply being played", "reply_seconds": 12.0,
+     "help_offset": 4.5}
+
+help_offset is the position in seconds at which the Resident starts saying
+"help", or null for recordings of the reply alone. reply_seconds defaults to
+the length of the recording.
+
+With barge-in, the alert can start once the Resident's utterance has been
+decoded. Without barge-in the utterance is lost, so the Resident has to
+repeat it after the reply ends. Classification time is the same in both
+cases and is not included.
+
+Usage:
+    VOSK_MODEL_PATH=... PYTHONPATH=. python benchmarks/barge_in_latency.py \
+        recording.wav [recording.wav ...]
+"""
+import json
+import os
+import statistics
+import sys
+from typing import List, Optional, Tuple
+
+from vosk import KaldiRecognizer
+
+from Models.audio_capture import read_wav_frames, RATE
+from Models.barge_in import BargeInDetector
+from Models.voice_recognition import vosk_model
+
+
+def replay(file_path: str, reply: str
+           ) -> Tuple[Optional[float], Optional[float], float]:
+    """
+    Replay a recording through a barge-in detector and return the positions
+    in seconds at which the barge-in triggered and its utterance ended, and
+    the length of the recording.
+    """
+    detector = BargeInDetector(KaldiRecognizer(vosk_model.get(), RATE))
+    detector.add_spoken_text(reply)
+
+    position = 0.0
+    trigger_position: Optional[float] = None
+    end_position: Optional[float] = None
+
+    for data in read_wav_frames(file_path):
+        position += len(data) / 2 / RATE
+        is_done = detector.process(data)
+        if detector.is_triggered() and trigger_position is None:
+            trigger_position = position
+        if is_done:
+            end_position = position
+            break
+
+    return trigger_position, end_position, position
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    with_barge_in: List[float] = []
+    without_barge_in: List[float] = []
+    false_triggers = 0
+
+    print(f"{'recording':<40} {'stop (s)':>9} {'alert with (s)':>15} "
+          f"{'alert without (s)':>18}")
+
+    for file_path in sys.argv[1:]:
+        with open(os.path.splitext(file_path)[0] + ".json") as info_file:
+            info = json.load(info_file)
+
+        trigger_position, end_position, length = replay(file_path,
+                                                        info["reply"])
+        help_offset = info.get("help_offset")
+
+        if help_offset is None:
+            if trigger_position is not None:
+                false_triggers += 1
+                print(f"{file_path:<40} false trigger at "
+                      f"{trigger_position:.2f} s")
+            continue
+
+        if trigger_position is None or end_position is None:
+            print(f"{file_path:<40} {'missed':>9}")
+            continue
+
+        utterance_seconds = end_position - help_offset
+        reply_seconds = info.get("reply_seconds", length)
+        with_barge_in.append(utterance_seconds)
+        without_barge_in.append(
+            max(reply_seconds - help_offset, 0.0) + utterance_seconds)
+
+        print(f"{file_path:<40} {trigger_position - help_offset:>9.2f} "
+              f"{with_barge_in[-1]:>15.2f} {without_barge_in[-1]:>18.2f}")
+
+    if with_barge_in:
+        print(f"\nMedian time from help to alert: "
+              f"{statistics.median(with_barge_in):.2f} s with barge-in, "
+              f"{statistics.median(without_barge_in):.2f} s without")
+    print(f"False triggers on Care-Bot's own speech: {false_triggers}")
+
+
+if __name__ == "__main__":
+    main()
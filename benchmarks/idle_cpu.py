@@ -0,0 +1,80 @@
+"""
+Compares the CPU cost of idle wake-word listening with the full large
+vocabulary recognizer and with the grammar restricted idle recognizer.
+
+Each WAV file should be a long 16 bit mono recording at 16 kHz of a room
+while Care-Bot is idle. The CPU time spent decoding is reported per hour of
+audio, together with the number of keyword triggers of each recognizer.
+
+Usage:
+    VOSK_MODEL_PATH=... PYTHONPATH=. python benchmarks/idle_cpu.py \
+        recording.wav [recording.wav ...]
+"""
+import json
+import sys
+import time
+from typing import Tuple
+
+from vosk import KaldiRecognizer
+
+from Models.audio_capture import read_wav_frames, RATE
+from Models.keyword_recognition import has_keyword
+from Models.voice_recognition import vosk_model, build_keyword_grammar
+
+SECONDS_PER_HOUR = 3600.0
+
+
+def measure_recognizer(file_path: str,
+                       stream_recognizer: KaldiRecognizer
+                       ) -> Tuple[float, float, int]:
+    """
+    Decode a recording and return the audio duration in seconds, the CPU
+    time spent decoding in seconds and the number of keyword triggers.
+    """
+    audio_frames = 0
+    cpu_seconds = 0.0
+    triggers = 0
+
+    for data in read_wav_frames(file_path):
+        audio_frames += len(data) // 2
+
+        start_time = time.process_time()
+        is_final = stream_recognizer.AcceptWaveform(data)
+        text = json.loads(stream_recognizer.Result()).get('text', '') \
+            if is_final else ''
+        cpu_seconds += time.process_time() - start_time
+
+        if has_keyword(text):
+            triggers += 1
+
+    return audio_frames / RATE, cpu_seconds, triggers
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    grammar = build_keyword_grammar()
+    totals = {"full": [0.0, 0.0, 0], "grammar": [0.0, 0.0, 0]}
+
+    for file_path in sys.argv[1:]:
+        for mode, stream_recognizer in [
+                ("full", KaldiRecognizer(vosk_model.get(), RATE)),
+                ("grammar", KaldiRecognizer(vosk_model.get(), RATE, grammar))]:
+            audio_seconds, cpu_seconds, triggers = measure_recognizer(
+                file_path, stream_recognizer)
+            totals[mode][0] += audio_seconds
+            totals[mode][1] += cpu_seconds
+            totals[mode][2] += triggers
+
+    print(f"{'recognizer':<10} {'audio (h)':>10} {'CPU s/hour':>11} "
+          f"{'triggers':>9}")
+    for mode, (audio_seconds, cpu_seconds, triggers) in totals.items():
+        hours = audio_seconds / SECONDS_PER_HOUR
+        print(f"{mode:<10} {hours:>10.2f} "
+              f"{cpu_seconds / max(hours, 1e-9):>11.1f} {int(triggers):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of keyword matching on a large transcript corpus, comparing
+the original has_keyword regex, which was compiled on every call, with the
+precompiled regex and trie backends of KeywordMatcher.
+
+Usage:
+    PYTHONPATH=. python benchmarks/keyword_benchmark.py [transcript_count]
+"""
+import random
+import re
+import sys
+import time
+from typing import Callable, List
+
+from Models.keyword_recognition import KeywordMatcher, BACKEND_REGEX, \
+    BACKEND_TRIE
+
+FILLER_WORDS = [
+    "i", "am", "the", "a", "to", "and", "it", "is", "was", "what", "for",
+    "lunch", "today", "my", "daughter", "visit", "weather", "nice", "walk",
+    "garden", "television", "dinner", "book", "reading", "music", "friend",
+    "sleep", "morning", "evening", "cup", "tea", "coffee", "window", "bird",
+    "chair", "table", "remember", "when", "we", "went", "lake", "summer",
+]
+
+KEYWORD_WORDS = [
+    "help", "falling", "nurse", "pain", "painful", "care", "bot", "worried",
+    "frightened", "now", "need", "agonizing", "carebot", "stops",
+]
+
+
+def legacy_has_keyword(text: str) -> bool:
+    """
+    The original has_keyword implementation, kept as the baseline.
+    """
+    pattern = re.compile(
+        r'\b(?:Help|Emergency|Fall('
+        r'?:en|ing)?|Hurt|Medication|Doctor|Nurse|Sick|Assistance|Aid'
+        r'|Distress|Panic|Suffering|Support|Alarming|Disturbance|Critical'
+        r'|Rescue|Urgent|Quick|Ache|Trouble|Need|Now|Bad|Unwell|Worsen('
+        r'?:ing)?|Stop|Difficult|Terrible|Worse|Abnormal|Unbearable|Concern'
+        r'|Serious|Intense|Dire|Dangerous|Frantic|Dreadful|Panic('
+        r'?:king)?|Fright(?:en(?:ing|ed)?)?|Terrify(?:ing)?|Urgency|Agon('
+        r'?:y|izing)|Mis(?:ery|erable)|Worr(?:y|ied)|Pain('
+        r'?:ful)?|Care\s*Bot|Care|Bot)('
+        r'?:s|es)?\b',
+        re.IGNORECASE)
+    return bool(pattern.search(text))
+
+
+def build_corpus(transcript_count: int, seed: int = 0) -> List[str]:
+    """
+    Build transcripts similar to Vosk final results heard while idle: mostly
+    small talk, with a keyword in roughly one transcript out of ten.
+    """
+    generator = random.Random(seed)
+    corpus = []
+    for _ in range(transcript_count):
+        words = generator.choices(FILLER_WORDS, k=generator.randint(3, 40))
+        if generator.random() < 0.1:
+            words.insert(generator.randrange(len(words) + 1),
+                         generator.choice(KEYWORD_WORDS))
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def time_matcher(name: str, matcher: Callable[[str], bool],
+                 corpus: List[str]) -> List[bool]:
+    start_time = time.perf_counter()
+    results = [matcher(text) for text in corpus]
+    elapsed = time.perf_counter() - start_time
+    print(f"{name:<22} {elapsed * 1000:9.1f} ms  "
+          f"{elapsed / len(corpus) * 1e6:7.2f} us/transcript  "
+          f"{sum(results)} matches")
+    return results
+
+
+def main() -> None:
+    transcript_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    corpus = build_corpus(transcript_count)
+    print(f"{transcript_count} transcripts, "
+          f"{sum(len(text.split()) for text in corpus)} words")
+
+    baseline = time_matcher("legacy regex", legacy_has_keyword, corpus)
+    for backend in [BACKEND_REGEX, BACKEND_TRIE]:
+        matcher = KeywordMatcher(backend=backend)
+        results = time_matcher(f"precompiled {backend}", matcher.has_keyword,
+                               corpus)
+        mismatches = sum(result != expected
+                         for result, expected in zip(results, baseline))
+        if mismatches:
+            print(f"Warning: the {backend} backend disagrees with the legacy "
+                  f"regex on {mismatches} transcripts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""
+Replays recorded conversations through CareBotController offline and
+reports the latency of every stage of the pipeline and of whole turns.
+
+Each script is a JSON file listing the utterances of the Resident in order,
+as 16 bit mono WAV files recorded at 16 kHz, relative to the script:
+
+    {"name": "fall", "utterances": ["help.wav", "i_fell.wav"]}
+
+Care-Bot listens for keywords until an utterance contains one, and every
+following utterance is the Resident's next input, as if they spoke right
+after the listen cue. The script ends when its utterances run out.
+
+Speech is recognized with the Vosk model and synthesized with the TTS model,
+then handed to a null audio sink that plays nothing, unless
+--real-time-playback waits for the duration of the audio. ChatGPT is
+replaced by the stand-in backend and the caregiver messages are recorded
+instead of being sent, so no network access is needed.
+
+The stages are beep, asr, classification, generation, synthesis and
+playback. A turn lasts from the recognition of an input to the first audio
+of Care-Bot's answer, and an alert from an urgent input to the first
+caregiver message. STREAM_RESPONSES, COMBINED_TURN and ASYNC_CONTROLLER
+select the pipeline as they do for main.py.
+
+The results are written as JSON. With --compare, the median and 95th
+percentile of every stage are compared with the results of a previous run,
+e.g. of another commit.
+
+Usage:
+    VOSK_MODEL_PATH=... TTS_MODEL_NAME=... PYTHONPATH=. \
+        python benchmarks/replay_pipeline.py script.json [script.json ...] \
+        [--repeat 3] [--output replay_results.json] \
+        [--compare previous.json] [--llm-latency 0.5] [--real-time-playback]
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import Models.chatgpt_prompts as chatgpt_prompts
+from Models.audio_capture import read_wav_frames
+from Models.classifier_cache import ClassifierCache
+from Models.keyword_recognition import has_keyword
+from Models.llm_backends import StandInBackend
+from Models.model import CareBotModel
+from Models.utilities import SAMPLE_RATE, render_tone, suppress_stdout, CUES
+from Models.voice_recognition import recognizer, transcribe_frames
+from Models.voice_synthesis import synthesis_cache, tts, tts_model_name, \
+    synthesize_waveform, get_output_sample_rate, waveform_to_wav_bytes, \
+    wav_bytes_to_waveform
+from View.view import CareBotView
+from Controller.controller import SYSTEM_PHRASES
+from main import create_controller, run_controller
+
+STAGES = ["beep", "asr", "classification", "generation", "synthesis",
+          "playback", "turn", "alert"]
+
+
+class ScriptFinished(Exception):
+    """
+    Raised when Care-Bot listens after the last utterance of a script.
+    """
+
+
+class StageRecorder:
+    """
+    Collects the durations of the stages, from any thread.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__samples: Dict[str, List[float]] = {stage: []
+                                                  for stage in STAGES}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self.__lock:
+            self.__samples.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start_time)
+
+    def get_samples(self) -> Dict[str, List[float]]:
+        with self.__lock:
+            return {stage: list(samples)
+                    for stage, samples in self.__samples.items()}
+
+
+class ReplayModel(CareBotModel):
+    """
+    A model that hears the utterances of a script, plays into a null audio
+    sink, records the caregiver messages and times every stage.
+    """
+
+    def __init__(self, utterances: List[str], recorder: StageRecorder,
+                 is_real_time_playback: bool = False):
+        self.__utterances = deque(utterances)
+        self.__recorder = recorder
+        self.__is_real_time_playback = is_real_time_playback
+        self.__messages: List[str] = []
+        self.__checkpoint: List[Dict[str, str]] = []
+        # Time the last input was recognized, until the first audio after it
+        self.__input_time: Optional[float] = None
+
+    def get_messages(self) -> List[str]:
+        return self.__messages
+
+    def hear_next_utterance(self) -> str:
+        if not self.__utterances:
+            raise ScriptFinished()
+
+        file_path = self.__utterances.popleft()
+        with self.__recorder.measure("asr"):
+            text = transcribe_frames(read_wav_frames(file_path))
+        return text
+
+    def transcribe_audio(self):
+        text = self.hear_next_utterance()
+        self.__input_time = time.perf_counter()
+        return text
+
+    def listen_for_keywords(self):
+        while True:
+            text = self.hear_next_utterance()
+            if has_keyword(text):
+                self.__input_time = time.perf_counter()
+                return text
+
+    def play(self, seconds: float,
+             stop_event: Optional[threading.Event] = None) -> None:
+        """
+        Hand audio of a duration to the null sink, which waits for the
+        duration only if playback is in real time.
+        """
+        input_time = self.__input_time
+        if input_time is not None:
+            self.__input_time = None
+            self.__recorder.add("turn", time.perf_counter() - input_time)
+
+        with self.__recorder.measure("playback"):
+            if self.__is_real_time_playback:
+                if stop_event is None:
+                    time.sleep(seconds)
+                else:
+                    stop_event.wait(seconds)
+
+    def beep(self, frequency: int, duration: int):
+        start_time = time.perf_counter()
+        samples = render_tone(frequency, duration)
+        self.play(len(samples) / SAMPLE_RATE)
+        self.__recorder.add("beep", time.perf_counter() - start_time)
+
+    def play_cue(self, name: str):
+        self.beep(*CUES[name])
+
+    def synthesize(self, text: str,
+                   is_cache: bool = False) -> Tuple[np.ndarray, int]:
+        with self.__recorder.measure("synthesis"):
+            audio = synthesis_cache.get(str(tts_model_name), text)
+            if audio is not None:
+                return wav_bytes_to_waveform(audio)
+
+            waveform = synthesize_waveform(text)
+            sample_rate = get_output_sample_rate()
+            if is_cache:
+                synthesis_cache.put(
+                    str(tts_model_name), text,
+                    waveform_to_wav_bytes(waveform, sample_rate))
+            return waveform, sample_rate
+
+    def process_and_play_response(
+            self, message: str, is_cache: bool = False,
+            stop_event: Optional[threading.Event] = None):
+        waveform, sample_rate = self.synthesize(message, is_cache)
+        self.play(len(waveform) / sample_rate, stop_event)
+
+    def process_and_play_stream(
+            self, sentences, start_time: Optional[float] = None,
+            stop_event: Optional[threading.Event] = None
+    ) -> Optional[float]:
+        if start_time is None:
+            start_time = time.perf_counter()
+
+        first_audio_time: Optional[float] = None
+        for sentence in sentences:
+            if stop_event is not None and stop_event.is_set():
+                break
+            waveform, sample_rate = self.synthesize(sentence)
+            if first_audio_time is None:
+                first_audio_time = time.perf_counter()
+            self.play(len(waveform) / sample_rate, stop_event)
+
+        if first_audio_time is None:
+            return None
+        return first_audio_time - start_time
+
+    def timed(self, stage: str, function: Callable[..., Any],
+              *args: Any) -> Any:
+        with self.__recorder.measure(stage):
+            return function(*args)
+
+    def generate_response(self, input_text, conversation_history,
+                          is_save_conversation_history=True):
+        return self.timed("generation", CareBotModel.generate_response,
+                          input_text, conversation_history,
+                          is_save_conversation_history)
+
+    def generate_turn(self, input_text, conversation_history):
+        return self.timed("generation", CareBotModel.generate_turn,
+                          input_text, conversation_history)
+
+    def generate_response_stream(self, input_text, conversation_history,
+                                 is_save_conversation_history=True):
+        # Only the time spent waiting for the sentences is generation
+        sentences = CareBotModel.generate_response_stream(
+            input_text, conversation_history, is_save_conversation_history)
+        generation_seconds = 0.0
+        while True:
+            start_time = time.perf_counter()
+            sentence = next(sentences, None)
+            generation_seconds += time.perf_counter() - start_time
+            if sentence is None:
+                break
+            yield sentence
+        self.__recorder.add("generation", generation_seconds)
+
+    def is_urgent_assistance_needed(self, input_text):
+        return self.timed("classification",
+                          CareBotModel.is_urgent_assistance_needed,
+                          input_text)
+
+    def is_intent_to_end_conversation(self, input_text):
+        return self.timed("classification",
+                          CareBotModel.is_intent_to_end_conversation,
+                          input_text)
+
+    def send_mms(self, message: str):
+        self.__messages.append(message)
+
+    def enqueue_mms(self, message: str,
+                    on_sent: Optional[Callable[[], None]] = None) -> int:
+        self.__messages.append(message)
+        if on_sent is not None:
+            on_sent()
+        return len(self.__messages)
+
+    def save_conversation_checkpoint(self, conversation_history):
+        self.__checkpoint = list(conversation_history)
+
+    def load_conversation_checkpoint(self):
+        return list(self.__checkpoint)
+
+    def clear_conversation_checkpoint(self):
+        self.__checkpoint = []
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """
+    Returns the count, mean, median, 95th percentile and maximum of the
+    samples, in seconds.
+    """
+    if not samples:
+        return {"count": 0}
+
+    ordered = sorted(samples)
+    return {"count": len(ordered),
+            "mean": sum(ordered) / len(ordered),
+            "p50": ordered[min(len(ordered) // 2, len(ordered) - 1)],
+            "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+            "max": ordered[-1]}
+
+
+def run_script(script_path: str, recorder: StageRecorder,
+               is_real_time_playback: bool) -> Dict[str, Any]:
+    """
+    Replay a script and return what happened.
+    """
+    with open(script_path, encoding="utf-8") as file:
+        script = json.load(file)
+    directory = os.path.dirname(os.path.abspath(script_path))
+    utterances = [os.path.join(directory, utterance)
+                  for utterance in script["utterances"]]
+
+    model = ReplayModel(utterances, recorder, is_real_time_playback)
+    controller = create_controller(model, CareBotView(), is_barge_in=False)
+    start_time = time.perf_counter()
+    try:
+        run_controller(controller)
+    except ScriptFinished:
+        pass
+
+    for alert_latency in controller.get_alert_latency():
+        recorder.add("alert", alert_latency)
+    return {"name": script.get("name", os.path.basename(script_path)),
+            "seconds": time.perf_counter() - start_time,
+            "caregiver_messages": len(model.get_messages()),
+            "time_to_first_audio": controller.get_time_to_first_audio(),
+            "alert_latency": controller.get_alert_latency()}
+
+
+def get_commit() -> Optional[str]:
+    """
+    Returns the commit of the benchmarked code, if it is a git repository.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(stages: Dict[str, Dict[str, float]],
+                     previous_stages: Dict[str, Dict[str, float]]) -> None:
+    """
+    Print the change of the median and 95th percentile of every stage.
+    """
+    print(f"\n{'stage':<15} {'p50 before':>11} {'p50 now':>9} "
+          f"{'p95 before':>11} {'p95 now':>9} {'p95 change':>11}")
+    for stage in STAGES:
+        now = stages.get(stage, {})
+        before = previous_stages.get(stage, {})
+        if "p95" not in now or "p95" not in before:
+            continue
+        change = now["p95"] - before["p95"]
+        print(f"{stage:<15} {before['p50'] * 1000:>9.1f}ms "
+              f"{now['p50'] * 1000:>7.1f}ms {before['p95'] * 1000:>9.1f}ms "
+              f"{now['p95'] * 1000:>7.1f}ms {change * 1000:>+9.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Replay recorded conversations offline and report the "
+                    "latency of every stage.")
+    parser.add_argument("scripts", nargs="+",
+                        help="JSON scripts of recorded utterances")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="number of times every script is replayed")
+    parser.add_argument("--output", default="replay_results.json",
+                        help="file the JSON results are written to")
+    parser.add_argument("--compare",
+                        help="JSON results of a previous run to compare to")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="seconds before each stand-in LLM response")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0,
+                        help="seconds between streamed stand-in pieces")
+    parser.add_argument("--real-time-playback", action="store_true",
+                        help="wait for the duration of the audio played")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the output of Care-Bot")
+    args = parser.parse_args()
+
+    # Replays never reach the network, and never reuse the verdicts of a
+    # previous run
+    chatgpt_prompts.llm_backend = StandInBackend(
+        latency_seconds=args.llm_latency,
+        token_latency_seconds=args.llm_token_latency)
+    chatgpt_prompts.classifier_cache = ClassifierCache()
+
+    # The models are loaded and the fixed messages cached before measuring,
+    # as they are before Care-Bot first listens
+    recognizer.get()
+    tts.get()
+    CareBotModel.prewarm_synthesis_cache(SYSTEM_PHRASES)
+
+    recorder = StageRecorder()
+    scripts: List[Dict[str, Any]] = []
+    for _ in range(args.repeat):
+        for script_path in args.scripts:
+            if args.verbose:
+                scripts.append(run_script(script_path, recorder,
+                                          args.real_time_playback))
+                continue
+            with suppress_stdout():
+                scripts.append(run_script(script_path, recorder,
+                                          args.real_time_playback))
+
+    samples = recorder.get_samples()
+    stages = {stage: summarize(samples.get(stage, [])) for stage in STAGES}
+    results = {
+        "commit": get_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "stream_responses":
+                os.getenv('STREAM_RESPONSES', 'false').lower() == 'true',
+            "combined_turn":
+                os.getenv('COMBINED_TURN', 'false').lower() == 'true',
+            "async_controller":
+                os.getenv('ASYNC_CONTROLLER', 'false').lower() == 'true',
+            "llm_latency": args.llm_latency,
+            "llm_token_latency": args.llm_token_latency,
+            "real_time_playback": args.real_time_playback,
+            "repeat": args.repeat,
+        },
+        "stages": stages,
+        "scripts": scripts,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    print(f"{'stage':<15} {'count':>6} {'mean':>9} {'p50':>9} {'p95':>9} "
+          f"{'max':>9}")
+    for stage, summary in stages.items():
+        if summary["count"] == 0:
+            continue
+        print(f"{stage:<15} {int(summary['count']):>6} " + " ".join(
+            f"{summary[key] * 1000:>7.1f}ms"
+            for key in ["mean", "p50", "p95", "max"]))
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            print_comparison(stages, json.load(file)["stages"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Measures how many rooms one Care-Bot server process can serve: the memory
+each added room costs and the number of rooms a CPU core can decode in real
+time.
+
+The server is started in process, and rooms are simulated by clients that
+stream a WAV file in real time, looping over it. The file should be a 16 bit
+mono recording at 16 kHz of a room while Care-Bot is idle, so the rooms only
+listen for keywords. The number of rooms is doubled at every step. A step
+keeps up if 95% of the audio chunks waited less than the duration of a
+chunk for a recognition worker.
+
+Usage:
+    VOSK_MODEL_PATH=... PYTHONPATH=. python benchmarks/session_capacity.py \
+        recording.wav [max_rooms] [seconds_per_step]
+"""
+import json
+import os
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+
+from Models.audio_capture import read_wav_frames, RATE, READ_BUFFER_SIZE
+from Models.resident_session import FRAME_AUDIO, FRAME_TEXT, read_frame, \
+    write_frame
+from Models.voice_recognition import vosk_model
+from server import CareBotServer
+
+BYTES_PER_MEGABYTE = 1024 * 1024
+# Seconds to let new rooms connect before measuring
+SETTLE_SECONDS = 2.0
+CHUNK_SECONDS = READ_BUFFER_SIZE / RATE
+
+
+def get_resident_bytes() -> int:
+    """
+    Returns the resident memory of the process in bytes.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # The peak resident memory, in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def stream_room(socket_path: str, room: str, chunks: List[bytes],
+                stop_event: threading.Event) -> None:
+    """
+    Connect a room and stream the chunks in real time until stopped.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(socket_path)
+
+    def drain() -> None:
+        try:
+            while read_frame(connection) is not None:
+                pass
+        except OSError:
+            pass
+
+    threading.Thread(target=drain, daemon=True).start()
+    write_frame(connection, FRAME_TEXT, json.dumps({"room": room}).encode())
+
+    start_time = time.monotonic()
+    index = 0
+    try:
+        while not stop_event.is_set():
+            write_frame(connection, FRAME_AUDIO, chunks[index % len(chunks)])
+            index += 1
+            delay = start_time + index * CHUNK_SECONDS - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    finally:
+        connection.close()
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    chunks = list(read_wav_frames(sys.argv[1]))
+    max_rooms = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    seconds_per_step = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+    cores = os.cpu_count() or 1
+
+    vosk_model.get()
+    directory = tempfile.mkdtemp()
+    server = CareBotServer(os.path.join(directory, "carebot.sock"),
+                           max_rooms, cores,
+                           checkpoint_directory=directory)
+    server.start()
+    base_bytes = get_resident_bytes()
+
+    stop_event = threading.Event()
+    threads: List[threading.Thread] = []
+    rows = []
+    rooms = 1
+
+    print(f"{'rooms':>6} {'RSS MB':>8} {'MB/room':>8} "
+          f"{'CPU s/audio s':>14} {'p95 wait ms':>12} {'keeps up':>9}")
+    try:
+        while rooms <= max_rooms:
+            while len(threads) < rooms:
+                thread = threading.Thread(
+                    target=stream_room,
+                    args=(server.get_socket_path(), f"room-{len(threads)}",
+                          chunks, stop_event),
+                    daemon=True)
+                thread.start()
+                threads.append(thread)
+            time.sleep(SETTLE_SECONDS)
+
+            start_cpu = time.process_time()
+            time.sleep(seconds_per_step)
+            cpu_seconds = time.process_time() - start_cpu
+
+            resident_bytes = get_resident_bytes()
+            per_room_bytes = (resident_bytes - base_bytes) / rooms
+            cpu_per_audio_second = cpu_seconds / (rooms * seconds_per_step)
+            wait = server.get_recognition_scheduler().get_wait_percentile(95)
+            wait = 0.0 if wait is None else wait
+            keeps_up = server.get_session_count() == rooms and \
+                wait < CHUNK_SECONDS
+            rows.append((rooms, per_room_bytes, cpu_per_audio_second,
+                         keeps_up))
+
+            print(f"{rooms:>6} {resident_bytes / BYTES_PER_MEGABYTE:>8.1f} "
+                  f"{per_room_bytes / BYTES_PER_MEGABYTE:>8.1f} "
+                  f"{cpu_per_audio_second:>14.3f} {wait * 1000:>12.1f} "
+                  f"{'yes' if keeps_up else 'no':>9}")
+            if not keeps_up:
+                break
+            rooms *= 2
+    finally:
+        stop_event.set()
+        server.stop()
+
+    _, per_room_bytes, cpu_per_audio_second, _ = rows[-1]
+    served_rooms = max([row[0] for row in rows if row[3]], default=0)
+    print(f"\nMemory per added room: "
+          f"{per_room_bytes / BYTES_PER_MEGABYTE:.1f} MB")
+    print(f"Rooms per core, from the CPU cost: "
+          f"{1 / max(cpu_per_audio_second, 1e-9):.1f}")
+    print(f"Rooms per core, served in real time: {served_rooms / cores:.1f} "
+          f"({served_rooms} rooms on {cores} cores)")
+
+
+if __name__ == "__main__":
+    main()
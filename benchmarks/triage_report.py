@@ -0,0 +1,74 @@
+"""
+Reports how the local urgency triage performs on the phrases used by the
+LLM urgency integration tests.
+
+Usage:
+    PYTHONPATH=. python benchmarks/triage_report.py
+"""
+import ast
+import os
+from typing import List, Tuple
+
+from Models.urgency_triage import UrgencyTriage
+
+TEST_FILE_PATH = os.path.join(os.path.dirname(__file__), "..", "tests",
+                              "integration_tests", "test_gpt_prompts.py")
+
+
+def load_urgency_test_phrases(file_path: str = TEST_FILE_PATH
+                              ) -> Tuple[List[str], List[str]]:
+    """
+    Collect the phrases passed to is_urgent_assistance_needed by the tests
+    expecting True and by the tests expecting False.
+
+    Parameters:
+    file_path (str): The path of the integration test file.
+
+    Returns:
+    Tuple[List[str], List[str]]: The urgent and the non urgent phrases.
+    """
+    with open(file_path) as test_file:
+        tree = ast.parse(test_file.read())
+
+    urgent_phrases: List[str] = []
+    non_urgent_phrases: List[str] = []
+
+    for function in tree.body:
+        if not isinstance(function, ast.FunctionDef) or \
+                not function.name.startswith("test_is_urgent"):
+            continue
+
+        phrases = urgent_phrases if function.name.endswith("_true") \
+            else non_urgent_phrases
+
+        for node in ast.walk(function):
+            if isinstance(node, ast.Call) and \
+                    isinstance(node.func, ast.Name) and \
+                    node.func.id == "is_urgent_assistance_needed" and \
+                    isinstance(node.args[0], ast.Constant):
+                phrases.append(node.args[0].value)
+
+    return urgent_phrases, non_urgent_phrases
+
+
+def main() -> None:
+    urgent_phrases, non_urgent_phrases = load_urgency_test_phrases()
+    triage = UrgencyTriage()
+
+    for phrase in urgent_phrases + non_urgent_phrases:
+        print(f"{triage.triage(phrase):>9}  {phrase}")
+
+    report = triage.report_recall(urgent_phrases, non_urgent_phrases)
+    print()
+    print(f"Urgent phrases: {len(urgent_phrases)}, "
+          f"non urgent phrases: {len(non_urgent_phrases)}")
+    print(f"Recall: {report['recall']:.2%}")
+    print(f"Emergency false positives: "
+          f"{report['emergency_false_positives']:.2%}")
+    print(f"Non urgent phrases skipping the LLM: {report['benign_rate']:.2%}")
+    print(f"Avoided LLM calls: {triage.get_avoided_llm_calls()} of "
+          f"{len(urgent_phrases) + len(non_urgent_phrases)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Replays recorded overnight audio through the idle keyword recognizer with
+and without voice activity gating, to check that gating skips most of the
+decoding without losing any utterance.
+
+Each WAV file should be a long 16 bit mono recording at 16 kHz of a room
+while Care-Bot is idle. The seconds of audio decoded and skipped, the CPU
+time spent decoding and the utterances recognized are reported. Utterances
+recognized without gating but missed with gating are listed.
+
+Usage:
+    VOSK_MODEL_PATH=... PYTHONPATH=. python benchmarks/vad_replay.py \
+        recording.wav [recording.wav ...]
+"""
+import sys
+import time
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+from vosk import KaldiRecognizer
+
+from Models.audio_capture import read_wav_frames, RATE
+from Models.keyword_recognition import has_keyword
+from Models.voice_activity import VoiceActivityDetector
+from Models.voice_recognition import vosk_model, process_audio_stream
+
+
+def decode(frames: Iterable[bytes]) -> Tuple[List[str], float]:
+    """
+    Decode audio chunks and return the non empty utterances recognized and
+    the CPU time spent in seconds.
+    """
+    utterances: List[str] = []
+
+    def collect(text: str) -> bool:
+        if text:
+            utterances.append(text)
+        return True
+
+    start_time = time.process_time()
+    process_audio_stream(
+        collect, frames=frames,
+        stream_recognizer=KaldiRecognizer(vosk_model.get(), RATE))
+    return utterances, time.process_time() - start_time
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    detector = VoiceActivityDetector()
+    audio_seconds = 0.0
+    cpu_seconds = {"ungated": 0.0, "gated": 0.0}
+    keyword_utterances = {"ungated": 0, "gated": 0}
+    missed: List[str] = []
+
+    for file_path in sys.argv[1:]:
+        audio_seconds += sum(len(data) // 2 for data in
+                             read_wav_frames(file_path)) / RATE
+
+        ungated, ungated_cpu = decode(read_wav_frames(file_path))
+        gated, gated_cpu = decode(detector.gate(read_wav_frames(file_path)))
+        cpu_seconds["ungated"] += ungated_cpu
+        cpu_seconds["gated"] += gated_cpu
+        keyword_utterances["ungated"] += sum(map(has_keyword, ungated))
+        keyword_utterances["gated"] += sum(map(has_keyword, gated))
+
+        # Utterances may be split differently, so compare the words
+        gated_words = Counter(" ".join(gated).split())
+        for utterance in ungated:
+            if any(gated_words[word] == 0 for word in utterance.split()):
+                missed.append(f"{file_path}: {utterance}")
+
+    stats = detector.get_stats()
+    print(f"audio:   {audio_seconds:.1f} s")
+    print(f"decoded: {stats['decoded_seconds']:.1f} s, "
+          f"skipped: {stats['skipped_seconds']:.1f} s")
+    for mode in ["ungated", "gated"]:
+        print(f"{mode:<8} CPU {cpu_seconds[mode]:.1f} s, "
+              f"keyword utterances {keyword_utterances[mode]}")
+
+    print(f"utterances missed with gating: {len(missed)}")
+    for utterance in missed:
+        print("  " + utterance)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Measures wake-word trigger latency on recorded audio, comparing detection in
+Vosk final results with early detection in partial results.
+
+Each WAV file should be a 16 bit mono recording at 16 kHz of a Resident
+saying a sentence with a keyword followed by silence. The latency is the
+position in the recording at which the call listening for the keyword
+returns, so it is independent of how fast the machine decodes.
+
+Usage:
+    VOSK_MODEL_PATH=... PYTHONPATH=. python benchmarks/wake_latency.py \
+        recording.wav [recording.wav ...]
+"""
+import statistics
+import sys
+from typing import Iterator, List, Optional
+
+from vosk import KaldiRecognizer
+
+from Models.audio_capture import read_wav_frames, RATE
+from Models.keyword_recognition import has_keyword
+from Models.voice_recognition import vosk_model, process_audio_stream, \
+    listen_for_keywords_callback, PartialKeywordTrigger
+
+
+def measure_trigger_position(file_path: str,
+                             is_early_trigger: bool) -> Optional[float]:
+    """
+    Returns the position in seconds of the recording at which the call
+    listening for a keyword returns, or None if no keyword triggers.
+    """
+    consumed_frames = [0]
+
+    def counted_frames() -> Iterator[bytes]:
+        for data in read_wav_frames(file_path):
+            consumed_frames[0] += len(data) // 2
+            yield data
+
+    text = process_audio_stream(
+        listen_for_keywords_callback,
+        PartialKeywordTrigger() if is_early_trigger else None,
+        frames=counted_frames(),
+        stream_recognizer=KaldiRecognizer(vosk_model.get(), RATE))
+
+    if not has_keyword(text):
+        return None
+    return consumed_frames[0] / RATE
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    savings: List[float] = []
+    print(f"{'recording':<40} {'final (s)':>10} {'partial (s)':>12}")
+
+    for file_path in sys.argv[1:]:
+        final_position = measure_trigger_position(file_path, False)
+        partial_position = measure_trigger_position(file_path, True)
+
+        print(f"{file_path:<40} {str(final_position):>10} "
+              f"{str(partial_position):>12}")
+
+        if final_position is not None and partial_position is not None:
+            savings.append(final_position - partial_position)
+
+    if savings:
+        print(f"\nMean latency saved by partial detection: "
+              f"{statistics.mean(savings):.3f} s over {len(savings)} "
+              f"recordings (median {statistics.median(savings):.3f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,182 @@
+import asyncio
+import os
+import threading
+import time
 import traceback
+from typing import List, Optional
 
 from Models.model import CareBotModel
+from Models.telemetry import telemetry
 from View.view import CareBotView
 from Controller.controller import CareBotController
+from Controller.async_controller import AsyncCareBotController
+
+# Warm restarts allowed within the window. Further failures restart the
+# whole process, so a persistent failure does not loop forever.
+MAX_WARM_RESTARTS = 3
+WARM_RESTART_WINDOW_SECONDS = 60.0
+
+restart_to_listening_seconds = telemetry.histogram(
+    "carebot_restart_to_listening_seconds",
+    "Time from an error to listening again after a warm restart.")
+
+
+def create_controller(model: CareBotModel, view: CareBotView,
+                      is_barge_in: Optional[bool] = None
+                      ) -> CareBotController:
+    """
+    Create the controller configured by the environment variables.
+
+    Args:
+        model (CareBotModel): The model, shared across restarts.
+        view (CareBotView): The view, shared across restarts.
+        is_barge_in (bool, optional): Whether the Resident may interrupt
+        Care-Bot. Defaults to the BARGE_IN environment variable.
+
+    Returns:
+        CareBotController: The controller.
+    """
+    is_stream_response: bool = \
+        os.getenv('STREAM_RESPONSES', 'false').lower() == 'true'
+    is_combined_turn: bool = \
+        os.getenv('COMBINED_TURN', 'false').lower() == 'true'
+    if is_barge_in is None:
+        is_barge_in = os.getenv('BARGE_IN', 'false').lower() == 'true'
+    is_async_controller: bool = \
+        os.getenv('ASYNC_CONTROLLER', 'false').lower() == 'true'
+    controller_class = AsyncCareBotController if is_async_controller \
+        else CareBotController
+    return controller_class(
+        model, view, is_stream_response=is_stream_response,
+        is_combined_turn=is_combined_turn, is_barge_in=is_barge_in)
+
+
+def handle_input(controller: CareBotController, input_text: str) -> None:
+    """
+    Handle an input of the Resident that starts or resumes a conversation.
+
+    Args:
+        controller (CareBotController): The controller.
+        input_text (str): The Resident's input.
+    """
+    # In combined turn mode urgency is checked by the conversation's
+    # first turn, so the keyword utterance needs no separate call
+    if not controller.get_is_combined_turn() and \
+            controller.handle_urgent_assistance(input_text):
+        return
+
+    controller.handle_conversation(input_text)
+
+
+def restart_controller(controller: CareBotController, error_message: str,
+                       traceback_message: str, is_warm: bool,
+                       is_resources_healthy: bool) -> None:
+    """
+    Alert the Resident of an error and restart. If the announcement of a
+    warm restart fails, the whole process is restarted instead, without
+    announcing it again.
+
+    Args:
+        controller (CareBotController): The controller that failed.
+        error_message (str): The message of the error.
+        traceback_message (str): The traceback of the error.
+        is_warm (bool): Only restart the conversation loop.
+        is_resources_healthy (bool): Whether the speech models passed their
+        health check.
+    """
+    if is_warm:
+        try:
+            controller.restart_system(error_message, traceback_message,
+                                      True, is_resources_healthy)
+            return
+        except Exception as error:
+            print("Could not announce the warm restart, restarting the "
+                  "process:", error)
+            is_resources_healthy = False
+
+    controller.restart_system(error_message, traceback_message, False,
+                              is_resources_healthy)
+
+
+def run_controller(controller: CareBotController) -> None:
+    """
+    Run the conversation loop forever, first resuming the conversation saved
+    before a restart, if any.
+
+    Args:
+        controller (CareBotController): The controller.
+    """
+    if isinstance(controller, AsyncCareBotController):
+        asyncio.run(controller.run(is_resume=True))
+        return
+
+    if controller.resume_conversation():
+        input_text: str = controller.get_voice_input()
+        if len(input_text) != 0:
+            handle_input(controller, input_text)
+
+    while True:
+        input_text = controller.get_voice_input(is_listen_keywords=True)
+        handle_input(controller, input_text)
 
 
 def main() -> None:
     """
     Main function to run program.
+
+    The conversation loop is supervised: after an error, only the
+    controller is restarted, with the models still loaded and the
+    conversation resumed from its checkpoint. The whole process is
+    restarted if a model is corrupted or the errors keep coming.
     """
     model: CareBotModel = CareBotModel()
+    model.start_telemetry_export()
+    # Speech recognition, the TTS model, the mixer and the Twilio client load
+    # in parallel, listening starts as soon as speech recognition is ready
+    model.start_warm_up()
+    model.prerender_cues()
+    model.start_outbox()
     view: CareBotView = CareBotView()
-    controller: CareBotController = CareBotController(model, view)
 
-    try:
-        while True:
-            input_text: str = controller.get_voice_input(
-                is_listen_keywords=True)
+    restart_start_time: Optional[float] = None
+    warm_restart_times: List[float] = []
+
+    def on_listening() -> None:
+        nonlocal restart_start_time
+        if restart_start_time is not None:
+            restart_seconds = time.perf_counter() - restart_start_time
+            restart_to_listening_seconds.observe(restart_seconds)
+            print(f"Restart to listening: {restart_seconds:.2f} seconds")
+            restart_start_time = None
+
+    controller: CareBotController = create_controller(model, view)
+    threading.Thread(target=controller.prewarm_system_phrases,
+                     name="prewarm_system_phrases", daemon=True).start()
+
+    while True:
+        controller.set_on_listening(on_listening)
+        try:
+            run_controller(controller)
 
-            if controller.handle_urgent_assistance(input_text):
-                continue
+        except Exception as e:
+            restart_start_time = time.perf_counter()
+            error_message = str(e)
+            traceback_message = traceback.format_exc()
+            controller.finish_barge_in(is_interrupted=False)
 
-            else:
-                controller.handle_conversation(input_text)
+            now = time.monotonic()
+            warm_restart_times = [
+                restart_time for restart_time in warm_restart_times
+                if now - restart_time < WARM_RESTART_WINDOW_SECONDS]
+            is_resources_healthy = model.are_resources_healthy()
+            is_warm = len(warm_restart_times) < MAX_WARM_RESTARTS and \
+                is_resources_healthy
+            if is_warm:
+                warm_restart_times.append(now)
 
-    except Exception as e:
-        error_message = str(e)
-        traceback_message = traceback.format_exc()
-        controller.restart_system(error_message, traceback_message)
+            restart_controller(controller, error_message, traceback_message,
+                               is_warm, is_resources_healthy)
+            controller = create_controller(model, view)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+import itertools
+import os
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from Models.audio_capture import RATE
+from Models.fair_scheduler import FairScheduler
+from Models.lazy_resource import load_in_background
+from Models.model import CareBotModel
+from Models.resident_session import ResidentSession, SessionClosedError
+from Models.session_model import SessionModel
+from Models.sms_twilio import client as twilio_client
+from Models.telemetry import telemetry
+from Models.voice_recognition import vosk_model
+from Models.voice_synthesis import tts
+from View.view import SessionView
+from Controller.controller import SYSTEM_PHRASES
+from main import create_controller, run_controller, MAX_WARM_RESTARTS, \
+    WARM_RESTART_WINDOW_SECONDS
+
+MESSAGE_SERVER_FULL = "Care-Bot is serving the maximum number of rooms."
+
+# Session used to synthesize the fixed messages at startup
+PREWARM_SESSION_ID = "prewarm"
+
+# The rooms share a single TTS model, which must not synthesize on several
+# threads at once
+MAX_SYNTHESIS_WORKERS = 1
+
+
+def supervise_session(model: SessionModel, view: SessionView) -> None:
+    """
+    Run the conversation loop of a room until it disconnects, restarting the
+    controller after errors like main does for a single room. A room that
+    keeps failing is disconnected.
+
+    Args:
+        model (SessionModel): The model of the room.
+        view (SessionView): The view of the room.
+    """
+    warm_restart_times: List[float] = []
+
+    while True:
+        controller = create_controller(model, view, is_barge_in=False)
+        try:
+            run_controller(controller)
+
+        except SessionClosedError:
+            return
+
+        except Exception as e:
+            if model.get_session().is_closed():
+                return
+
+            now = time.monotonic()
+            warm_restart_times = [
+                restart_time for restart_time in warm_restart_times
+                if now - restart_time < WARM_RESTART_WINDOW_SECONDS]
+            if len(warm_restart_times) >= MAX_WARM_RESTARTS:
+                print(f"Room {model.get_session().get_room()} keeps failing, "
+                      "disconnecting it:", e)
+                return
+            warm_restart_times.append(now)
+
+            try:
+                controller.restart_system(str(e), traceback.format_exc(),
+                                          is_warm=True)
+            except SessionClosedError:
+                return
+            except Exception as error:
+                # Restarting the process would drop every room
+                print(f"Room {model.get_session().get_room()} could not be "
+                      "restarted, disconnecting it:", error)
+                return
+
+
+class SessionHandler(socketserver.BaseRequestHandler):
+    """
+    Runs the session of a room that connected to the server.
+    """
+
+    def handle(self) -> None:
+        self.server.run_session(self.request)
+
+
+class CareBotServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves many rooms from one process, sharing the Vosk model, the TTS
+    model and ChatGPT between them.
+
+    Each room connects to a local Unix socket and streams its microphone
+    audio, as described by ResidentSession. It gets its own controller and
+    recognizer. The audio of every room is decoded on a bounded pool of
+    recognition workers and the speech is synthesized on a pool of
+    synthesis workers, both taking turns between the rooms.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, max_sessions: int,
+                 recognition_workers: int, synthesis_workers: int = 1,
+                 checkpoint_directory: str = "session_checkpoints"):
+        """
+        Parameters:
+        socket_path (str): The path of the Unix socket to listen on. A
+                           socket left over by a previous server is removed.
+        max_sessions (int): The number of rooms served at once. Further
+                            rooms are told the server is full.
+        recognition_workers (int): The number of threads decoding audio.
+        synthesis_workers (int): The number of threads synthesizing speech,
+                                 at most MAX_SYNTHESIS_WORKERS.
+        checkpoint_directory (str): The directory of the conversation
+                                    checkpoints of the rooms.
+        """
+        self.__socket_path = socket_path
+        self.__max_sessions = max_sessions
+        self.__checkpoint_directory = checkpoint_directory
+        self.__lock = threading.Lock()
+        self.__sessions: Dict[str, ResidentSession] = {}
+        self.__session_ids = itertools.count(1)
+        self.__thread: Optional[threading.Thread] = None
+        self.__recognition_scheduler = FairScheduler(
+            recognition_workers, name="recognition")
+        if synthesis_workers > MAX_SYNTHESIS_WORKERS:
+            print(f"Using {MAX_SYNTHESIS_WORKERS} synthesis worker instead "
+                  f"of {synthesis_workers}, since the rooms share one TTS "
+                  "model.")
+            synthesis_workers = MAX_SYNTHESIS_WORKERS
+        self.__synthesis_scheduler = FairScheduler(
+            synthesis_workers, name="synthesis")
+
+        telemetry.gauge("carebot_sessions", "Rooms connected, by state.",
+                        self.get_session_counts, "state")
+
+        os.makedirs(checkpoint_directory, exist_ok=True)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, SessionHandler)
+
+    def get_socket_path(self) -> str:
+        """
+        Returns the path of the Unix socket the rooms connect to.
+
+        Returns:
+            str: The socket path.
+        """
+        return self.__socket_path
+
+    def get_session_count(self) -> int:
+        """
+        Returns the number of rooms connected.
+
+        Returns:
+            int: The number of sessions.
+        """
+        with self.__lock:
+            return len(self.__sessions)
+
+    def get_session_counts(self) -> Dict[str, int]:
+        """
+        Returns the number of rooms connected and the room capacity left.
+
+        Returns:
+            Dict[str, int]: 'connected' and 'available'.
+        """
+        session_count = self.get_session_count()
+        return {"connected": session_count,
+                "available": self.__max_sessions - session_count}
+
+    def get_recognition_scheduler(self) -> FairScheduler:
+        """
+        Returns the scheduler of the recognition workers.
+
+        Returns:
+            FairScheduler: The scheduler.
+        """
+        return self.__recognition_scheduler
+
+    def get_synthesis_scheduler(self) -> FairScheduler:
+        """
+        Returns the scheduler of the synthesis workers.
+
+        Returns:
+            FairScheduler: The scheduler.
+        """
+        return self.__synthesis_scheduler
+
+    def prewarm_system_phrases(self) -> None:
+        """
+        Synthesize the fixed messages on the synthesis workers, so no room
+        waits for them later.
+        """
+        self.__synthesis_scheduler.submit(
+            PREWARM_SESSION_ID, CareBotModel.prewarm_synthesis_cache,
+            SYSTEM_PHRASES)
+
+    def run_session(self, connection: socket.socket) -> None:
+        """
+        Run the session of a room until it disconnects.
+
+        Args:
+            connection (socket.socket): The connection of the room.
+        """
+        with self.__lock:
+            session = ResidentSession(str(next(self.__session_ids)),
+                                      connection, RATE)
+            is_full = len(self.__sessions) >= self.__max_sessions
+            if not is_full:
+                self.__sessions[session.get_session_id()] = session
+
+        if is_full:
+            try:
+                session.send_text(MESSAGE_SERVER_FULL)
+            except SessionClosedError:
+                pass
+            session.close()
+            return
+
+        session_id = session.get_session_id()
+        session.start()
+        print(f"Session {session_id} connected")
+
+        try:
+            model = SessionModel(session, self.__recognition_scheduler,
+                                 self.__synthesis_scheduler,
+                                 self.__checkpoint_directory)
+            supervise_session(model, SessionView(session.send_text))
+        finally:
+            self.__recognition_scheduler.remove_session(session_id)
+            self.__synthesis_scheduler.remove_session(session_id)
+            session.close()
+            with self.__lock:
+                del self.__sessions[session_id]
+            print(f"Session {session_id} of room {session.get_room()} "
+                  "disconnected")
+
+    def start(self) -> None:
+        """
+        Serve rooms on a background thread.
+        """
+        self.__thread = threading.Thread(
+            target=self.serve_forever, args=(0.05,), name="carebot_server",
+            daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop serving, disconnect every room and stop the workers.
+        """
+        if self.__thread is not None:
+            self.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.server_close()
+
+        with self.__lock:
+            sessions = list(self.__sessions.values())
+        for session in sessions:
+            session.close()
+
+        self.__recognition_scheduler.shutdown()
+        self.__synthesis_scheduler.shutdown()
+        if os.path.exists(self.__socket_path):
+            os.remove(self.__socket_path)
+
+
+def main() -> None:
+    """
+    Serve the rooms configured by the environment variables.
+    """
+    # Only the shared models are needed, the server has no microphone or
+    # speakers of its own
+    load_in_background([vosk_model, tts, twilio_client])
+    CareBotModel.start_outbox()
+    CareBotModel.start_telemetry_export()
+
+    server = CareBotServer(
+        os.getenv('SESSION_SOCKET_PATH', 'carebot.sock'),
+        int(os.getenv('MAX_SESSIONS', '32')),
+        int(os.getenv('SESSION_RECOGNITION_WORKERS',
+                      str(os.cpu_count() or 1))),
+        int(os.getenv('SESSION_SYNTHESIS_WORKERS', '1')),
+        os.getenv('SESSION_CHECKPOINT_DIRECTORY', 'session_checkpoints'))
+    server.prewarm_system_phrases()
+    print(f"Care-Bot is serving rooms on {server.get_socket_path()}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
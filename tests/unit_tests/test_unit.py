@@ -1,6 +1,48 @@
+import importlib
+import json
+import os
+import queue
+import re
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
 import pytest
 
-from Models.keyword_recognition import has_keyword
+from Models.barge_in import BargeInDetector, BargeInMonitor, \
+    find_unexplained_keywords
+from Models.outbox import MessageOutbox, TwilioMessagesClient, \
+    STATUS_FAILED, STATUS_PENDING, STATUS_SENT
+from Models.checkpoint import ConversationCheckpoint
+from Models.classifier_cache import ClassifierCache
+from Models.fair_scheduler import FairScheduler
+from Models.history_compactor import HistoryCompactor, \
+    count_message_tokens, SUMMARY_PREFIX
+from Models.incremental_summary import IncrementalSummary
+from Models.lazy_resource import LazyResource, load_in_background
+from Models.llm_backends import LLMBackend, LLMError, OpenAIBackend, \
+    StandInBackend, StandInLLMServer
+from Models.resident_session import ResidentSession, \
+    SessionClosedError, FRAME_AUDIO, FRAME_STOP, FRAME_TEXT, read_frame, \
+    write_frame
+from Models.resilience import CallFailedError, CircuitBreaker, \
+    CircuitOpenError, DeadlineExceededError, ResilientCaller, STATE_CLOSED, \
+    STATE_HALF_OPEN, STATE_OPEN
+from Models.keyword_recognition import has_keyword, KeywordMatcher, \
+    BACKEND_REGEX, BACKEND_TRIE
+from Models.telemetry import Telemetry, TelemetryFileWriter, \
+    TelemetryServer, NULL_METRIC, NULL_SPAN
+from Models.tts_cache import SynthesisCache
+from Models.urgency_triage import UrgencyTriage, TRIAGE_URGENT, \
+    TRIAGE_BENIGN, TRIAGE_UNCERTAIN
+from benchmarks.triage_report import load_urgency_test_phrases
 
 keywords = [
     "Help", "Emergency", "Fall", "Hurt", "Medication", "Doctor", "Nurse",
@@ -140,3 +182,1449 @@ def test_has_keyword_on_sentences_with_no_keywords():
         result = has_keyword(sentence)
         assert not result, f"False positive: Detected keyword in sentence: " \
                            f"'{sentence}'"
+
+
+# The hand written pattern has_keyword used before the keyword vocabulary,
+# which both matcher backends must agree with
+LEGACY_KEYWORD_PATTERN = re.compile(
+    r'\b(?:Help|Emergency|Fall('
+    r'?:en|ing)?|Hurt|Medication|Doctor|Nurse|Sick|Assistance|Aid'
+    r'|Distress|Panic|Suffering|Support|Alarming|Disturbance|Critical'
+    r'|Rescue|Urgent|Quick|Ache|Trouble|Need|Now|Bad|Unwell|Worsen('
+    r'?:ing)?|Stop|Difficult|Terrible|Worse|Abnormal|Unbearable|Concern'
+    r'|Serious|Intense|Dire|Dangerous|Frantic|Dreadful|Panic('
+    r'?:king)?|Fright(?:en(?:ing|ed)?)?|Terrify(?:ing)?|Urgency|Agon('
+    r'?:y|izing)|Mis(?:ery|erable)|Worr(?:y|ied)|Pain('
+    r'?:ful)?|Care\s*Bot|Care|Bot)('
+    r'?:s|es)?\b',
+    re.IGNORECASE)
+
+
+@pytest.mark.parametrize("backend", [BACKEND_REGEX, BACKEND_TRIE])
+def test_keyword_matcher_backends(backend):
+    """
+    Tests that both keyword matcher backends give the same results as the
+    legacy keyword pattern on the keywords, on keyword inflections and on
+    sentences without keywords.
+    """
+    matcher = KeywordMatcher(backend=backend)
+    assert matcher.get_backend() == backend
+
+    texts = keywords + [
+        "I am falling", "She has fallen", "I'm frightened", "Care Bot",
+        "care   bots", "Carebots", "it's agonizing", "I'm worried",
+        "hello", "sad", "goodbye", "helping", "agon", "", " ",
+        "Let's go for a walk in the park.",
+        "I want to buy some groceries for the week."
+    ]
+
+    for text in texts:
+        assert matcher.has_keyword(text) is \
+            bool(LEGACY_KEYWORD_PATTERN.search(text)), \
+            f"Backend {backend} disagrees on: {text}"
+
+    assert matcher.find_keywords("I need help now") == ["need", "help",
+                                                        "now"]
+
+
+def test_urgency_triage_verdicts():
+    """
+    Tests that the urgency triage short circuits clear emergencies, skips
+    clearly benign utterances and leaves everything else to the LLM, and
+    that the avoided LLM calls are counted.
+    """
+    triage = UrgencyTriage()
+
+    assert triage.triage("I fell") == TRIAGE_URGENT
+    assert triage.triage("I can't breathe") == TRIAGE_URGENT
+    assert triage.triage("What's for lunch") == TRIAGE_BENIGN
+    assert triage.triage("I'm feeling anxious") == TRIAGE_UNCERTAIN
+    assert triage.triage("I need help") == TRIAGE_UNCERTAIN
+
+    assert triage.get_avoided_llm_calls() == 3
+    assert triage.get_counters()[TRIAGE_UNCERTAIN] == 2
+
+    assert not triage.is_emergency("I fell asleep watching tv")
+    assert not triage.is_emergency("I fell in love with this song")
+    assert triage.is_emergency("I just fell in the hallway")
+    for text in ["I've fallen", "i've fell", "I just fell", "I have fallen",
+                 "I’ve fallen down"]:
+        assert triage.triage(text) == TRIAGE_URGENT, text
+    assert not triage.is_emergency("I've fallen asleep")
+
+
+def test_urgency_triage_leaves_unrecognized_phrases_to_the_llm():
+    """
+    Tests that only small talk is triaged as benign, so emergencies that
+    the lexicons do not know are still checked by the LLM.
+    """
+    triage = UrgencyTriage()
+
+    for text in ["I have a headache", "I think I broke my arm",
+                 "my stomach is killing me", "I slipped in the shower",
+                 "I threw up", "I cant get up", "someone is in my room",
+                 "call my daughter", "Please call my son now",
+                 "Hi care bot"]:
+        assert triage.triage(text) != TRIAGE_BENIGN, text
+
+    for text in ["Hi ChatGPT", "Good morning", "Thank you",
+                 "It's such a beautiful day outside."]:
+        assert triage.triage(text) == TRIAGE_BENIGN, text
+
+
+def test_urgency_triage_disabled():
+    """
+    Tests that a disabled urgency triage sends every utterance to the LLM.
+    """
+    triage = UrgencyTriage(is_emergency_enabled=False,
+                           is_benign_enabled=False)
+
+    assert triage.triage("I fell") == TRIAGE_UNCERTAIN
+    assert triage.triage("What's for lunch") == TRIAGE_UNCERTAIN
+    assert triage.get_avoided_llm_calls() == 0
+
+
+def test_urgency_triage_recall_on_integration_phrases():
+    """
+    Tests that the urgency triage never dismisses as benign a phrase that the
+    LLM integration tests expect to need urgent assistance, and that none of
+    the non urgent phrases match the emergency lexicon.
+    """
+    urgent_phrases, non_urgent_phrases = load_urgency_test_phrases()
+    assert urgent_phrases and non_urgent_phrases
+
+    report = UrgencyTriage().report_recall(urgent_phrases, non_urgent_phrases)
+
+    assert report["recall"] == 1.0
+    assert report["emergency_false_positives"] == 0.0
+
+
+def test_synthesis_cache_memory_and_disk(tmp_path):
+    """
+    Tests that synthesized audio is keyed by TTS model name and text, that
+    the cache directory is only created once audio is stored, and that the
+    audio is read back from disk by a new cache, e.g. after a restart.
+    """
+    cache_directory = tmp_path / "tts_cache"
+    cache = SynthesisCache(str(cache_directory))
+    assert cache.get("model_a", "Goodbye") is None
+    assert not cache_directory.exists()
+
+    cache.put("model_a", "Goodbye", b"audio_a")
+
+    assert cache.get("model_a", "Goodbye") == b"audio_a"
+    assert cache.get("model_b", "Goodbye") is None
+    assert cache.contains("model_a", "Goodbye")
+
+    restarted_cache = SynthesisCache(str(cache_directory))
+    assert restarted_cache.get("model_a", "Goodbye") == b"audio_a"
+
+
+def test_synthesis_cache_eviction(tmp_path):
+    """
+    Tests that the disk tier evicts the least recently used audio once its
+    size limit is exceeded.
+    """
+    cache = SynthesisCache(str(tmp_path), max_memory_entries=1,
+                           max_disk_bytes=10)
+    cache.put("model", "first", b"12345")
+    cache.put("model", "second", b"12345")
+
+    # Make "first" the most recently used entry on disk
+    os.utime(tmp_path / (SynthesisCache.make_key("model", "second")
+                         + ".wav"), (0, 0))
+    assert cache.get("model", "first") == b"12345"
+
+    cache.put("model", "third", b"12345")
+
+    assert cache.contains("model", "first")
+    assert not cache.contains("model", "second")
+    assert cache.contains("model", "third")
+
+
+class ScriptedRecognizer:
+    """
+    A recognizer returning scripted results, one per accepted chunk. A
+    result is final when its text starts with "final:".
+    """
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.text = ""
+
+    def AcceptWaveform(self, data):
+        self.text = self.results.pop(0)
+        return self.text.startswith("final:")
+
+    def Result(self):
+        return json.dumps({"text": self.text[len("final:"):]})
+
+    def PartialResult(self):
+        return json.dumps({"partial": self.text})
+
+    def FinalResult(self):
+        return json.dumps({"text": self.text})
+
+    def Reset(self):
+        self.text = ""
+
+
+def test_barge_in_ignores_own_speech():
+    """
+    Tests that keywords spoken by Care-Bot are not taken for the Resident,
+    while keywords it did not speak are.
+    """
+    reply = "Let me know if you need help with your medication."
+
+    assert find_unexplained_keywords("if you need help", reply) == []
+    assert find_unexplained_keywords("help help", reply) == ["help"]
+    assert find_unexplained_keywords("i am in pain", reply) == ["pain"]
+
+    detector = BargeInDetector(ScriptedRecognizer(
+        ["if you need", "if you need help", "final:if you need help"]))
+    detector.add_spoken_text(reply)
+
+    assert not any(detector.process(b"") for _ in range(3))
+    assert not detector.is_triggered()
+
+
+def test_barge_in_detection():
+    """
+    Tests that a barge-in triggers after consecutive partial results with a
+    keyword, and that the rest of the utterance is decoded.
+    """
+    detector = BargeInDetector(ScriptedRecognizer(
+        ["i", "i have fallen", "i have fallen down",
+         "final:i have fallen down please"]))
+    detector.add_spoken_text("The weather is lovely today.")
+
+    assert not detector.process(b"")
+    assert not detector.process(b"")
+    assert not detector.is_triggered()
+
+    assert not detector.process(b"")
+    assert detector.is_triggered()
+    assert detector.get_utterance() is None
+
+    assert detector.process(b"")
+    assert detector.get_utterance() == "i have fallen down please"
+
+
+def test_barge_in_monitor_returns_the_interrupting_utterance():
+    """
+    Tests that stopping the monitor after a barge-in waits for the end of
+    the utterance and returns it, and that stopping it without a barge-in
+    does not wait.
+    """
+    chunks = queue.Queue()
+    barged_in = threading.Event()
+    monitor = BargeInMonitor(
+        lambda: ScriptedRecognizer(
+            ["i", "i have fallen", "i have fallen down",
+             "final:i have fallen down please"]),
+        lambda: iter(chunks.get, None))
+
+    monitor.start(barged_in.set)
+    monitor.add_spoken_text("The weather is lovely today.")
+    for _ in range(3):
+        chunks.put(b"")
+    assert barged_in.wait(timeout=1)
+    chunks.put(b"")
+    assert monitor.stop() == "i have fallen down please"
+
+    barged_in.clear()
+    monitor.start(barged_in.set)
+    assert monitor.stop() is None
+    chunks.put(None)
+    assert not barged_in.is_set()
+
+
+class StandInTwilioServer(ThreadingHTTPServer):
+    """
+    A local stand-in of the Twilio Messages endpoint. It answers with the
+    scripted HTTP status codes, then with 201, and records the received
+    messages.
+    """
+
+    def __init__(self, status_codes=()):
+        self.status_codes = list(status_codes)
+        self.messages = []
+        self.paths = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(handler):
+                length = int(handler.headers["Content-Length"])
+                form = urllib.parse.parse_qs(
+                    handler.rfile.read(length).decode())
+                self.paths.append(handler.path)
+
+                status_code = self.status_codes.pop(0) \
+                    if self.status_codes else 201
+                if status_code == 201:
+                    self.messages.append(form["Body"][0])
+                    body = {"sid": f"SM{len(self.messages)}",
+                            "status": "queued"}
+                else:
+                    body = {"message": "error"}
+
+                data = json.dumps(body).encode()
+                handler.send_response(status_code)
+                handler.send_header("Content-Type", "application/json")
+                handler.send_header("Content-Length", str(len(data)))
+                handler.end_headers()
+                handler.wfile.write(data)
+
+            def log_message(handler, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.serve_forever, args=(0.05,),
+                         daemon=True).start()
+
+    def get_base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+@pytest.fixture
+def twilio_server():
+    server = StandInTwilioServer()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_outbox(tmp_path, server, initial_backoff=0.0):
+    return MessageOutbox(
+        str(tmp_path / "outbox.sqlite3"),
+        TwilioMessagesClient("AC123", "token", server.get_base_url()),
+        "+15550000000", "+15551111111", initial_backoff=initial_backoff)
+
+
+def test_outbox_retries_until_sent(tmp_path, twilio_server):
+    """
+    Tests that a message that fails to send with a transient error stays
+    pending, is retried and is sent to the account's messages endpoint.
+    """
+    twilio_server.status_codes = [500, 429]
+    outbox = make_outbox(tmp_path, twilio_server)
+    # The database is only created once the outbox is used
+    assert not (tmp_path / "outbox.sqlite3").exists()
+    message_id = outbox.enqueue("Resident needs help")
+
+    assert outbox.dispatch_pending() == 0
+    assert outbox.get_message(message_id)["status"] == STATUS_PENDING
+    assert outbox.dispatch_pending() == 0
+    assert outbox.dispatch_pending() == 1
+
+    message = outbox.get_message(message_id)
+    assert message["status"] == STATUS_SENT
+    assert message["attempts"] == 3
+    assert message["sid"] == "SM1"
+    assert twilio_server.messages == ["Resident needs help"]
+    assert twilio_server.paths[-1] == \
+        "/2010-04-01/Accounts/AC123/Messages.json"
+
+
+def test_outbox_backoff_and_permanent_failure(tmp_path, twilio_server):
+    """
+    Tests that failed sends are not retried before their backoff has
+    elapsed and that rejected messages are not retried at all.
+    """
+    twilio_server.status_codes = [503, 400]
+    outbox = make_outbox(tmp_path, twilio_server, initial_backoff=60.0)
+    delayed_id = outbox.enqueue("first")
+
+    outbox.dispatch_pending()
+    assert outbox.dispatch_pending() == 0
+    assert outbox.get_message(delayed_id)["attempts"] == 1
+
+    rejected_id = outbox.enqueue("second")
+    outbox.dispatch_pending()
+    assert outbox.get_message(rejected_id)["status"] == STATUS_FAILED
+    assert outbox.get_pending_count() == 1
+
+
+def test_outbox_persists_across_restarts(tmp_path, twilio_server):
+    """
+    Tests that a message enqueued before a restart is sent by the worker of
+    the restarted outbox, without blocking the caller.
+    """
+    make_outbox(tmp_path, twilio_server).enqueue("left pending")
+
+    outbox = make_outbox(tmp_path, twilio_server)
+    assert outbox.get_pending_count() == 1
+
+    outbox.start()
+    try:
+        deadline = time.monotonic() + 5.0
+        while outbox.get_pending_count() and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        outbox.stop()
+
+    assert twilio_server.messages == ["left pending"]
+
+
+class InstantMessagesClient(TwilioMessagesClient):
+    """
+    A messages client that sends every message instantly.
+    """
+
+    def __init__(self):
+        super().__init__("AC123", "token", "http://127.0.0.1:9")
+
+    def send(self, body, from_number, to_number):
+        return "SM1"
+
+
+def test_outbox_calls_on_sent_when_sent_at_once(tmp_path, monkeypatch):
+    """
+    Tests that the on_sent callback of a message is called even when a
+    worker that is already awake sends the message as soon as it is stored.
+    """
+    outbox = MessageOutbox(str(tmp_path / "outbox.sqlite3"),
+                           InstantMessagesClient(), "+15550000000",
+                           "+15551111111")
+    workers = []
+
+    class SendingConnection(sqlite3.Connection):
+        """
+        Sends the due messages on another thread as soon as a message is
+        stored.
+        """
+
+        def execute(self, sql, *args):
+            self.is_insert = sql.startswith("INSERT")
+            return super().execute(sql, *args)
+
+        def __exit__(self, *args):
+            result = super().__exit__(*args)
+            if getattr(self, "is_insert", False):
+                worker = threading.Thread(target=outbox.dispatch_pending)
+                worker.start()
+                worker.join(timeout=0.2)
+                workers.append(worker)
+            return result
+
+    connect = sqlite3.connect
+    monkeypatch.setattr(sqlite3, "connect", lambda *args, **kwargs: connect(
+        *args, factory=SendingConnection, **kwargs))
+    sent = []
+
+    message_id = outbox.enqueue("Resident needs help", lambda: sent.append(1))
+    for worker in workers:
+        worker.join(timeout=5)
+
+    assert outbox.get_message(message_id)["status"] == STATUS_SENT
+    assert sent == [1]
+
+
+def make_history(n_turns):
+    history = []
+    for turn in range(n_turns):
+        history.append({"role": "user", "content": f"question {turn} " * 10})
+        history.append({"role": "assistant",
+                        "content": f"answer {turn} " * 10})
+    return history
+
+
+def test_history_compactor_within_budget():
+    """
+    Tests that a history within the token budget is sent verbatim and that
+    nothing is summarized.
+    """
+    calls = []
+    compactor = HistoryCompactor(lambda summary, messages: calls.append(1),
+                                 token_budget=10000)
+    history = make_history(3)
+
+    assert compactor.compact(history) == history
+    compactor.wait_for_summary()
+    assert calls == []
+
+
+def test_history_compactor_folds_old_messages():
+    """
+    Tests that messages over the token budget are left out without waiting
+    for the summary, then folded into a summary message sent in their place.
+    """
+    folded = []
+
+    def summarize(summary, messages):
+        folded.extend(messages)
+        return summary + f"{len(messages)} messages."
+
+    history = make_history(10)
+    budget = 200
+    compactor = HistoryCompactor(summarize, token_budget=budget)
+
+    messages = compactor.compact(history)
+    assert messages == history[-len(messages):]
+    assert sum(map(count_message_tokens, messages)) <= budget
+
+    compactor.wait_for_summary()
+    assert folded == history[:len(history) - len(messages)]
+
+    messages = compactor.compact(history)
+    assert messages[0] == {"role": "system",
+                           "content": SUMMARY_PREFIX + compactor.get_summary()}
+    assert messages[-1] == history[-1]
+    assert sum(map(count_message_tokens, messages)) <= budget
+
+    # A new conversation starts without a summary
+    history.clear()
+    history.extend(make_history(1))
+    assert compactor.compact(history) == history
+
+
+def test_history_compactor_keeps_summary_without_history():
+    """
+    Tests that compacting an empty history, as built for the classifier
+    prompts, sends nothing and keeps the summary of the conversation.
+    """
+    history = make_history(10)
+    compactor = HistoryCompactor(
+        lambda summary, messages: summary + f"{len(messages)} messages.",
+        token_budget=200)
+    compactor.compact(history)
+    compactor.wait_for_summary()
+    summary = compactor.get_summary()
+    assert summary != ""
+
+    assert compactor.compact([]) == []
+    assert compactor.get_summary() == summary
+    assert compactor.compact(history)[0]["content"] == \
+        SUMMARY_PREFIX + summary
+
+
+def test_incremental_summary_folds_only_new_messages():
+    """
+    Tests that every update only summarizes the messages added since the
+    previous one, and that getting the summary folds the remaining delta.
+    """
+    deltas = []
+
+    def update_summary(summary, messages):
+        deltas.append([message["content"] for message in messages])
+        return summary + "".join(message["content"] for message in messages)
+
+    summary = IncrementalSummary(update_summary)
+    history = [{"role": "user", "content": "a"},
+               {"role": "assistant", "content": "b"}]
+
+    summary.update(history)
+    history.append({"role": "user", "content": "c"})
+    assert summary.get(history) == "abc"
+    assert summary.is_current(history)
+    assert deltas == [["a", "b"], ["c"]]
+
+    summary.reset()
+    assert summary.get([{"role": "user", "content": "d"}]) == "d"
+
+
+def test_incremental_summary_failure_keeps_previous_summary():
+    """
+    Tests that a failed update leaves the summary of the earlier messages.
+    """
+    def update_summary(summary, messages):
+        if messages[-1]["content"] == "fail":
+            raise ConnectionError("offline")
+        return "summary"
+
+    summary = IncrementalSummary(update_summary)
+    history = [{"role": "user", "content": "hello"}]
+    assert summary.get(history) == "summary"
+
+    history.append({"role": "user", "content": "fail"})
+    assert summary.get(history) == "summary"
+    assert not summary.is_current(history)
+
+
+def test_classifier_cache_keys_and_expiry():
+    """
+    Tests that verdicts are shared by inputs differing only by case and
+    punctuation, are keyed by prompt version and model, and expire.
+    """
+    cache = ClassifierCache(ttl_seconds=60.0)
+    cache.put("urgency", "1", "gpt", "Thank you!", False)
+
+    assert cache.get("urgency", "1", "gpt", "thank you") is False
+    assert cache.get("urgency", "2", "gpt", "thank you") is None
+    assert cache.get("urgency", "1", "other", "thank you") is None
+    assert cache.get("end", "1", "gpt", "thank you") is None
+
+    expired_cache = ClassifierCache(ttl_seconds=0.0)
+    expired_cache.put("urgency", "1", "gpt", "thank you", False)
+    assert expired_cache.get("urgency", "1", "gpt", "thank you") is None
+
+    stats = cache.get_stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 3
+    assert stats["hit_rate"] == 0.25
+
+
+def test_classifier_cache_keeps_true_verdicts(tmp_path):
+    """
+    Tests that False verdicts are evicted before True ones, that a True
+    verdict is never replaced by a False one, and that the disk tier
+    survives restarts.
+    """
+    database_path = str(tmp_path / "classifier_cache.sqlite3")
+    cache = ClassifierCache(database_path, max_entries=2,
+                            max_disk_entries=2)
+    # The database is only created once the cache is used
+    assert not os.path.exists(database_path)
+    cache.put("urgency", "1", "gpt", "i fell", True)
+    cache.put("urgency", "1", "gpt", "hello", False)
+    cache.put("urgency", "1", "gpt", "good morning", False)
+    cache.put("urgency", "1", "gpt", "i fell", False)
+
+    restarted_cache = ClassifierCache(database_path, max_entries=2)
+    assert restarted_cache.get("urgency", "1", "gpt", "i fell") is True
+    assert restarted_cache.get("urgency", "1", "gpt", "good morning") \
+        is False
+    assert restarted_cache.get("urgency", "1", "gpt", "hello") is None
+    assert restarted_cache.get_stats()["disk_hits"] == 2
+
+    memory_cache = ClassifierCache(max_entries=2)
+    memory_cache.put("urgency", "1", "gpt", "i fell", True)
+    memory_cache.put("urgency", "1", "gpt", "hello", False)
+    memory_cache.put("urgency", "1", "gpt", "good morning", False)
+    assert memory_cache.get("urgency", "1", "gpt", "i fell") is True
+    assert memory_cache.get("urgency", "1", "gpt", "hello") is None
+
+
+def test_stand_in_llm_backend_canned_responses():
+    """
+    Tests that the stand-in backend answers the first matching canned
+    response, the default response otherwise, and streams it word by word.
+    """
+    backend = StandInBackend([(r"weather", "It is sunny.")],
+                             default_response="Hello there.")
+
+    assert backend.complete([{"role": "user",
+                              "content": "How is the Weather?"}]) \
+        == "It is sunny."
+    assert list(backend.stream([{"role": "user", "content": "hi"}])) \
+        == ["Hello", " there."]
+    assert backend.get_request_count() == 2
+
+    classifier = StandInBackend()
+    prompt = ("Output 'true' if the Input_Text suggests an urgent needs "
+              "for assistance. Input Text: ####{}####.")
+    assert classifier.complete([{"role": "user", "content": prompt.format(
+        "I have fallen")}]) == "true"
+    assert classifier.complete([{"role": "user", "content": prompt.format(
+        "nice weather")}]) == "false"
+
+
+def test_llm_backend_requires_the_whole_interface():
+    """
+    Tests that a backend missing a method of the interface cannot be
+    created.
+    """
+    class CompletingBackend(LLMBackend):
+        def get_model_name(self):
+            return "completing"
+
+        def complete(self, messages, max_tokens=1000, temperature=0.0):
+            return ""
+
+    with pytest.raises(TypeError):
+        LLMBackend()
+    with pytest.raises(TypeError):
+        CompletingBackend()
+
+
+def test_openai_backend_reuses_connections():
+    """
+    Tests that completions and streamed completions sent through the stand-in
+    server reuse a single keep-alive connection.
+    """
+    server = StandInLLMServer(StandInBackend(default_response="Hi. Bye."))
+    server.start()
+    try:
+        backend = OpenAIBackend("key", "model", server.get_base_url())
+        messages = [{"role": "user", "content": "hello"}]
+
+        assert backend.complete(messages) == "Hi. Bye."
+        assert "".join(backend.stream(messages)) == "Hi. Bye."
+        assert backend.complete(messages) == "Hi. Bye."
+        assert server.get_connection_count() == 1
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def chatgpt_prompts(monkeypatch):
+    """
+    Imports the prompts with a resident and the stand-in LLM backend, so
+    they run without network access.
+    """
+    for name, value in {"RESIDENT_FIRST_NAME": "Ada",
+                        "RESIDENT_LAST_NAME": "Lovelace",
+                        "RESIDENT_AGE_YEARS": "80",
+                        "RESIDENT_SEX": "female",
+                        "CAREGIVERS_DESCRIPTION": "A nurse",
+                        "LLM_BACKEND": "stand-in",
+                        "CLASSIFIER_CACHE_PATH": ""}.items():
+        monkeypatch.setenv(name, value)
+    return importlib.import_module("Models.chatgpt_prompts")
+
+
+def test_urgency_check_falls_back_to_local_verdict(chatgpt_prompts,
+                                                   monkeypatch):
+    """
+    Tests that when the LLM can not be reached, anything but small talk is
+    considered urgent.
+    """
+    def fail(*args):
+        raise DeadlineExceededError("no verdict in time")
+
+    monkeypatch.setattr(chatgpt_prompts.classifier_caller, "call", fail)
+    monkeypatch.setattr(chatgpt_prompts, "is_classifier_cache_enabled",
+                        False)
+
+    for text in ["I broke my arm", "I slipped in the shower",
+                 "I have a headache", "I fell"]:
+        assert chatgpt_prompts.is_urgent_assistance_needed(text), text
+    assert not chatgpt_prompts.is_urgent_assistance_needed("Good morning")
+
+
+def test_split_complete_sentences(chatgpt_prompts):
+    """
+    Tests that only sentences followed by whitespace or a line break are
+    complete, and that the rest is kept for the next tokens.
+    """
+    split = chatgpt_prompts.split_complete_sentences
+
+    assert split("Hello there. How are") == (["Hello there."], "How are")
+    assert split("Really? Yes! Fine") == (["Really?", "Yes!"], "Fine")
+    assert split("It costs 3.50 dollars") == ([], "It costs 3.50 dollars")
+    assert split("First line\nSecond") == (["First line"], "Second")
+    assert split("Done.") == ([], "Done.")
+
+
+def test_stream_saves_partial_reply_when_it_fails(chatgpt_prompts,
+                                                  monkeypatch):
+    """
+    Tests that a streamed reply failing after its first sentence still
+    saves the input and the sentence to the conversation history.
+    """
+    class FailingBackend(StandInBackend):
+        def stream(self, messages, max_tokens=1000, temperature=0.0):
+            yield "I am here. "
+            yield "Let me"
+            raise LLMError("connection lost")
+
+    monkeypatch.setattr(chatgpt_prompts, "llm_backend", FailingBackend())
+    history = []
+    stream = chatgpt_prompts.generate_response_stream("Hello", history)
+
+    assert next(stream) == "I am here."
+    with pytest.raises(LLMError):
+        next(stream)
+    assert history == [{"role": "user", "content": "Hello"},
+                       {"role": "assistant", "content": "I am here."}]
+
+
+def test_interrupted_stream_saves_input_and_partial_reply(chatgpt_prompts,
+                                                          monkeypatch):
+    """
+    Tests that closing a streamed reply after its first sentence, as the
+    controller does when the Resident barges in, saves the input and the
+    sentence played to the conversation history.
+    """
+    monkeypatch.setattr(chatgpt_prompts, "llm_backend", StandInBackend(
+        default_response="I am here. The weather is lovely today."))
+    history = []
+    stream = chatgpt_prompts.generate_response_stream("Hello", history)
+
+    assert next(stream) == "I am here."
+    assert history == []
+    stream.close()
+    assert history == [{"role": "user", "content": "Hello"},
+                       {"role": "assistant", "content": "I am here."}]
+
+
+def test_rooms_keep_their_own_history_summaries(chatgpt_prompts):
+    """
+    Tests that the messages built for two rooms served in turn each carry
+    the summary of their own conversation.
+    """
+    def summarize(summary, messages):
+        return " ".join(sorted({message["content"].split()[0]
+                                for message in messages}))
+
+    rooms = {}
+    for name in ["alpha", "bravo"]:
+        history = [{"role": message["role"],
+                    "content": f"{name} {message['content']}"}
+                   for message in make_history(10)]
+        rooms[name] = (history,
+                       HistoryCompactor(summarize, token_budget=200))
+
+    for name, (history, compactor) in rooms.items():
+        chatgpt_prompts.build_messages("Hello", history, compactor)
+        compactor.wait_for_summary()
+
+    for name, (history, compactor) in rooms.items():
+        messages = chatgpt_prompts.build_messages("Hello", history, compactor)
+        assert messages[1] == {"role": "system",
+                               "content": SUMMARY_PREFIX + name}
+        assert messages[-2] == history[-1]
+
+
+def test_parse_turn_result(chatgpt_prompts):
+    """
+    Tests that the combined turn JSON is parsed even when fenced or
+    surrounded by text, and that invalid answers are rejected.
+    """
+    parse = chatgpt_prompts.parse_turn_result
+    expected = {"reply": "Hello!", "urgent": False, "end_conversation": True}
+
+    assert parse('{"reply": "Hello!", "urgent": false, '
+                 '"end_conversation": true}') == expected
+    assert parse('```json\n{"reply": "Hello!", "urgent": false, '
+                 '"end_conversation": true}\n```') == expected
+    assert parse('{"reply": "Hello!", "urgent": false}') is None
+    assert parse('{"reply": "Hello!", "urgent": "no", '
+                 '"end_conversation": true}') is None
+    assert parse("Hello! How are you?") is None
+    assert parse('{"reply": "Hello!", urgent}') is None
+
+
+def test_turn_falls_back_to_classifiers(chatgpt_prompts, monkeypatch):
+    """
+    Tests that an answer that is not JSON is used as the reply while the
+    flags come from the classifiers.
+    """
+    monkeypatch.setattr(chatgpt_prompts, "llm_backend", StandInBackend(
+        default_response="I am sorry to hear that."))
+    monkeypatch.setattr(chatgpt_prompts, "is_classifier_cache_enabled",
+                        False)
+
+    turn_result = chatgpt_prompts.generate_turn("Help, I fell", [])
+
+    assert turn_result == {"reply": "I am sorry to hear that.",
+                           "urgent": True, "end_conversation": False}
+
+
+def test_resilient_caller_hedges_and_meets_deadline():
+    """
+    Tests that a slow attempt is hedged by a second one whose result is
+    used, and that calls slower than the deadline fail once they reach it.
+    """
+    executor = ThreadPoolExecutor(max_workers=4)
+    delays = [1.0, 0.0]
+
+    def complete():
+        time.sleep(delays.pop(0))
+        return "reply"
+
+    caller = ResilientCaller(executor, CircuitBreaker(), 0.5,
+                             initial_hedge_delay=0.05)
+    start_time = time.monotonic()
+    assert caller.call(complete) == "reply"
+    assert time.monotonic() - start_time < 0.5
+
+    slow_caller = ResilientCaller(executor, CircuitBreaker(), 0.1)
+    start_time = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        slow_caller.call(time.sleep, 1.0)
+    assert time.monotonic() - start_time < 0.5
+    executor.shutdown(wait=False)
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """
+    Tests that the circuit opens after consecutive failures, refuses calls
+    while open, and closes once a trial call succeeds.
+    """
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    caller = ResilientCaller(ThreadPoolExecutor(max_workers=2), breaker, 1.0)
+
+    def fail():
+        raise ValueError("unavailable")
+
+    for _ in range(2):
+        with pytest.raises(CallFailedError):
+            caller.call(fail)
+    assert breaker.get_state() == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        caller.call(lambda: "reply")
+
+    time.sleep(0.05)
+    assert breaker.allow_request()
+    assert breaker.get_state() == STATE_HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.get_state() == STATE_CLOSED
+    assert caller.call(lambda: "reply") == "reply"
+
+
+def test_lazy_resource_loads_once():
+    """
+    Tests that a resource needed by several threads at once is loaded and
+    warmed up once, that a failed load is retried, and that resources load
+    in parallel in the background.
+    """
+    loads = []
+    warm_ups = []
+
+    def load():
+        loads.append(1)
+        time.sleep(0.05)
+        if len(loads) == 1:
+            raise RuntimeError("model file is busy")
+        return "model"
+
+    resource = LazyResource("model", load, warm_ups.append)
+    with pytest.raises(RuntimeError):
+        resource.get()
+    assert not resource.is_loaded()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(lambda _: resource.get(), range(4))) \
+            == ["model"] * 4
+    assert len(loads) == 2 and warm_ups == ["model"]
+    assert resource.get_load_seconds() >= 0.05
+
+    slow_resources = [LazyResource(name, lambda: time.sleep(0.1))
+                      for name in ["asr", "tts", "mixer"]]
+    start_time = time.monotonic()
+    futures = load_in_background(slow_resources)
+    for future in futures.values():
+        future.result()
+    assert time.monotonic() - start_time < 0.25
+    assert all(resource.is_loaded() for resource in slow_resources)
+
+
+def test_conversation_checkpoint_resume(tmp_path):
+    """
+    Tests that a saved conversation is loaded back, and that a stale,
+    corrupt or missing checkpoint resumes nothing.
+    """
+    path = str(tmp_path / "checkpoint.json")
+    history = [{"role": "user", "content": "I feel dizzy"},
+               {"role": "assistant", "content": "I will call the nurse."}]
+    checkpoint = ConversationCheckpoint(path)
+    assert checkpoint.load() == []
+
+    checkpoint.save(history)
+    assert ConversationCheckpoint(path).load() == history
+    assert ConversationCheckpoint(path, max_age_seconds=-1).load() == []
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("{\"saved_at\": ")
+    assert checkpoint.load() == []
+
+    checkpoint.clear()
+    assert not os.path.exists(path)
+    checkpoint.clear()
+
+
+def test_lazy_resource_health_check():
+    """
+    Tests that only a loaded resource is checked, and that a failing check
+    reports the resource as unhealthy.
+    """
+    states = {"is_working": True}
+
+    def check(resource):
+        if resource == "broken":
+            raise RuntimeError("device lost")
+        return states["is_working"]
+
+    resource = LazyResource("mixer", lambda: "mixer", check=check)
+    states["is_working"] = False
+    assert resource.is_healthy()
+    resource.get()
+    assert not resource.is_healthy()
+    states["is_working"] = True
+    assert resource.is_healthy()
+
+    broken_resource = LazyResource("tts", lambda: "broken", check=check)
+    broken_resource.get()
+    assert not broken_resource.is_healthy()
+
+
+def test_fair_scheduler_takes_turns():
+    """
+    Tests that sessions take turns on the workers, that the tasks of a
+    session run one at a time in order, and that a session with too many
+    waiting tasks blocks its submitter.
+    """
+    scheduler = FairScheduler(1, max_pending_per_session=3)
+    release = threading.Event()
+    order = []
+    scheduler.submit("blocker", release.wait)
+    futures = [scheduler.submit(session_id, order.append,
+                                f"{session_id}{index}")
+               for session_id in ["a", "b"] for index in range(3)]
+
+    submitted = threading.Event()
+    threading.Thread(target=lambda: (scheduler.submit("a", order.append,
+                                                      "a3"),
+                                     submitted.set()), daemon=True).start()
+    assert not submitted.wait(0.05)
+
+    release.set()
+    for future in futures:
+        future.result(timeout=1)
+    assert submitted.wait(1)
+    time.sleep(0.05)
+    assert order == ["a0", "b0", "a1", "b1", "a2", "b2", "a3"]
+    scheduler.shutdown()
+
+    scheduler = FairScheduler(4)
+    running = []
+    overlaps = []
+
+    def task(index):
+        running.append(index)
+        overlaps.append(len(running))
+        time.sleep(0.01)
+        running.remove(index)
+        return index
+
+    futures = [scheduler.submit("a", task, index) for index in range(3)]
+    assert [future.result(timeout=1) for future in futures] == [0, 1, 2]
+    assert max(overlaps) == 1
+    assert scheduler.get_wait_percentile(50) is not None
+    scheduler.shutdown()
+
+
+def test_resident_session_streams_audio():
+    """
+    Tests that a session receives the room name and the audio of a room,
+    paces the audio it sends, tells the room to stop playing, and stops
+    listeners once the room disconnects.
+    """
+    room, server = socket.socketpair()
+    session = ResidentSession("1", server, 16000)
+    session.start()
+    write_frame(room, FRAME_TEXT, json.dumps({"room": "12"}).encode())
+
+    frames = session.frames()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        first_frame = executor.submit(next, frames)
+        time.sleep(0.05)
+        write_frame(room, FRAME_AUDIO, b"\x01\x00" * 10)
+        assert first_frame.result(timeout=1) == b"\x01\x00" * 10
+    assert session.get_room() == "12"
+
+    start_time = time.monotonic()
+    session.play(bytes(3200))
+    assert time.monotonic() - start_time >= 0.09
+    assert read_frame(room) == (FRAME_AUDIO, bytes(3200))
+
+    stop_event = threading.Event()
+    stop_event.set()
+    session.send_audio(bytes(32000))
+    session.wait_for_playback(stop_event)
+    assert read_frame(room) == (FRAME_AUDIO, bytes(32000))
+    assert read_frame(room) == (FRAME_STOP, b"")
+
+    session.send_text("Hello")
+    assert json.loads(read_frame(room)[1]) == {"text": "Hello",
+                                               "is_user": False}
+
+    room.close()
+    with pytest.raises(SessionClosedError):
+        next(frames)
+    session.close()
+
+
+def test_telemetry_renders_prometheus_text():
+    """
+    Tests that counters, histograms, gauges and spans are rendered in the
+    Prometheus text format.
+    """
+    metrics = Telemetry(is_enabled=True)
+    metrics.counter("alerts_total", "Alerts.").inc()
+    metrics.counter("alerts_total", "Alerts.").inc(2, kind="urgent")
+    latency = metrics.histogram("latency_seconds", "Latency.", [0.1, 1.0])
+    latency.observe(0.05, stage="asr")
+    latency.observe(0.5, stage="asr")
+    latency.observe(5.0, stage="asr")
+    metrics.gauge("cache", "Cache.", lambda: {"hits": 3}, "stat")
+
+    @metrics.traced("model.fail")
+    def fail():
+        raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError):
+        fail()
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE alerts_total counter" in lines
+    assert "alerts_total 1" in lines
+    assert 'alerts_total{kind="urgent"} 2' in lines
+    assert 'latency_seconds_bucket{stage="asr",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="asr",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="asr",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{stage="asr"} 5.55' in lines
+    assert 'latency_seconds_count{stage="asr"} 3' in lines
+    assert 'cache{stat="hits"} 3' in lines
+    assert 'carebot_span_errors_total{span="model.fail"} 1' in lines
+    assert 'carebot_span_seconds_count{span="model.fail"} 1' in lines
+
+
+def test_telemetry_disabled_and_export(tmp_path):
+    """
+    Tests that disabled telemetry leaves functions unwrapped and records
+    nothing, and that the metrics are exported over HTTP and to a file.
+    """
+    disabled = Telemetry(is_enabled=False)
+
+    def function():
+        return 1
+
+    assert disabled.traced("model.function")(function) is function
+    assert disabled.span("model.function") is NULL_SPAN
+    assert disabled.counter("alerts_total", "Alerts.") is NULL_METRIC
+    assert disabled.render() == "\n"
+
+    metrics = Telemetry(is_enabled=True)
+    metrics.counter("alerts_total", "Alerts.").inc()
+
+    server = TelemetryServer(metrics)
+    server.start()
+    try:
+        with urllib.request.urlopen(server.get_url(), timeout=5) as response:
+            assert "alerts_total 1" in response.read().decode().splitlines()
+    finally:
+        server.stop()
+
+    path = str(tmp_path / "carebot.prom")
+    writer = TelemetryFileWriter(metrics, path, interval_seconds=60)
+    writer.start()
+    writer.stop()
+    with open(path) as file:
+        assert "alerts_total 1" in file.read().splitlines()
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_render_tone():
+    """
+    Tests that a tone is rendered as a stereo 16 bit sine of the requested
+    duration and frequency.
+    """
+    utilities = pytest.importorskip("Models.utilities")
+
+    tone = utilities.render_tone(441, 100)
+
+    assert tone.shape == (utilities.SAMPLE_RATE // 10, utilities.CHANNELS)
+    assert str(tone.dtype) == "int16"
+    assert (tone[:, 0] == tone[:, 1]).all()
+    assert tone[0, 0] == 0
+    assert tone[:, 0].max() == utilities.MAX_SAMPLE_VALUE
+    # A sine crosses zero upwards once per period
+    samples = tone[:, 0].astype(int)
+    assert ((samples[:-1] < 0) & (samples[1:] >= 0)).sum() in (43, 44)
+
+
+def test_sound_bank_evicts_least_recently_used():
+    """
+    Tests that the sound bank renders each tone once and evicts the least
+    recently used tone when full.
+    """
+    utilities = pytest.importorskip("Models.utilities")
+    rendered = []
+
+    def make_sound(frequency, duration):
+        rendered.append((frequency, duration))
+        return (frequency, duration)
+
+    bank = utilities.SoundBank(max_size=2, make_sound=make_sound)
+
+    assert bank.get_sound(800, 200) == (800, 200)
+    bank.get_sound(660, 150)
+    bank.get_sound(800, 200)
+    bank.get_sound(300, 500)
+    assert len(bank) == 2
+    assert rendered == [(800, 200), (660, 150), (300, 500)]
+
+    bank.get_sound(800, 200)
+    bank.get_sound(660, 150)
+    assert rendered == [(800, 200), (660, 150), (300, 500), (660, 150)]
+
+
+def test_suppress_stdout_overlapping_threads():
+    """
+    Tests that stdout stays suppressed until the last of overlapping blocks
+    on different threads ends, and is then restored.
+    """
+    utilities = pytest.importorskip("Models.utilities")
+    original_stdout = sys.stdout
+    is_entered = threading.Event()
+    is_released = threading.Event()
+
+    def suppress_in_background():
+        with utilities.suppress_stdout():
+            is_entered.set()
+            is_released.wait(5)
+
+    thread = threading.Thread(target=suppress_in_background)
+    thread.start()
+    is_entered.wait(5)
+
+    with utilities.suppress_stdout():
+        assert sys.stdout is not original_stdout
+    # The background block is still running
+    assert sys.stdout is not original_stdout
+    assert not sys.stdout.closed
+
+    is_released.set()
+    thread.join(5)
+    assert sys.stdout is original_stdout
+
+
+class FakeMicrophone:
+    """
+    A stand-in for the microphone that reads the chunks or errors put in its
+    queue, and fails once the capture service stops like a closed device.
+    """
+
+    def __init__(self):
+        self.chunks = queue.Queue()
+        self.service = None
+        self.opened = 0
+        self.closed = 0
+
+    def open(self):
+        self.opened += 1
+        return self, None
+
+    def read(self, size, exception_on_overflow=True):
+        while self.service.is_running():
+            try:
+                chunk = self.chunks.get(timeout=0.01)
+            except queue.Empty:
+                continue
+            if isinstance(chunk, Exception):
+                raise chunk
+            return chunk
+        raise OSError("Stream closed")
+
+    def close(self):
+        self.closed += 1
+
+
+@pytest.fixture
+def capture_service():
+    audio_capture = pytest.importorskip("Models.audio_capture")
+    microphone = FakeMicrophone()
+    service = audio_capture.AudioCaptureService(
+        ring_buffer_chunks=3, reopen_delay=0, open_device=microphone.open)
+    microphone.service = service
+    yield service, microphone
+    service.stop()
+
+
+def test_audio_capture_ring_buffer(capture_service):
+    """
+    Tests that a listener that falls behind skips to the oldest buffered
+    chunk, and that a new listener starts with the requested pre-roll.
+    """
+    service, microphone = capture_service
+
+    lagging = service.frames(pre_roll_chunks=3)
+    microphone.chunks.put(b"0")
+    assert next(lagging) == b"0"
+
+    for chunk in [b"1", b"2", b"3", b"4", b"5"]:
+        microphone.chunks.put(chunk)
+    follower = service.frames(pre_roll_chunks=3)
+    while next(follower) != b"5":
+        pass
+
+    assert next(lagging) == b"3"
+    pre_rolled = service.frames(pre_roll_chunks=2)
+    assert [next(pre_rolled), next(pre_rolled)] == [b"4", b"5"]
+
+    service.stop()
+    with pytest.raises(StopIteration):
+        next(lagging)
+
+
+def test_audio_capture_reopens_after_error(capture_service):
+    """
+    Tests that the microphone is closed and reopened after a read error, and
+    that listeners keep receiving chunks.
+    """
+    service, microphone = capture_service
+
+    frames = service.frames(pre_roll_chunks=1)
+    microphone.chunks.put(OSError("Input overflowed"))
+    microphone.chunks.put(b"after")
+
+    assert next(frames) == b"after"
+    assert (microphone.opened, microphone.closed) == (2, 1)
+
+    service.stop()
+    assert microphone.closed == 2
+
+
+def tone_chunk(amplitude, frequency=200, samples=4096):
+    """
+    Returns a chunk of 16 bit mono samples of a sine at 16 kHz.
+    """
+    time_axis = np.arange(samples) / 16000
+    return (amplitude * np.sin(2 * np.pi * frequency * time_axis)).astype(
+        np.int16).tobytes()
+
+
+def constant_chunk(value, samples=4096):
+    """
+    Returns a chunk of 16 bit mono samples of the same value.
+    """
+    return np.full(samples, value, dtype=np.int16).tobytes()
+
+
+def test_voice_activity_speech_and_silence():
+    """
+    Tests that a voiced tone is speech, and that silence and loud hiss are
+    not.
+    """
+    voice_activity = pytest.importorskip("Models.voice_activity")
+    detector = voice_activity.VoiceActivityDetector()
+    hiss = np.random.default_rng(0).normal(0, 3000, 4096).astype(np.int16)
+
+    assert detector.is_speech(tone_chunk(3000))
+    assert not detector.is_speech(constant_chunk(0))
+    assert not detector.is_speech(hiss.tobytes())
+    assert not detector.is_speech(b"")
+
+
+def test_voice_activity_noise_floor_adapts():
+    """
+    Tests that a steady hum raises the noise floor, so a tone that was
+    speech in a quiet room is not speech over the hum.
+    """
+    voice_activity = pytest.importorskip("Models.voice_activity")
+    detector = voice_activity.VoiceActivityDetector()
+
+    assert detector.is_speech(tone_chunk(700))
+    for _ in range(200):
+        assert not detector.is_speech(tone_chunk(350))
+    assert not detector.is_speech(tone_chunk(700))
+    assert detector.is_speech(tone_chunk(3000))
+
+
+def test_voice_activity_pre_roll_and_hangover():
+    """
+    Tests that the chunks before speech are forwarded with it, that the
+    chunks after it are forwarded during the hangover, and that the
+    forwarded and skipped seconds are counted.
+    """
+    voice_activity = pytest.importorskip("Models.voice_activity")
+    detector = voice_activity.VoiceActivityDetector(pre_roll_chunks=2,
+                                                    hangover_chunks=3)
+    before = [constant_chunk(value) for value in (1, 2, 3)]
+    speech = tone_chunk(3000)
+    after = [constant_chunk(value) for value in (4, 5, 6, 7)]
+
+    assert [detector.process(data) for data in before] == [[], [], []]
+    assert detector.process(speech) == [before[1], before[2], speech]
+    assert [detector.process(data) for data in after] == \
+        [[after[0]], [after[1]], [after[2]], []]
+
+    chunk_seconds = 4096 / 16000
+    stats = detector.get_stats()
+    assert stats["decoded_seconds"] == pytest.approx(6 * chunk_seconds)
+    assert stats["skipped_seconds"] == pytest.approx(chunk_seconds)
+
+    assert list(detector.gate([constant_chunk(0)])) == []
+    assert detector.get_stats()["skipped_seconds"] == \
+        pytest.approx(2 * chunk_seconds)
+
+
+def test_partial_keyword_trigger_debounce_and_refractory():
+    """
+    Tests that the early trigger fires only after consecutive partial
+    hypotheses with a keyword, and not again during the refractory period.
+    """
+    voice_recognition = pytest.importorskip("Models.voice_recognition")
+    trigger = voice_recognition.PartialKeywordTrigger(
+        debounce_results=2, refractory_seconds=0.1)
+
+    assert trigger("help") is True
+    assert trigger("hello") is True
+    assert trigger("help") is True
+    assert trigger("help me") is False
+
+    assert trigger("help me please") is True
+    assert trigger("help me please now") is True
+    time.sleep(0.15)
+    assert trigger("hello") is True
+    assert trigger("help") is True
+    assert trigger("help me") is False
+
+
+def test_early_trigger_keeps_the_rest_of_the_utterance():
+    """
+    Tests that an early trigger returns at once, and that the rest of the
+    utterance is held for the next transcription, which returns it whole.
+    """
+    voice_recognition = pytest.importorskip("Models.voice_recognition")
+    final_texts = []
+    consumed_frames = []
+    results = ["good", "help", "help i", "help i fell",
+               "final:help i fell in the kitchen", "final:unheard"]
+
+    def counted_frames():
+        for index in range(len(results)):
+            consumed_frames.append(index)
+            yield b""
+
+    stream_recognizer = ScriptedRecognizer(results)
+    continuation = voice_recognition.UtteranceContinuation()
+    text = voice_recognition.process_audio_stream(
+        lambda text: final_texts.append(text) or True,
+        voice_recognition.PartialKeywordTrigger(debounce_results=2),
+        frames=counted_frames(),
+        stream_recognizer=stream_recognizer,
+        continuation=continuation)
+
+    # Returned on the chunk that triggered, before the utterance ended
+    assert text == "help i"
+    assert len(consumed_frames) == 3
+    assert final_texts == []
+
+    text = voice_recognition.transcribe_continued(
+        continuation, frames=[b"unused"],
+        stream_recognizer=ScriptedRecognizer([]))
+    assert text == "help i fell in the kitchen"
+    assert continuation.take() is None
+
+    # A held utterance that is not continued is dropped
+    continuation.hold(stream_recognizer, iter([b""]))
+    continuation.discard()
+    assert continuation.take() is None
+    assert stream_recognizer.text == ""
+
+
+def test_failed_warm_restart_announcement_restarts_cold():
+    """
+    Tests that a warm restart whose announcement fails restarts the whole
+    process, without announcing it again, instead of raising.
+    """
+    main = pytest.importorskip("main")
+    restarts = []
+
+    class FailingAnnouncementController:
+        def restart_system(self, error_message, traceback_message,
+                           is_warm, is_resources_healthy):
+            restarts.append((is_warm, is_resources_healthy))
+            if is_warm:
+                raise RuntimeError("audio device lost")
+
+    main.restart_controller(FailingAnnouncementController(), "error",
+                            "traceback", True, True)
+    assert restarts == [(True, True), (False, False)]
+
+    restarts.clear()
+    main.restart_controller(FailingAnnouncementController(), "error",
+                            "traceback", False, True)
+    assert restarts == [(False, True)]